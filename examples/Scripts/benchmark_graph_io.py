@@ -0,0 +1,83 @@
+# Compare loading a `PlanarGraph` from the compressed JSON format
+# (`dump_bytes`) and from the binary format (`dump_binary`).
+#
+# Run as `python benchmark_graph_io.py [size]` which builds a synthetic
+# `size` by `size` grid network (default 500, giving about half a million
+# edges).  Each load is performed in a fresh process, and we report the wall
+# time and the peak resident memory of that process.
+
+# Allow running without installing
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join("..", "..")))
+
+import resource, subprocess, tempfile, time
+import numpy as np
+import open_cp.network as network
+
+def peak_rss():
+    """Peak resident memory of this process, in kilobytes.  On Linux,
+    `ru_maxrss` survives `exec`, and so includes our parent's memory use;
+    `VmHWM` does not."""
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def build_grid(size):
+    rng = np.random.RandomState(1)
+    builder = network.PlanarGraphBuilder()
+    for i in range(size):
+        for j in range(size):
+            x, y = i + rng.random_sample() * 0.3, j + rng.random_sample() * 0.3
+            builder.set_vertex(i * size + j, x, y)
+            if i > 0:
+                builder.add_edge((i - 1) * size + j, i * size + j)
+            if j > 0:
+                builder.add_edge(i * size + j - 1, i * size + j)
+    return builder.build()
+
+def load(kind, filename):
+    start = time.perf_counter()
+    if kind == "bytes":
+        with open(filename, "rb") as file:
+            graph = network.PlanarGraph.from_bytes(file.read())
+    else:
+        graph = network.PlanarGraph.from_binary(filename)
+    # Touch the adjacency structure, which the binary format stores
+    graph.degree(0)
+    took = time.perf_counter() - start
+    print(took, peak_rss())
+
+def measure(kind, filename):
+    baseline = subprocess.run([sys.executable, __file__, "--baseline"],
+        stdout=subprocess.PIPE, check=True)
+    out = subprocess.run([sys.executable, __file__, "--load", kind, filename],
+        stdout=subprocess.PIPE, check=True)
+    took, peak = out.stdout.split()
+    return float(took), (int(peak) - int(baseline.stdout)) / 1024
+
+def main(size):
+    graph = build_grid(size)
+    print("Graph with {} vertices and {} edges".format(len(graph.vertices), graph.number_edges))
+    with tempfile.TemporaryDirectory() as tempdir:
+        bytes_file = os.path.join(tempdir, "graph.bz2")
+        with open(bytes_file, "wb") as file:
+            file.write(graph.dump_bytes())
+        binary_file = os.path.join(tempdir, "graph.bin")
+        graph.dump_binary(binary_file)
+        for kind, filename in [("bytes", bytes_file), ("binary", binary_file)]:
+            took, peak = measure(kind, filename)
+            print("{:>7}: file {:7.1f} MB, load {:6.2f} s, extra peak RSS {:7.1f} MB".format(
+                kind, os.path.getsize(filename) / 1024**2, took, peak))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--load":
+        load(sys.argv[2], sys.argv[3])
+    elif len(sys.argv) > 1 and sys.argv[1] == "--baseline":
+        print(peak_rss())
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,49 @@
+# Compare selecting a daily sweep of time windows from a `TimedPoints`
+# instance by boolean masks (the old way) and by binary search
+# (`TimedPoints.time_windows`).
+#
+# Run as `python benchmark_time_windows.py [size]` which builds `size`
+# synthetic events (default 5 million) spread over five years, and then
+# selects the events in each of 365 consecutive one day windows, in the way
+# a backtest does.
+
+# Allow running without installing
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join("..", "..")))
+
+import time
+import numpy as np
+import open_cp.data as data
+
+def build_points(size):
+    rng = np.random.RandomState(1)
+    minutes = np.sort(rng.randint(0, 5 * 365 * 24 * 60, size=size))
+    times = np.datetime64("2012-01-01T00:00") + minutes.astype("timedelta64[m]")
+    return data.TimedPoints(times, rng.random_sample((2, size)) * 10000)
+
+def by_mask(points, starts, ends):
+    out = []
+    for start, end in zip(starts, ends):
+        mask = (points.timestamps >= start) & (points.timestamps < end)
+        out.append(points[mask])
+    return out
+
+def by_search(points, starts, ends):
+    return points.time_windows(starts, ends)
+
+def main(size):
+    points = build_points(size)
+    starts = np.datetime64("2015-01-01") + np.arange(365).astype("timedelta64[D]")
+    ends = starts + np.timedelta64(1, "D")
+    print("{} events, {} windows".format(points.number_data_points, len(starts)))
+    results = []
+    for name, func in [("mask", by_mask), ("search", by_search)]:
+        start = time.perf_counter()
+        windows = func(points, starts, ends)
+        took = time.perf_counter() - start
+        results.append([w.number_data_points for w in windows])
+        print("{:>7}: {:8.3f} s, {} events selected".format(name, took, sum(results[-1])))
+    assert results[0] == results[1]
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000000)
@@ -2,6 +2,10 @@
 
 import numpy as _np
 import datetime as _datetime
+import json as _json
+import os as _os
+import hashlib as _hashlib
+import shutil as _shutil
 
 class Point():
     """A simple 2 dimensional point class.
@@ -331,6 +335,8 @@ class TimeStamps():
     def _is_time_ordered(timestamps):
         if len(timestamps) == 0:
             return True
+        if isinstance(timestamps, _np.ndarray) and timestamps.dtype.kind == "M":
+            return bool(_np.all(timestamps[1:] >= timestamps[:-1]))
         it = iter(timestamps)
         prev = next(it)
         for time in it  :
@@ -407,6 +413,14 @@ class TimedPoints(TimeStamps):
         if len(self.timestamps) != self.coords.shape[1]:
             raise Exception("Input data should all be of the same length")
 
+    @staticmethod
+    def _from_ordered_arrays(timestamps, coords):
+        """Construct without any checks or copying."""
+        points = TimedPoints.__new__(TimedPoints)
+        points._timestamps = timestamps
+        points.coords = coords
+        return points
+
     @property
     def xcoords(self):
         """A one dimensional array representing the x coordinates of events."""
@@ -418,32 +432,67 @@ class TimedPoints(TimeStamps):
         return self.coords[1]
         
     def __getitem__(self, index):
-        if isinstance(index, int):
+        if isinstance(index, (int, _np.integer)):
             return [self.timestamps[index], *self.coords[:, index]]
+        if isinstance(index, slice) and (index.step is None or index.step > 0):
+            # Still time ordered, and views of our data
+            return TimedPoints._from_ordered_arrays(self.timestamps[index], self.coords[:,index])
         # Assume slice like object
         new_times = self.timestamps[index]
         new_coords = self.coords[:,index]
-        if self._is_time_ordered(new_times):
-            return TimedPoints(new_times, new_coords)
-        data = [(t,x,y) for t, (x,y) in zip(new_times, new_coords.T)]
-        data.sort(key = lambda triple : triple[0])
-        for i, (t,x,y) in enumerate(data):
-            new_times[i] = t
-            new_coords[0,i] = x
-            new_coords[1,i] = y
-        return TimedPoints(new_times, new_coords)
+        if not self._is_time_ordered(new_times):
+            order = _np.argsort(new_times, kind="stable")
+            new_times, new_coords = new_times[order], new_coords[:,order]
+        return TimedPoints._from_ordered_arrays(new_times, new_coords)
+
+    def _window_bounds(self, starts, ends):
+        """Binary search for the index ranges `starts <= timestamp < ends`."""
+        first = _np.zeros(_np.shape(starts), dtype=_np.int64)
+        last = _np.full(_np.shape(ends), len(self.timestamps), dtype=_np.int64)
+        if starts is not None:
+            first = _np.searchsorted(self.timestamps, _np.asarray(starts, dtype="datetime64[ms]"))
+        if ends is not None:
+            last = _np.searchsorted(self.timestamps, _np.asarray(ends, dtype="datetime64[ms]"))
+        return first, _np.maximum(first, last)
+
+    def time_window(self, start=None, end=None):
+        """Select the events with `start <= timestamp < end`, by binary search.
+        The returned instance holds views of our data, so this is fast, and
+        uses little memory, however many events there are.
+
+        :param start: The start time, or `None` to start with the first event.
+        :param end: The end time (exclusive), or `None` to finish with the
+          last event (inclusive).
+        """
+        first, last = self._window_bounds(start, end)
+        return self[int(first) : int(last)]
+
+    def time_windows(self, starts, ends):
+        """As :meth:`time_window` for many windows at once, for example one
+        each day of a backtest.  The binary searches are performed together.
+
+        :param starts: Iterable of start times.
+        :param ends: Iterable of end times (exclusive), of the same length.
+
+        :return: List of instances, each holding views of our data.
+        """
+        starts, ends = list(starts), list(ends)
+        if len(starts) != len(ends):
+            raise ValueError("Need the same number of start and end times")
+        first, last = self._window_bounds(starts, ends)
+        return [self[f : l] for f, l in zip(first.tolist(), last.tolist())]
 
     def events_before(self, cutoff_time=None):
         """Returns a new instance with just the events with timestamps before
-        (or equal to) the cutoff.
+        (or equal to) the cutoff.  Holds views of our data.
 
         :param cutoff_time: End of the time period we're interested in.
           Default is `None` which means return all the data.
         """
         if cutoff_time is None:
             return self
-        mask = self.timestamps <= _np.datetime64(cutoff_time)
-        return TimedPoints(self.timestamps[mask], self.coords[:,mask])
+        last = _np.searchsorted(self.timestamps, _np.datetime64(cutoff_time, "ms"), side="right")
+        return self[:int(last)]
 
     @property
     def empty(self):
@@ -511,6 +560,263 @@ class TimedPoints(TimeStamps):
         return TimedPoints(new_times, self.coords)
 
 
+class EventStore():
+    """A persistent, columnar store of events, held in a directory of
+    `numpy` files which are memory mapped when opened.  Opening is hence very
+    quick, however large the store, and selecting events in a time range
+    only reads the part of each file needed.
+
+    - Events are sorted by time, so the timestamps act as the time index.
+      They are stored as 64-bit integers, milliseconds since the epoch.
+    - Coordinates are stored as a single array of shape `(2,N)` of 64-bit or
+      32-bit floats.
+    - Further columns may be stored.  Numeric columns are stored as they
+      are; any other column is stored as "categorical", as integer codes
+      into a (sorted) list of categories.
+
+    Create a store with :meth:`create` or :meth:`from_arrays`.
+
+    :param path: The directory holding the store.
+    :param mmap_mode: As for :func:`numpy.load`: "r" (the default) to memory
+      map the columns, or `None` to read them into memory.
+    """
+    def __init__(self, path, mmap_mode="r"):
+        self._path = path
+        self._mmap_mode = mmap_mode
+        with open(_os.path.join(path, "meta.json"), "rt") as file:
+            self._meta = _json.load(file)
+        if self._meta.get("version") != EventStore.FORMAT_VERSION:
+            raise ValueError("Unsupported event store version: {}".format(self._meta.get("version")))
+        self._times = self._load("timestamps")
+        self._coords = self._load("coords")
+        self._columns = dict()
+
+    #: Version number written to the store's metadata.
+    FORMAT_VERSION = 1
+
+    def _load(self, name):
+        return _np.load(_os.path.join(self._path, name + ".npy"), mmap_mode=self._mmap_mode)
+
+    @staticmethod
+    def create(path, timed_points, columns=None, coord_dtype=_np.float64):
+        """Write a new store, replacing any existing store at `path`.
+
+        :param path: The directory to write to.  If this exists, it must be
+          an event store or an empty directory.
+        :param timed_points: Instance of :class:`TimedPoints`.
+        :param columns: Optional dictionary from name to array-like of
+          further per-event data, in the same order as `timed_points`.
+        :param coord_dtype: `numpy.float64` (the default) or `numpy.float32`.
+
+        :return: A new instance opened on the store.
+        """
+        return EventStore.from_arrays(path, timed_points.timestamps,
+            timed_points.xcoords, timed_points.ycoords, columns, coord_dtype)
+
+    @staticmethod
+    def from_arrays(path, timestamps, xcoords, ycoords, columns=None,
+            coord_dtype=_np.float64):
+        """Write a new store, replacing any existing store at `path`.  The
+        events do not need to be in time order: they will be (stably) sorted.
+
+        The store is written to a temporary directory, and then renamed, so
+        readers never see a partially written store.  An existing store is
+        first renamed aside, and only deleted once the new store is in place.
+
+        :param path: The directory to write to.  If this exists, it must be
+          an event store or an empty directory, otherwise `ValueError` is
+          raised: we never delete other data.
+        :param timestamps: Array of timestamps (must be convertible to
+          :class:`numpy.datetime64`).
+        :param xcoords: Array of x coordinates.
+        :param ycoords: Array of y coordinates.
+        :param columns: Optional dictionary from name to array-like of
+          further per-event data.
+        :param coord_dtype: `numpy.float64` (the default) or `numpy.float32`.
+
+        :return: A new instance opened on the store.
+        """
+        coord_dtype = _np.dtype(coord_dtype)
+        if coord_dtype not in (_np.float64, _np.float32):
+            raise ValueError("Coordinates must be stored as float64 or float32")
+        EventStore._check_replaceable(path)
+        times = _np.asarray(timestamps, dtype="datetime64[ms]").astype(_np.int64)
+        coords = _np.asarray([xcoords, ycoords], dtype=coord_dtype)
+        if coords.shape != (2, len(times)):
+            raise ValueError("Input data should all be of the same length")
+        order = None
+        if _np.any(times[1:] < times[:-1]):
+            order = _np.argsort(times, kind="stable")
+            times, coords = times[order], coords[:,order]
+
+        meta = {"version" : EventStore.FORMAT_VERSION, "length" : len(times),
+            "columns" : dict()}
+        arrays = {"timestamps" : times, "coords" : coords}
+        for name, values in (columns or dict()).items():
+            if name in arrays or not isinstance(name, str) or _os.sep in name:
+                raise ValueError("Invalid column name: {}".format(name))
+            values = _np.asarray(values)
+            if len(values) != len(times):
+                raise ValueError("Column '{}' should be of length {}".format(name, len(times)))
+            if order is not None:
+                values = values[order]
+            if values.dtype.kind in "biuf":
+                meta["columns"][name] = {"categories" : None}
+                arrays[name] = values
+            else:
+                categories, codes = _np.unique(values.astype(str), return_inverse=True)
+                meta["columns"][name] = {"categories" : categories.tolist()}
+                arrays[name] = codes.astype(_np.int32)
+
+        temp = "{}.{}.tmp".format(path.rstrip(_os.sep), _os.getpid())
+        _os.makedirs(temp)
+        try:
+            for name, array in arrays.items():
+                _np.save(_os.path.join(temp, name + ".npy"), array)
+            with open(_os.path.join(temp, "meta.json"), "wt") as file:
+                _json.dump(meta, file)
+            EventStore._replace(temp, path)
+        finally:
+            if _os.path.exists(temp):
+                _shutil.rmtree(temp)
+        return EventStore(path)
+
+    @staticmethod
+    def _check_replaceable(path):
+        if not _os.path.exists(path):
+            return
+        if not _os.path.isdir(path) or not (len(_os.listdir(path)) == 0 or
+                _os.path.isfile(_os.path.join(path, "meta.json"))):
+            raise ValueError("'{}' exists and is not an event store; refusing "
+                "to overwrite it".format(path))
+
+    @staticmethod
+    def _replace(temp, path):
+        # A non-empty directory cannot be renamed over, so move any existing
+        # store aside first, and restore it if the rename fails.
+        EventStore._check_replaceable(path)
+        old = None
+        if _os.path.exists(path):
+            old = "{}.{}.old".format(path.rstrip(_os.sep), _os.getpid())
+            _os.replace(path, old)
+        try:
+            _os.replace(temp, path)
+        except:
+            if old is not None:
+                _os.replace(old, path)
+            raise
+        if old is not None:
+            _shutil.rmtree(old)
+
+    @property
+    def path(self):
+        """The directory holding the store."""
+        return self._path
+
+    def __len__(self):
+        return self._meta["length"]
+
+    @property
+    def timestamps(self):
+        """Array of all the timestamps, as :class:`numpy.datetime64` objects;
+        a view of the stored data."""
+        return self._times.view("datetime64[ms]")
+
+    @property
+    def coords(self):
+        """Array of shape `(2,N)` of all the coordinates, as stored."""
+        return self._coords
+
+    @property
+    def column_names(self):
+        """List of the names of the extra columns."""
+        return list(self._meta["columns"])
+
+    def categories(self, name):
+        """The list of categories of a categorical column, or `None` for a
+        numeric column."""
+        return self._meta["columns"][name]["categories"]
+
+    def codes(self, name):
+        """The stored array for the column: for a categorical column, the
+        integer codes into :meth:`categories`."""
+        if name not in self._meta["columns"]:
+            raise KeyError(name)
+        if name not in self._columns:
+            self._columns[name] = self._load(name)
+        return self._columns[name]
+
+    def column(self, name, index=None):
+        """The values of a column.
+
+        :param name: The name of the column.
+        :param index: Optionally, a slice or array of indices, as returned by
+          :meth:`select`, to return only those events.
+
+        :return: Array of values; for a categorical column, an array of
+          strings.
+        """
+        codes = self.codes(name)
+        if index is not None:
+            codes = codes[index]
+        categories = self.categories(name)
+        if categories is None:
+            return codes
+        return _np.asarray(categories)[codes]
+
+    def time_window(self, start=None, end=None):
+        """The slice of events with `start <= timestamp < end`, found by
+        binary search.
+
+        :param start: Start time, or `None` for no lower bound.
+        :param end: End time, or `None` for no upper bound.
+        """
+        lo, hi = 0, len(self)
+        if start is not None:
+            lo = int(_np.searchsorted(self.timestamps, _np.datetime64(start, "ms")))
+        if end is not None:
+            hi = max(lo, int(_np.searchsorted(self.timestamps, _np.datetime64(end, "ms"))))
+        return slice(lo, hi)
+
+    def select(self, start=None, end=None, bbox=None, chunk_size=1000000):
+        """Select the events in a time range and, optionally, a bounding box.
+
+        :param start: Start time, or `None` for no lower bound.
+        :param end: End time (exclusive), or `None` for no upper bound.
+        :param bbox: Optional :class:`RectangularRegion`; events on the
+          boundary are included.
+        :param chunk_size: The number of events to examine at once when
+          testing against `bbox`, which bounds memory use.
+
+        :return: A slice if `bbox` is `None`, otherwise an array of indices,
+          in time order.
+        """
+        window = self.time_window(start, end)
+        if bbox is None:
+            return window
+        parts = []
+        for lo in range(window.start, window.stop, chunk_size):
+            hi = min(lo + chunk_size, window.stop)
+            x, y = self._coords[0, lo:hi], self._coords[1, lo:hi]
+            mask = (x >= bbox.xmin) & (x <= bbox.xmax) & (y >= bbox.ymin) & (y <= bbox.ymax)
+            parts.append(_np.nonzero(mask)[0] + lo)
+        if len(parts) == 0:
+            return _np.empty(0, dtype=_np.int64)
+        return _np.concatenate(parts)
+
+    def timed_points(self, start=None, end=None, bbox=None):
+        """Return the selected events (see :meth:`select`) as an instance of
+        :class:`TimedPoints`.  Without `bbox`, and with 64-bit coordinates,
+        the returned object is a view onto the store, and no data is read
+        until it is used.
+        """
+        index = self.select(start, end, bbox)
+        coords = self._coords[:, index]
+        if coords.dtype != _np.float64:
+            coords = coords.astype(_np.float64)
+        return TimedPoints._from_ordered_arrays(self.timestamps[index], coords)
+
+
 try:
     import pyproj as _proj
 except ImportError:
@@ -518,7 +824,72 @@ except ImportError:
     print("Package 'pyproj' not found: projection methods will not be supported.", file=sys.stderr)
     _proj = None
 
-def points_from_lon_lat(points, proj=None, epsg=None):
+_projections = dict()
+
+def get_projection(epsg=None, proj_string=None):
+    """Return a :class:`pyproj.Proj` instance, cached, so that repeated calls
+    with the same settings do not rebuild the (relatively expensive)
+    projection object.
+
+    :param epsg: A valid EPSG projection reference.
+    :param proj_string: If no `epsg` is given, a "proj" string describing the
+      projection.
+    """
+    if epsg is not None:
+        key = "epsg:" + str(epsg)
+    elif proj_string is not None:
+        key = proj_string
+    else:
+        raise ValueError("Need to provide one of 'epsg' or 'proj_string'")
+    if key not in _projections:
+        if epsg is not None:
+            _projections[key] = _proj.Proj({"init": key})
+        else:
+            _projections[key] = _proj.Proj(key)
+    return _projections[key]
+
+def project_lon_lat(lons, lats, proj, chunk_size=1000000, cache_dir=None):
+    """Project arrays of longitude / latitude data, passing whole blocks of
+    `chunk_size` points at a time to the projection.
+
+    :param lons: Array of longitudes.
+    :param lats: Array of latitudes, of the same length.
+    :param proj: A :class:`pyproj.Proj` instance (or any callable with the
+      same interface).
+    :param chunk_size: The maximum number of points to project at once,
+      which bounds memory use.
+    :param cache_dir: Optionally, a directory in which to save the projected
+      coordinates, keyed by the input coordinates and the projection.  Later
+      calls with the same input will load the saved result.  Only used if
+      `proj` has a `srs` attribute describing it.
+
+    :return: Array of shape `(2,N)` of the projected coordinates.
+    """
+    lons = _np.ascontiguousarray(lons, dtype=_np.float64)
+    lats = _np.ascontiguousarray(lats, dtype=_np.float64)
+    if lons.shape != lats.shape or len(lons.shape) != 1:
+        raise ValueError("Need one dimensional arrays of the same length")
+    filename = None
+    if cache_dir is not None and getattr(proj, "srs", None):
+        key = _hashlib.sha1(lons.tobytes() + lats.tobytes() + proj.srs.encode("UTF8"))
+        filename = _os.path.join(cache_dir, "proj_" + key.hexdigest() + ".npy")
+        try:
+            return _np.load(filename)
+        except FileNotFoundError:
+            pass
+    transformed = _np.empty((2, len(lons)))
+    for start in range(0, len(lons), chunk_size):
+        end = start + chunk_size
+        transformed[0, start:end], transformed[1, start:end] = proj(lons[start:end], lats[start:end])
+    if filename is not None:
+        _os.makedirs(cache_dir, exist_ok=True)
+        temp = "{}.{}.tmp".format(filename, _os.getpid())
+        with open(temp, "wb") as file:
+            _np.save(file, transformed)
+        _os.replace(temp, filename)
+    return transformed
+
+def points_from_lon_lat(points, proj=None, epsg=None, cache_dir=None):
     """Converts longitude / latitude data into x,y coordinates using a
     projection.  The module `pyproj` must be loaded, otherwise this does
     nothing.
@@ -529,6 +900,8 @@ def points_from_lon_lat(points, proj=None, epsg=None):
     :param epsg: If no `proj` is given, this must be supplied.  A valid EPSG
       projection reference.  For example, 7405 is suitable for UK data. See
       http://spatialreference.org/ref/epsg/
+    :param cache_dir: Optionally, a directory in which to cache the result;
+      see :func:`project_lon_lat`.
 
     :return: A :class:`TimedPoints` instance of projected data with the same timestamps.
     """
@@ -537,10 +910,6 @@ def points_from_lon_lat(points, proj=None, epsg=None):
     if not proj:
         if not epsg:
             raise Exception("Need to provide one of 'proj' object or 'epsg' code")
-        proj = _proj.Proj({"init": "epsg:"+str(epsg)})
-    
-    transformed = _np.empty(points.coords.shape)
-    for i in range(len(points.timestamps)):
-        transformed[0][i], transformed[1][i] = proj(points.xcoords[i], points.ycoords[i])
-    
-    return TimedPoints(points.timestamps, transformed)
+        proj = get_projection(epsg)
+    transformed = project_lon_lat(points.xcoords, points.ycoords, proj, cache_dir=cache_dir)
+    return TimedPoints._from_ordered_arrays(points.timestamps, transformed)
@@ -10,6 +10,8 @@ import scipy.special as _special
 import collections as _collections
 import datetime as datetime
 import logging as _logging
+import concurrent.futures as _futures
+import copy as _copy
 from . import naive as _naive
 from . import predictors as _predictors
 from . import network as _network
@@ -17,38 +19,33 @@ from . import geometry as _geometry
 from . import data as _data
 from . import kernels as _kernels
 
-def _top_slice_one_dim(risk, fraction):
-    data = risk.compressed().copy()
-    data.sort()
-    N = len(data)
+def _top_slice_order(risk):
+    """The indices into `risk.ravel()` of the valid cells, ordered so that
+    taking the first `n` gives :func:`top_slice`.  That is, by decreasing
+    risk, and with ties ordered by decreasing index.
+
+    :param risk: A masked array.
+    """
+    valid = _np.nonzero(~_np.ma.getmaskarray(risk).ravel())[0]
+    values = _np.ma.getdata(risk).ravel()[valid]
+    return valid[_np.argsort(values, kind="stable")[::-1]]
+
+def _top_slice_size(N, fraction):
     n = int(_np.floor(N * fraction))
-    n = min(max(0, n), N)
-    if n == N:
-        ret = _np.zeros(risk.shape) + 1
-        return (ret * (~risk.mask)).astype(_np.bool)
-    if n == 0:
-        return _np.zeros(risk.shape, dtype=_np.bool)
-    mask = (risk >= data[-n])
-    mask = mask.data & (~risk.mask)
-    have = _np.sum(mask)
-    if have == n:
-        return mask
-    
-    top = _np.ma.min(_np.ma.masked_where(~mask, risk))
-    for i in range(len(risk)):
-        if risk[i] == top:
-            mask[i] = False
-            have -= 1
-            if have == n:
-                return mask
-    raise Exception("Failed to sufficient cells")
+    return min(max(0, n), N)
+
+def _top_slice_one_dim(risk, fraction):
+    order = _top_slice_order(risk)
+    mask = _np.zeros(risk.shape, dtype=bool)
+    mask[order[:_top_slice_size(len(order), fraction)]] = True
+    return mask
 
 def top_slice(risk, fraction):
     """Returns a boolean array of the same shape as `risk` where there are
     exactly `n` True entries.  If `risk` has `N` entries, `n` is the greatest
     integer less than or equal to `N * fraction`.  The returned cells are True
     for the `n` greatest cells in `risk`.  If there are ties, then returns the
-    first (in the natual ordering) cells.
+    last (in the natual ordering) cells.
 
     The input array may be a "masked array" (see `numpy.ma`), in which case
     only the "valid" entries will be used in the computation.  The output is
@@ -110,18 +107,21 @@ def hit_counts(grid_pred, timed_points, percentage_coverage):
     """
     if len(timed_points.xcoords) == 0:
         return {cov : (0,0) for cov in percentage_coverage}
-    risk = grid_pred.intensity_matrix
+    risk = _np.ma.asarray(grid_pred.intensity_matrix)
+    gx, gy = grid_pred.grid_coord(timed_points.xcoords, timed_points.ycoords)
+    gx, gy = gx.astype(_np.int64), gy.astype(_np.int64)
+    mask = (gx < 0) | (gx >= risk.shape[1]) | (gy < 0) | (gy >= risk.shape[0])
+    cells = gy[~mask] * risk.shape[1] + gx[~mask]
+    counts = _np.bincount(cells, minlength=risk.size)
+
+    # Sort once; the `n` cells covered are the first `n` in this order
+    order = _top_slice_order(risk)
+    cumulative = _np.zeros(len(order) + 1, dtype=_np.int64)
+    _np.cumsum(counts[order], out=cumulative[1:])
     out = dict()
     for coverage in percentage_coverage:
-        covered = top_slice(risk, coverage / 100)
-        
-        gx, gy = grid_pred.grid_coord(timed_points.xcoords, timed_points.ycoords)
-        gx, gy = gx.astype(_np.int), gy.astype(_np.int)
-        mask = (gx < 0) | (gx >= covered.shape[1]) | (gy < 0) | (gy >= covered.shape[0])
-        gx, gy = gx[~mask], gy[~mask]
-        count = _np.sum(covered[(gy,gx)])
-
-        out[coverage] = (count, len(timed_points.xcoords))
+        n = _top_slice_size(len(order), coverage / 100)
+        out[coverage] = (int(cumulative[n]), len(timed_points.xcoords))
     return out
 
 def maximum_hit_rate(grid, timed_points, percentage_coverage):
@@ -420,25 +420,32 @@ def multiscale_brier_score(grid_pred, timed_points, size=1):
     :return: `(score, skill)` where `score` is as above, and `skill` is
       :math:`\frac{2\sum_i p_iu_i}{\sum_i u_i^2 + \sum_i p_i^2}`.
     """
-    risk, u = _brier_setup(grid_pred, timed_points)
-    cell_area = grid_pred.xsize * grid_pred.ysize
+    return multiscale_brier_scores(grid_pred, timed_points, [size])[size]
+
+def multiscale_brier_scores(grid_pred, timed_points, sizes=None):
+    """As :func:`multiscale_brier_score` but for many aggregation levels at
+    once.  Summed-area tables of the prediction and of the events are built
+    once, and then each window sum is found in constant time.
+
+    :param grid_pred: An instance of :class:`GridPrediction` to give a
+      prediction.  Should be normalised.
+    :param timed_points: An instance of :class:`TimedPoints`.  All the points
+      should fall inside the non-masked area of the prediction.
+    :param sizes: Iterable of aggregation levels, or `None` to use all sizes
+      from 1 up to the smaller dimension of the grid.
 
-    agg_risk, agg_u, cell_sizes = [], [], []
-    for (s1, c1), (s2, c2) in zip(generate_aggregated_cells(risk, size),
-                         generate_aggregated_cells(u, size)):
-        if c1 > 0:
-            cell_sizes.append(c1)
-            agg_risk.append(s1)
-            agg_u.append(s2)
-
-    agg_risk = _to_array_and_norm(agg_risk)
-    agg_u = _to_array_and_norm(agg_u)
-    cell_sizes = _to_array_and_norm(cell_sizes)
-
-    score = _np.sum( cell_sizes * (agg_risk - agg_u)**2 )
-    score_worst = _np.sum( cell_sizes * (agg_risk**2 + agg_u**2) )
-    skill = 1 - score / score_worst
-    return score / cell_area, skill
+    :return: Dictionary from size to pairs `(score, skill)`.
+    """
+    windows = _MultiscaleWindows(grid_pred, timed_points)
+    cell_area = grid_pred.xsize * grid_pred.ysize
+    out = dict()
+    for size in windows.sizes(sizes):
+        agg_risk, agg_u, cell_sizes = windows.aggregate(size)
+        score = _np.sum( cell_sizes * (agg_risk - agg_u)**2 )
+        score_worst = _np.sum( cell_sizes * (agg_risk**2 + agg_u**2) )
+        skill = 1 - score / score_worst
+        out[size] = (score / cell_area, skill)
+    return out
     
 def _kl_log_func_weighted(x, y, w):
     score = 0
@@ -453,24 +460,101 @@ def _kl_log_func_weighted(x, y, w):
 
 def multiscale_kl_score(grid_pred, timed_points, size=1):
     """As :func:`kl_score` but with aggregation."""
-    risk, u = _brier_setup(grid_pred, timed_points)
-    cell_area = grid_pred.xsize * grid_pred.ysize
+    return multiscale_kl_scores(grid_pred, timed_points, [size])[size]
 
-    agg_risk, agg_u, cell_sizes = [], [], []
-    for (s1, c1), (s2, c2) in zip(generate_aggregated_cells(risk, size),
-                         generate_aggregated_cells(u, size)):
-        if c1 > 0:
-            cell_sizes.append(c1)
-            agg_risk.append(s1)
-            agg_u.append(s2)
+def multiscale_kl_scores(grid_pred, timed_points, sizes=None):
+    """As :func:`multiscale_kl_score` but for many aggregation levels at once,
+    see :func:`multiscale_brier_scores`.
 
-    agg_risk = _to_array_and_norm(agg_risk)
-    agg_u = _to_array_and_norm(agg_u)
-    cell_sizes = _to_array_and_norm(cell_sizes)
+    :return: Dictionary from size to score.
+    """
+    windows = _MultiscaleWindows(grid_pred, timed_points)
+    cell_area = grid_pred.xsize * grid_pred.ysize
+    out = dict()
+    for size in windows.sizes(sizes):
+        agg_risk, agg_u, cell_sizes = windows.aggregate(size)
+        score = ( _kl_log_func_weighted(agg_u, agg_risk, cell_sizes)
+            + _kl_log_func_weighted(1 - agg_u, 1 - agg_risk, cell_sizes) )
+        out[size] = score / cell_area
+    return out
 
-    score = ( _kl_log_func_weighted(agg_u, agg_risk, cell_sizes)
-        + _kl_log_func_weighted(1 - agg_u, 1 - agg_risk, cell_sizes) )
-    return score / cell_area
+def _summed_area_table(matrix):
+    """Array `table` of shape one larger in each dimension than `matrix` with
+    `table[y,x]` the sum of `matrix[:y,:x]`."""
+    matrix = _np.asarray(matrix)
+    table = _np.zeros((matrix.shape[0] + 1, matrix.shape[1] + 1), dtype=matrix.dtype)
+    _np.cumsum(_np.cumsum(matrix, axis=0), axis=1, out=table[1:,1:])
+    return table
+
+def _window_sums(table, size):
+    """The sums over all `size` by `size` windows, from a summed-area table,
+    in the same order as :func:`generate_aggregated_cells`."""
+    return (table[size:,size:] - table[:-size,size:]
+            - table[size:,:-size] + table[:-size,:-size]).ravel()
+
+# Differences of a floating point summed-area table are accurate only to
+# about `eps` times the largest entry, so windows whose sum is below this
+# fraction of that are summed directly.
+_WINDOW_RTOL = 1e-6
+
+def _accurate_window_sums(matrix, table, size, scale=None):
+    """As :func:`_window_sums` for a floating point `matrix` with summed-area
+    table `table`, but recomputing small windows, where the table loses
+    precision, by summing the cells directly.
+
+    :param scale: The largest absolute entry of `table`, if already known.
+    """
+    sums = _window_sums(table, size)
+    if scale is None:
+        scale = _np.max(_np.abs(table))
+    small = _np.nonzero(_np.abs(sums) <= scale * _WINDOW_RTOL)[0]
+    if len(small) == 0:
+        return sums
+    windows = _np.lib.stride_tricks.sliding_window_view(matrix, (size, size))
+    width = windows.shape[1]
+    chunk = max(1, 1000000 // (size * size))
+    for i in range(0, len(small), chunk):
+        index = small[i:i+chunk]
+        sums[index] = windows[index // width, index % width].sum(axis=(1, 2))
+    return sums
+
+class _MultiscaleWindows():
+    """Summed-area tables of a prediction, and of the events, for
+    :func:`multiscale_brier_scores` and :func:`multiscale_kl_scores`."""
+    def __init__(self, grid_pred, timed_points):
+        if len(timed_points.xcoords) == 0:
+            raise ValueError("Need non-empty timed points")
+        gx, gy = _timed_points_to_grid(grid_pred, timed_points)
+        risk = _np.ma.asarray(grid_pred.intensity_matrix)
+        self._shape = risk.shape
+        valid = ~_np.ma.getmaskarray(risk)
+        risk = _np.where(valid, _np.ma.getdata(risk), 0)
+        counts = _np.bincount(gy * risk.shape[1] + gx, minlength=risk.size)
+        self._risk_matrix = risk
+        self._risk = _summed_area_table(risk)
+        self._risk_scale = _np.max(_np.abs(self._risk))
+        self._counts = _summed_area_table(counts.reshape(risk.shape))
+        self._valid = _summed_area_table(valid.astype(_np.int64))
+
+    def sizes(self, sizes):
+        if sizes is None:
+            return list(range(1, min(self._shape) + 1))
+        sizes = list(sizes)
+        for size in sizes:
+            if size < 1 or size > min(self._shape):
+                raise ValueError("Aggregation level {} not valid".format(size))
+        return sizes
+
+    def aggregate(self, size):
+        """Returns normalised arrays `(risk, u, cell_sizes)` for the windows
+        which contain at least one valid cell."""
+        cell_sizes = _window_sums(self._valid, size)
+        m = cell_sizes > 0
+        agg_risk = _accurate_window_sums(self._risk_matrix, self._risk, size,
+            self._risk_scale)[m]
+        agg_u = _window_sums(self._counts, size)[m]
+        return (_to_array_and_norm(agg_risk), _to_array_and_norm(agg_u),
+            _to_array_and_norm(cell_sizes[m]))
 
 def generate_aggregated_cells(matrix, size):
     """Working left to right, top to bottom, aggregate the values of the grid
@@ -484,26 +568,14 @@ def generate_aggregated_cells(matrix, size):
       of the un-masked cells, and `valid_cells` is a count.  If the input
       grid has size `X` by `Y` then returns `(Y+1-size) * (X+1-size)` pairs.
     """
-    risk = matrix
-    have_mask = False
-    try:
-        risk.mask
-        have_mask = True
-    except AttributeError:
-        pass
-    
-    if have_mask:
-        m = risk.mask
-        for y in range(risk.shape[0] + 1 - size):
-            for x in range(risk.shape[1] + 1 - size):
-                s = _np.ma.sum(risk[y:y+size,x:x+size])
-                if s is _np.ma.masked:
-                    s = 0
-                yield s, _np.sum(~m[y:y+size,x:x+size])
+    valid = ~_np.ma.getmaskarray(matrix)
+    values = _np.where(valid, _np.ma.getdata(matrix), 0)
+    if _np.issubdtype(values.dtype, _np.inexact):
+        sums = _accurate_window_sums(values, _summed_area_table(values), size)
     else:
-        for y in range(risk.shape[0] + 1 - size):
-            for x in range(risk.shape[1] + 1 - size):
-                yield _np.sum(risk[y:y+size,x:x+size]), size * size
+        sums = _window_sums(_summed_area_table(values), size)
+    counts = _window_sums(_summed_area_table(valid.astype(_np.int64)), size)
+    yield from zip(sums, counts)
     
 def _bayesian_prep(grid_pred, timed_points, bias, lower_bound):
     if len(timed_points.xcoords) == 0:
@@ -544,10 +616,11 @@ def bayesian_dirichlet_prior(grid_pred, timed_points, bias=10, lower_bound=1e-10
     alpha, counts = _bayesian_prep(grid_pred, timed_points, bias, lower_bound)
     count = _np.sum(counts)
     
-    score = _np.sum(_np.log(_np.arange(bias, bias + count)))
+    # log(a (a+1) ... (a+c-1)) = gammaln(a+c) - gammaln(a)
+    score = _special.gammaln(bias + count) - _special.gammaln(bias)
     m = counts > 0
-    for a, c in zip(alpha[m], counts[m]):
-        score -= _np.sum(_np.log(_np.arange(a, a+c)))
+    a, c = alpha[m], counts[m]
+    score -= _np.sum(_special.gammaln(a + c) - _special.gammaln(a))
     
     score += _np.sum(_special.digamma(alpha[m] + counts[m]) * counts[m])
     score -= count * _special.digamma(bias + count)
@@ -608,6 +681,191 @@ def ranking_score(grid_pred, timed_points):
     ranking = convert_to_precentiles(grid_pred.intensity_matrix)
     return ranking[gy,gx]
 
+def event_histogram(grid, timed_points, start, number_days, length=_np.timedelta64(1, "D")):
+    """Bin events by time period and grid cell, for :func:`batch_scores`.
+    Events before `start`, after the last period, or outside the extent of
+    the grid, are ignored.
+
+    :param grid: Instance of :class:`data.BoundedGrid`
+    :param timed_points: An instance of :class:`TimedPoints`
+    :param start: The start of the first time period.
+    :param number_days: The number of time periods.
+    :param length: The length of each time period, default one day.
+
+    :return: Integer array of shape `(number_days, yextent, xextent)` where
+      entry `[day, gy, gx]` is the number of events in the time period `day`
+      in grid cell `(gx, gy)`.
+    """
+    shape = (number_days, grid.yextent, grid.xextent)
+    days = _np.floor((timed_points.timestamps - _np.datetime64(start)) / length).astype(_np.int64)
+    gx, gy = grid.grid_coord(timed_points.xcoords, timed_points.ycoords)
+    gx, gy = _np.asarray(gx, dtype=_np.int64), _np.asarray(gy, dtype=_np.int64)
+    m = ((days >= 0) & (days < shape[0]) & (gy >= 0) & (gy < shape[1])
+        & (gx >= 0) & (gx < shape[2]))
+    index = (days[m] * shape[1] + gy[m]) * shape[2] + gx[m]
+    return _np.bincount(index, minlength=number_days * shape[1] * shape[2]).reshape(shape)
+
+BATCH_SCORES = ("likelihood", "brier_score", "brier_skill", "kl_score",
+    "poisson_crps_score", "bayesian_dirichlet_prior", "bayesian_predictive",
+    "ranking_score")
+
+def batch_scores(predictions, counts, grid, mask=None, scores=None,
+        chunk_size=None, minimum=1e-9, bias=10, lower_bound=1e-10):
+    """Score a stack of grid predictions, one for each day (or other time
+    period), against the events in each day.  The results agree with calling
+    the single prediction functions (:func:`likelihood`, :func:`brier_score`,
+    :func:`kl_score`, :func:`poisson_crps_score`,
+    :func:`bayesian_dirichlet_prior`, :func:`bayesian_predictive` and the
+    mean of :func:`ranking_score`) for each day, but the masking,
+    normalisation and binning of events is done once for all scores and all
+    days.
+
+    :param predictions: Array of shape `(days, rows, cols)` giving the
+      (normalised) prediction for each day.  May be a masked array, or a
+      :class:`numpy.memmap`.
+    :param counts: Integer array of the same shape, giving the number of
+      events in each day and cell, for example from :func:`event_histogram`.
+    :param grid: Instance of :class:`data.BoundedGrid` giving the cell size.
+    :param mask: Optional boolean array of shape `(rows, cols)`, with `True`
+      meaning that the cell is masked, for every day.  Combined with any
+      mask of `predictions`.
+    :param scores: Iterable of score names to compute, from
+      :attr:`BATCH_SCORES`.  Defaults to all of them.
+    :param chunk_size: If not `None`, the number of days to process at once,
+      to bound the memory used.
+    :param minimum: As for :func:`likelihood`.
+    :param bias: As for :func:`bayesian_dirichlet_prior`.
+    :param lower_bound: As for :func:`bayesian_dirichlet_prior`.
+
+    :return: Dictionary from score name to array of length `days`.  Days
+      with no events are given `nan`, except for "likelihood" which is 0.
+    """
+    scores = BATCH_SCORES if scores is None else tuple(scores)
+    for name in scores:
+        if name not in BATCH_SCORES:
+            raise ValueError("Unknown score: {}".format(name))
+    if predictions.shape != counts.shape or len(predictions.shape) != 3:
+        raise ValueError("Predictions and counts should have the same shape (days, rows, cols)")
+    days = predictions.shape[0]
+    chunk_size = days if chunk_size is None else max(1, int(chunk_size))
+    out = {name : _np.empty(days) for name in scores}
+    for start in range(0, days, chunk_size):
+        chunk = _BatchChunk(predictions[start:start+chunk_size],
+            counts[start:start+chunk_size], mask, grid)
+        for name in scores:
+            if name == "likelihood":
+                out[name][start:start+chunk_size] = chunk.likelihood(minimum)
+            elif name in ("bayesian_dirichlet_prior", "bayesian_predictive"):
+                out[name][start:start+chunk_size] = getattr(chunk, name)(bias, lower_bound)
+            else:
+                out[name][start:start+chunk_size] = getattr(chunk, name)()
+    return out
+
+class _BatchChunk():
+    """The shared work for :func:`batch_scores` on a block of days."""
+    def __init__(self, predictions, counts, mask, grid):
+        self.cell_area = grid.xsize * grid.ysize
+        valid = ~_np.ma.getmaskarray(predictions)
+        if mask is not None:
+            valid = valid & ~_np.asarray(mask, dtype=bool)[None,:,:]
+        self.valid = valid
+        self.risk = _np.where(valid, _np.ma.getdata(predictions), 0).astype(_np.float64)
+        self.counts = _np.asarray(counts, dtype=_np.int64)
+        if _np.any(self.counts[~valid] > 0):
+            raise ValueError("All points need to be inside the non-masked area of the grid.")
+        self.totals = _np.sum(self.counts, axis=(1,2))
+        self.num_cells = _np.sum(valid, axis=(1,2))
+        with _np.errstate(invalid="ignore", divide="ignore"):
+            self.u = self.counts / self.totals[:,None,None]
+        self.empty = self.totals == 0
+
+    def _sum(self, array):
+        return _np.sum(_np.where(self.valid, array, 0), axis=(1,2))
+
+    def _finish(self, scores):
+        scores = _np.asarray(scores, dtype=_np.float64)
+        scores[self.empty] = _np.nan
+        return scores
+
+    def likelihood(self, minimum):
+        p = _np.where(self.risk <= 0, minimum, self.risk)
+        with _np.errstate(invalid="ignore", divide="ignore"):
+            scores = _np.sum(self.counts * _np.log(p), axis=(1,2)) / self.totals
+        scores[self.empty] = 0
+        return scores
+
+    def brier_score(self):
+        with _np.errstate(invalid="ignore", divide="ignore"):
+            score = self._sum((self.u - self.risk)**2) / self.num_cells / self.cell_area
+        return self._finish(score)
+
+    def brier_skill(self):
+        with _np.errstate(invalid="ignore", divide="ignore"):
+            skill = 2 * self._sum(self.u * self.risk) / self._sum(self.u**2 + self.risk**2)
+        return self._finish(skill)
+
+    @staticmethod
+    def _kl_log(x, y):
+        """Vectorised version of :func:`_kl_log_func`, summed over cells."""
+        with _np.errstate(invalid="ignore", divide="ignore"):
+            logx = _np.log(_np.where(x > 0, x, 1))
+            logy = _np.log(_np.where(y > 0, y, 1))
+            terms = _np.where(y <= 0, x * (logx + 20), x * (logx - logy))
+        return _np.sum(_np.where(x > 0, terms, 0), axis=(1,2))
+
+    def kl_score(self):
+        x = _np.where(self.valid, self.u, 0)
+        score = self._kl_log(x, self.risk) + self._kl_log(1 - x, 1 - self.risk)
+        with _np.errstate(invalid="ignore", divide="ignore"):
+            return self._finish(score / (self.num_cells * self.cell_area))
+
+    def poisson_crps_score(self):
+        # As `poisson_crps`, but for all cells at once.  We continue the sum
+        # until every cell has converged, so cells which converge early get a
+        # (negligible) contribution from the tail.
+        mean = self.risk * self.totals[:,None,None]
+        val = _np.exp(-mean)
+        total = _np.zeros_like(mean)
+        score = _np.zeros_like(mean)
+        maxi = max(100, _np.max(self.counts, initial=0))
+        i = 1
+        while i <= maxi or _np.any(total < 1 - 1e-5):
+            total += val
+            score += _np.where(i <= self.counts, total**2, (1 - total)**2)
+            val = val * mean / i
+            i += 1
+        return self._finish(self._sum(score))
+
+    def _alpha(self, bias, lower_bound):
+        alpha = _np.where(self.risk <= 0, lower_bound, self.risk)
+        alpha = _np.where(self.valid, alpha, 0)
+        norm = _np.sum(alpha, axis=(1,2))
+        return _np.where(self.valid, alpha / norm[:,None,None] * bias, 1)
+
+    def bayesian_dirichlet_prior(self, bias, lower_bound):
+        alpha = self._alpha(bias, lower_bound)
+        c = self.counts
+        score = _special.gammaln(bias + self.totals) - _special.gammaln(bias)
+        score -= self._sum(_special.gammaln(alpha + c) - _special.gammaln(alpha))
+        score += self._sum(_special.digamma(alpha + c) * c)
+        score -= self.totals * _special.digamma(bias + self.totals)
+        return self._finish(score)
+
+    def bayesian_predictive(self, bias, lower_bound):
+        alpha = self._alpha(bias, lower_bound)
+        w = (alpha + self.counts) / (bias + self.totals)[:,None,None]
+        return self._finish(self._sum(w * (_np.log(w) + _np.log(bias) - _np.log(alpha))))
+
+    def ranking_score(self):
+        scores = _np.empty(len(self.totals))
+        for day, (valid, risk, counts) in enumerate(zip(self.valid, self.risk, self.counts)):
+            values = _np.sort(risk[valid])
+            # Fraction of valid cells with risk less than or equal to each cell
+            ranking = _np.searchsorted(values, risk[valid], side="right") / len(values)
+            scores[day] = _np.sum(ranking * counts[valid])
+        with _np.errstate(invalid="ignore", divide="ignore"):
+            return self._finish(scores / self.totals)
+
 def _to_kernel_for_kde(pred, tps, grid):
     points = _np.asarray([tps.xcoords, tps.ycoords])
     if tps.number_data_points <= 2:
@@ -663,6 +921,129 @@ def score_kde_fixed_bandwidth(pred, tps, grid, bandwidth):
     kernel.bandwidth = bandwidth
     return _score_from_kernel(kernel, grid, pred)
 
+class KDEScorer():
+    """Reusable version of :func:`score_kde` and
+    :func:`score_kde_fixed_bandwidth`, for scoring many predictions against
+    the same grid.  The sample locations in each valid grid cell are chosen
+    once, and the edge correction factors at those locations are cached for
+    each distinct bandwidth and covariance matrix.
+
+    Only a fixed `bandwidth` is accelerated: the (expensive) edge correction
+    is then computed once, and reused for every prediction.  With the plug-in
+    estimator (`bandwidth=None`) the bandwidth and covariance are estimated
+    from each set of events, so they almost never repeat, and the edge
+    correction is recomputed for every call, at the same cost as
+    :func:`score_kde`.
+
+    :param grid: An instance of :class:`MaskedGrid` to use for edge correction
+      of the KDE.
+    :param bandwidth: If `None` then use a plug-in bandwidth estimator, as
+      :func:`score_kde`.  Otherwise a fixed bandwidth, with the identity
+      covariance matrix, as :func:`score_kde_fixed_bandwidth`.
+    :param samples: The number of random samples to take in each grid cell.
+    :param cache_size: The maximum number of sets of correction factors to
+      keep.
+    """
+    def __init__(self, grid, bandwidth=None, samples=5, cache_size=16):
+        self._grid = grid
+        self._bandwidth = bandwidth
+        self._samples = samples
+        self._cache_size = cache_size
+        self._corrections = _collections.OrderedDict()
+        try:
+            mask = _np.asarray(grid.mask)
+        except AttributeError:
+            mask = _np.zeros((grid.yextent, grid.xextent), dtype=bool)
+        # Same order of random draws as
+        # :meth:`KernelRiskPredictor.to_matrix_from_masked_grid`
+        self._gy, self._gx = _np.nonzero(~mask)
+        cells = _np.stack([self._gx, self._gy], axis=1)[:,None,:]
+        parts = _np.random.random(size=(len(self._gx), samples, 2)) + cells
+        parts = parts * [grid.xsize, grid.ysize] + [grid.xoffset, grid.yoffset]
+        self._locations = parts.reshape(-1, 2).T
+
+    @property
+    def grid(self):
+        """The masked grid used for edge correction."""
+        return self._grid
+
+    @property
+    def bandwidth(self):
+        """The fixed bandwidth, or `None` to use a plug-in estimator."""
+        return self._bandwidth
+
+    @property
+    def samples(self):
+        """The number of samples taken in each grid cell."""
+        return self._samples
+
+    def _correction(self, kernel):
+        key = (float(kernel.bandwidth), tuple(_np.asarray(kernel.covariance_matrix).flatten()))
+        if key in self._corrections:
+            self._corrections.move_to_end(key)
+            return self._corrections[key]
+        factor = kernel.correction_factor(self._locations)
+        self._corrections[key] = factor
+        while len(self._corrections) > self._cache_size:
+            self._corrections.popitem(last=False)
+        return factor
+
+    def kde_prediction(self, pred, tps):
+        """Compute the edge corrected KDE of the events, as a grid prediction.
+
+        :param pred: An instance of :class:`GridPrediction`, used only to check
+          that it agrees with the grid.
+        :param tps: An instance of :class:`TimedPoints`.
+
+        :return: An instance of :class:`GridPredictionArray`, normalised.
+        """
+        kernel = _to_kernel_for_kde(pred, tps, self._grid)
+        if self._bandwidth is not None:
+            kernel.covariance_matrix = [[1,0],[0,1]]
+            kernel.bandwidth = self._bandwidth
+        values = _kernels.GaussianBase.__call__(kernel, self._locations)
+        values = values / self._correction(kernel)
+        matrix = _np.zeros((self._grid.yextent, self._grid.xextent))
+        matrix[self._gy, self._gx] = _np.mean(values.reshape(-1, self._samples), axis=1)
+        kde_pred = _predictors.GridPredictionArray(self._grid.xsize,
+            self._grid.ysize, matrix, self._grid.xoffset, self._grid.yoffset)
+        try:
+            kde_pred.mask_with(self._grid)
+        except:
+            pass
+        return kde_pred.renormalise()
+
+    def score(self, pred, tps):
+        """Compute the squared error between the prediction and the KDE of
+        the events, as :func:`score_kde`.
+
+        :param pred: An instance of :class:`GridPrediction` to give a
+          prediction.  Should be normalised.
+        :param tps: An instance of :class:`TimedPoints`.
+
+        :return: The squared error, adjusted for area of each grid cell.
+        """
+        kde_pred = self.kde_prediction(pred, tps)
+        return (_np.sum((pred.intensity_matrix - kde_pred.intensity_matrix)**2)
+                * self._grid.xsize * self._grid.ysize)
+
+    def score_many(self, predictions, timed_points):
+        """Score a sequence of predictions against a matching sequence of
+        events.  This simply calls :meth:`score` for each pair, and so is
+        only faster than :func:`score_kde` with a fixed bandwidth.
+
+        :param predictions: Iterable of :class:`GridPrediction` instances.
+        :param timed_points: Iterable of :class:`TimedPoints` instances, of
+          the same length.
+
+        :return: Array of scores.
+        """
+        predictions, timed_points = list(predictions), list(timed_points)
+        if len(predictions) != len(timed_points):
+            raise ValueError("Need the same number of predictions and events.")
+        return _np.asarray([self.score(pred, tps)
+            for pred, tps in zip(predictions, timed_points)])
+
 
 
 
@@ -672,7 +1053,8 @@ def score_kde_fixed_bandwidth(pred, tps, grid, bandwidth):
 # Network stuff
 #############################################################################
 
-def grid_risk_coverage_to_graph(grid_pred, graph, percentage_coverage, intersection_cutoff=None):
+def grid_risk_coverage_to_graph(grid_pred, graph, percentage_coverage,
+        intersection_cutoff=None, intersection=None):
     """Find the given coverage for the grid prediction, and then intersect with
     the graph.
     
@@ -683,30 +1065,24 @@ def grid_risk_coverage_to_graph(grid_pred, graph, percentage_coverage, intersect
     :param intersection_cutoff: If `None` then return any edge in the graph
       which intersects a grid cell.  Otherwise a value between 0 and 1
       specifying the minimum intersection amount (based on length).
+    :param intersection: Optionally, an instance of
+      :class:`GridNetworkIntersection` for `graph` and the grid of `grid_pred`,
+      to save recomputing it.
     
     :return: A new graph with only those edges which intersect.
     """
+    if intersection is None:
+        intersection = GridNetworkIntersection(grid_pred, graph)
+    intersection._check_grid(grid_pred)
+    covered = top_slice(grid_pred.intensity_matrix, percentage_coverage / 100)
+    edges = intersection.covered_edges(covered, intersection_cutoff)
     builder = _network.PlanarGraphBuilder()
     builder.vertices.update(graph.vertices)
-    covered = top_slice(grid_pred.intensity_matrix, percentage_coverage / 100)
-    for gy in range(covered.shape[0]):
-        for gx in range(covered.shape[1]):
-            if covered[gy][gx]:
-                _add_intersections(grid_pred.bounding_box_of_cell(gx, gy),
-                                   graph, builder, intersection_cutoff)
+    builder.edges.extend(e for e, m in zip(graph.edges, edges) if m)
     builder.remove_unused_vertices()
     return builder.build()
 
-def _add_intersections(bbox, graph, builder, intersection_cutoff):
-    bbox = (*bbox.min, *bbox.max)
-    for edge in graph.edges:
-        start, end = graph.vertices[edge[0]], graph.vertices[edge[1]]
-        tt = _geometry.intersect_line_box(start, end, bbox)
-        if tt is not None:
-            if intersection_cutoff is None or tt[1] - tt[0] >= intersection_cutoff:
-                builder.edges.append(edge)
-
-def grid_risk_to_graph(grid_pred, graph, strategy="most"):
+def grid_risk_to_graph(grid_pred, graph, strategy="most", intersection=None):
     """Transfer the grid_prediction to a graph risk prediction.  For each grid
     cell, assigns the risk in the cell to each edge of the network which
     intersects that cell.  The parameter `strategy` determines exactly how this
@@ -722,6 +1098,10 @@ def grid_risk_to_graph(grid_pred, graph, strategy="most"):
       prediction.
     :param graph: An instance of :class:`network.PlanarGraph`
     :param strategy: "most" or "subdivide"
+    :param intersection: Optionally, an instance of
+      :class:`GridNetworkIntersection` for `graph` and the grid of `grid_pred`.
+      When transferring many predictions made on the same grid, construct this
+      once and pass it each time.
     
     :return: `(graph, lookup, risks)` where `graph` is a possible new graph,
       and `risks` is an array of risks, correpsonding to the edges in the
@@ -729,47 +1109,169 @@ def grid_risk_to_graph(grid_pred, graph, strategy="most"):
       edge index in the new graph to edge index in the old graph (in general a
       one-to-many mapping).
     """
-    if strategy == "most":
-        return graph, None, _grid_risk_to_graph_most(grid_pred, graph)
-    elif strategy == "subdivide":
-        return _grid_risk_to_graph_subdivide(grid_pred, graph)
-    else:
+    if strategy not in ("most", "subdivide"):
         raise ValueError()
-        
-def _grid_risk_to_graph_subdivide(grid_pred, graph):
-    risks = []
-    lookup = dict()
-    builder = _network.PlanarGraphBuilder()
-    builder.vertices.update(graph.vertices)
-    for edge_index, edge in enumerate(graph.edges):
-        line = (graph.vertices[edge[0]], graph.vertices[edge[1]])
-        segments, intervals = _geometry.full_intersect_line_grid(line, grid_pred)
-        
-        start_key = edge[0]
-        for i in range(len(segments) - 1):
-            key = builder.add_vertex(*segments[i][1])
-            lookup[ len(builder.edges) ] = edge_index
-            builder.add_edge(start_key, key)
-            start_key = key
-            gx, gy, _, _ = intervals[i]
-            risks.append(grid_pred.grid_risk(gx, gy))
-        lookup[ len(builder.edges) ] = edge_index
-        builder.add_edge(start_key, edge[1])
-        gx, gy, _, _ = intervals[-1]
-        risks.append(grid_pred.grid_risk(gx, gy))
-            
-    return builder.build(), lookup, _np.asarray(risks)
-        
-def _grid_risk_to_graph_most(grid_pred, graph):
-    risks = _np.empty(len(graph.edges))
-    for i, edge in enumerate(graph.edges):
-        line = (graph.vertices[edge[0]], graph.vertices[edge[1]])
-        gx, gy = _geometry.intersect_line_grid_most(line, grid_pred)
-        if grid_pred.is_valid(gx, gy):
-            risks[i] = grid_pred.grid_risk(gx, gy)
+    if intersection is None:
+        intersection = GridNetworkIntersection(grid_pred, graph)
+    if strategy == "most":
+        return graph, None, intersection.risks_most(grid_pred)
+    return intersection.subdivide(grid_pred)
+
+class GridNetworkIntersection():
+    """Precomputes how each edge of a network intersects the cells of a grid,
+    so that many grid predictions (with the same grid) can be transferred to
+    the network quickly.  All edges are intersected together, see
+    :func:`geometry.intersect_lines_grid`.
+
+    :param grid: Instance of :class:`data.BoundedGrid` (for example, a
+      :class:`GridPrediction` or :class:`data.MaskedGrid`).
+    :param graph: Instance of :class:`network.PlanarGraph`
+    """
+    def __init__(self, grid, graph):
+        self._grid = (grid.xsize, grid.ysize, grid.xoffset, grid.yoffset,
+            grid.xextent, grid.yextent)
+        self._graph = graph
+        self._quads = _np.asarray(graph.as_quads(), dtype=_np.float64).reshape((-1, 4))
+        (self._edges, self._gx, self._gy, self._t1,
+            self._t2) = _geometry.intersect_lines_grid(self._quads, grid)
+        self._matrix = None
+
+    @property
+    def graph(self):
+        """The graph we intersected with the grid."""
+        return self._graph
+
+    def _check_grid(self, grid):
+        if self._grid != (grid.xsize, grid.ysize, grid.xoffset, grid.yoffset,
+                grid.xextent, grid.yextent):
+            raise ValueError("Grid does not match that used to construct.")
+
+    def _in_extent(self):
+        xextent, yextent = self._grid[4:]
+        return (self._gx >= 0) & (self._gy >= 0) & (self._gx < xextent) & (self._gy < yextent)
+
+    @property
+    def matrix(self):
+        """A :class:`scipy.sparse.csr_matrix` of shape `(number_edges,
+        yextent * xextent)` where entry `(i, gy * xextent + gx)` is the length
+        of edge `i` which lies in the grid cell `(gx, gy)`.  Parts of edges
+        which lie outside the extent of the grid are ignored."""
+        if self._matrix is None:
+            import scipy.sparse as _sparse
+            xextent, yextent = self._grid[4:]
+            lengths = _np.asarray(self._graph.lengths, dtype=_np.float64)
+            m = self._in_extent()
+            edges = self._edges[m]
+            data = (self._t2[m] - self._t1[m]) * lengths[edges]
+            cells = self._gy[m] * xextent + self._gx[m]
+            self._matrix = _sparse.csr_matrix((data, (edges, cells)),
+                shape=(len(lengths), xextent * yextent))
+        return self._matrix
+
+    def _cell_risks(self, grid_pred, gx, gy, use_mask):
+        """The risk in each cell, 0 outside the extent, and (if `use_mask`)
+        0 in masked cells."""
+        self._check_grid(grid_pred)
+        intensity = grid_pred.intensity_matrix
+        if use_mask:
+            intensity = _np.ma.filled(_np.ma.asarray(intensity, dtype=_np.float64), 0)
         else:
-            risks[i] = 0
-    return risks
+            intensity = _np.ma.getdata(intensity)
+        xextent, yextent = self._grid[4:]
+        m = (gx >= 0) & (gy >= 0) & (gx < xextent) & (gy < yextent)
+        risks = _np.zeros(len(gx))
+        risks[m] = intensity[gy[m], gx[m]]
+        return risks
+
+    def most_cells(self, tolerance=1e-9):
+        """For each edge, find the grid cell which contains most of the edge.
+        Ties (up to `tolerance`) are broken by taking the first cell along the
+        edge, as :func:`geometry.intersect_line_grid_most`.
+
+        :return: Pair `(gx, gy)` of arrays.  The cell may be outside the
+          extent of the grid.
+        """
+        lengths = self._t2 - self._t1
+        best = _np.full(len(self._quads), -_np.inf)
+        _np.maximum.at(best, self._edges, lengths)
+        candidates = _np.nonzero(lengths >= best[self._edges] - tolerance)[0]
+        # Pieces are ordered along each edge, so take the first candidate
+        first = candidates[_np.unique(self._edges[candidates], return_index=True)[1]]
+        return self._gx[first], self._gy[first]
+
+    def risks_most(self, grid_pred):
+        """For each network edge, find the cell which most overlaps it, and
+        use that cell's risk.  Cells outside the grid, or masked, give 0.
+
+        :param grid_pred: An instance of :class:`GridPrediction` with the same
+          grid as used to construct.
+
+        :return: Array of risks, one for each edge.
+        """
+        gx, gy = self.most_cells()
+        return self._cell_risks(grid_pred, gx, gy, True)
+
+    def subdivide(self, grid_pred):
+        """Build a new graph by chopping each edge into parts so that every
+        edge in the new graph intersects exactly one grid cell.  New vertices
+        are keyed by integers following on from the largest existing key.
+
+        :param grid_pred: An instance of :class:`GridPrediction` with the same
+          grid as used to construct.
+
+        :return: `(graph, lookup, risks)` as :func:`grid_risk_to_graph`.
+        """
+        risks = self._cell_risks(grid_pred, self._gx, self._gy, False)
+        # A new vertex at the end of each piece, except the last for each edge
+        is_last = _np.ones(len(self._edges), dtype=bool)
+        is_last[:-1] = self._edges[1:] != self._edges[:-1]
+        inner = _np.nonzero(~is_last)[0]
+        t, quads = self._t2[inner], self._quads[self._edges[inner]]
+        xs = quads[:,0] * (1 - t) + quads[:,2] * t
+        ys = quads[:,1] * (1 - t) + quads[:,3] * t
+        vertices = dict(self._graph.vertices)
+        first_key = max(vertices.keys()) + 1 if len(vertices) > 0 else 0
+        new_keys = list(range(first_key, first_key + len(inner)))
+        vertices.update(zip(new_keys, zip(xs.tolist(), ys.tolist())))
+
+        # Piece `i` ends at vertex `ends[i]` and starts where the previous ended
+        ends = _np.full(len(self._edges), -1, dtype=_np.int64)
+        ends[inner] = new_keys
+        is_first = _np.ones(len(self._edges), dtype=bool)
+        is_first[1:] = is_last[:-1]
+        edges, lookup = [], dict()
+        old_edges = self._graph.edges
+        for edge_index, first, last, end in zip(self._edges.tolist(),
+                is_first.tolist(), is_last.tolist(), ends.tolist()):
+            if first:
+                start = old_edges[edge_index][0]
+            if last:
+                end = old_edges[edge_index][1]
+            lookup[len(edges)] = edge_index
+            edges.append((start, end))
+            start = end
+        graph = _network.PlanarGraph([(k, x, y) for k, (x, y) in vertices.items()], edges)
+        return graph, lookup, risks
+
+    def covered_edges(self, covered, intersection_cutoff=None):
+        """Find the edges which intersect any of the given grid cells.
+
+        :param covered: Boolean array of shape `(yextent, xextent)`.
+        :param intersection_cutoff: If `None` then find any edge which
+          intersects a covered grid cell.  Otherwise a value between 0 and 1
+          specifying the minimum intersection amount (based on length) with
+          a single cell.
+
+        :return: Boolean array, one entry for each edge.
+        """
+        covered = _np.ma.filled(_np.ma.asarray(covered), False).astype(bool)
+        m = self._in_extent()
+        m[m] = covered[self._gy[m], self._gx[m]]
+        if intersection_cutoff is not None:
+            m &= (self._t2 - self._t1) >= intersection_cutoff
+        out = _np.zeros(len(self._quads), dtype=bool)
+        out[self._edges[m]] = True
+        return out
 
 def network_coverage(graph, risks, fraction):
     """For the given graph and risks for each edge, find the top fraction
@@ -783,17 +1285,32 @@ def network_coverage(graph, risks, fraction):
     :return: Boolean array of length the same length as the number of edges in
       `graph`, with `True` meaning that the edge should be included.
     """
-    target_length = _np.sum(graph.lengths) * fraction
-    indices = _np.argsort(risks)
-    included = _np.zeros_like(indices, dtype=_np.bool)
-    length = 0.0
-    for index in indices[::-1]:
-        length += graph.length(index)
-        if length > target_length:
-            break
-        included[index] = True
+    order, counts = _network_coverage_counts(graph, risks, [fraction])
+    included = _np.zeros(len(order), dtype=bool)
+    included[order[:counts[0]]] = True
     return included
 
+def _network_coverage_counts(graph, risks, fractions):
+    """Sort the edges by risk, once, and find how many of the most risky edges
+    are covered for each fraction of the total length of the network.
+
+    :return: `(order, counts)` where `order` is the array of edge indices,
+      most risky first, and `counts[i]` is the number of edges, taken in this
+      order, whose total length does not exceed `fractions[i]` of the total.
+    """
+    order = _np.argsort(risks)[::-1]
+    cumulative_lengths = _np.cumsum(_np.asarray(graph.lengths, dtype=_np.float64)[order])
+    targets = _np.sum(graph.lengths) * _np.asarray(fractions, dtype=_np.float64)
+    return order, _np.searchsorted(cumulative_lengths, targets, side="right")
+
+def _network_event_edges(graph, timed_network_points):
+    """Array of the index of the edge in `graph` which each event lies on,
+    or `-1` if the edge is not in `graph`."""
+    csr = graph.csr
+    labels1 = csr.indices_of(timed_network_points.start_keys, missing=-1)
+    labels2 = csr.indices_of(timed_network_points.end_keys, missing=-1)
+    return csr.find_edges(labels1, labels2)[0]
+
 def network_hit_rate(graph, timed_network_points, source_graph=None):
     """Computes the "hit rate" for the given prediction for the passed
     collection of events.  We compute the fraction of events which fall in the
@@ -845,13 +1362,8 @@ def network_hit_counts(graph, timed_network_points, source_graph=None):
             if ((x-xx)**2 + (y-yy)**2) > 1e-10:
                 raise ValueError("Graphs appear to differ")
     
-    edges = set(graph.edges)
-    edges.update((b,a) for a,b in graph.edges)
-    hits = 0
-    for start, end in zip(timed_network_points.start_keys, timed_network_points.end_keys):
-        if (start, end) in edges:
-            hits += 1
-    return hits, len(timed_network_points.distances)
+    hits = _np.sum(_network_event_edges(graph, timed_network_points) >= 0)
+    return int(hits), len(timed_network_points.distances)
 
 def network_hit_rates_from_coverage(graph, risks, timed_network_points, percentage_coverages):
     """Computes the "hit rate" for the given prediction for the passed
@@ -892,17 +1404,23 @@ def network_hit_counts_from_coverage(graph, risks, timed_network_points, percent
     :return: A dictionary from percentage coverage to pairs
       `(captured_count, total_count)`
     """
+    percentage_coverages = list(percentage_coverages)
     if len(timed_network_points.start_keys) == 0:
         return {cov : (0,0) for cov in percentage_coverages}
-    edges = []
-    for st, en in zip(timed_network_points.start_keys, timed_network_points.end_keys):
-        e, _ = graph.find_edge(st, en)
-        edges.append(e)
-    out = dict()
-    for coverage in percentage_coverages:
-        mask = network_coverage(graph, risks, coverage / 100)
-        out[coverage] = sum(mask[e] for e in edges), len(timed_network_points.start_keys)
-    return out
+    edges = _network_event_edges(graph, timed_network_points)
+    if _np.any(edges < 0):
+        index = _np.nonzero(edges < 0)[0][0]
+        raise KeyError((timed_network_points.start_keys[index],
+            timed_network_points.end_keys[index]))
+    order, counts = _network_coverage_counts(graph, risks,
+        [coverage / 100 for coverage in percentage_coverages])
+    # An event is hit when the rank of its edge is less than the count
+    ranks = _np.empty(len(order), dtype=_np.int64)
+    ranks[order] = _np.arange(len(order))
+    event_ranks = _np.sort(ranks[edges])
+    hits = _np.searchsorted(event_ranks, counts, side="left")
+    total = len(timed_network_points.start_keys)
+    return {coverage : (int(h), total) for coverage, h in zip(percentage_coverages, hits)}
 
 
 
@@ -951,7 +1469,7 @@ class StandardPredictionProvider(PredictionProvider):
 
     def predict(self, time, end_time=None):
         time = _np.datetime64(time)
-        points = self.points[self.points.timestamps < time]
+        points = self.points.time_window(end=time)
         if end_time is None:
             pred = self.give_prediction(self.grid, points, time)
         else:
@@ -1279,6 +1797,163 @@ class HitRateResult():
         return self._details
 
 
+class HitRateTable():
+    """Columnar results from :meth:`HitRateEvaluator.run_parallel`.  Each row
+    is one prediction scored against the events in one time range.
+
+    :param starts: Array of the start time of each row.
+    :param prediction_index: Array giving, for providers which return a list
+      of predictions, the index into that list; or -1 if the provider returned
+      a single prediction.
+    :param coverage_levels: The percentage coverage levels, one per column.
+    :param hits: Array of shape `(rows, levels)` of the number of events
+      captured at each coverage level.
+    :param totals: Array of the number of events in each row.
+    :param cell_counts: Array of the number of unmasked cells in each
+      prediction.
+    """
+    def __init__(self, starts, prediction_index, coverage_levels, hits,
+            totals, cell_counts):
+        self._starts = _np.asarray(starts, dtype="datetime64[ms]")
+        self._prediction_index = _np.asarray(prediction_index, dtype=_np.int64)
+        self._coverage_levels = list(coverage_levels)
+        self._hits = _np.asarray(hits, dtype=_np.int64).reshape(
+            len(self._starts), len(self._coverage_levels))
+        self._totals = _np.asarray(totals, dtype=_np.int64)
+        self._cell_counts = _np.asarray(cell_counts, dtype=_np.int64)
+
+    @property
+    def starts(self):
+        """Array of the start time of each row."""
+        return self._starts
+
+    @property
+    def prediction_index(self):
+        """Array of the index of the prediction, or -1 for providers which
+        return a single prediction."""
+        return self._prediction_index
+
+    @property
+    def coverage_levels(self):
+        """List of the percentage coverage levels."""
+        return self._coverage_levels
+
+    @property
+    def hits(self):
+        """Array of shape `(rows, levels)` of captured event counts."""
+        return self._hits
+
+    @property
+    def totals(self):
+        """Array of the total number of events in each row."""
+        return self._totals
+
+    @property
+    def cell_counts(self):
+        """Array of the number of unmasked cells in each prediction."""
+        return self._cell_counts
+
+    @property
+    def rates(self):
+        """Array of shape `(rows, levels)` of fractional hit rates."""
+        return self._hits / self._totals[:,None]
+
+    def __len__(self):
+        return len(self._starts)
+
+    def to_dict(self):
+        """Convert to the same nested format as :attr:`HitRateResult.rates`.
+        """
+        out = dict()
+        for start, index, rates in zip(self._starts.astype(datetime.datetime),
+                self._prediction_index, self.rates):
+            rates = dict(zip(self._coverage_levels, rates.tolist()))
+            if index < 0:
+                out[start] = rates
+            else:
+                out.setdefault(start, []).append(rates)
+        return out
+
+
+class _SharedTimedPoints():
+    """Copies the arrays of a :class:`data.TimedPoints` instance into a block
+    of shared memory, which worker processes can attach to without copying.
+    Call :meth:`close` to release the memory.  Needs Python 3.8 or later.
+    """
+    def __init__(self, points):
+        from multiprocessing import shared_memory as _shared_memory
+        length = points.number_data_points
+        self._memory = _shared_memory.SharedMemory(create=True, size=max(1, 24 * length))
+        times, coords = self._arrays(self._memory, length)
+        times[:] = points.timestamps
+        coords[:] = points.coords
+        self.descriptor = (self._memory.name, length)
+
+    @staticmethod
+    def _arrays(memory, length):
+        times = _np.ndarray(length, dtype="datetime64[ms]", buffer=memory.buf)
+        coords = _np.ndarray((2, length), dtype=_np.float64, buffer=memory.buf,
+            offset=8 * length)
+        return times, coords
+
+    @staticmethod
+    def attach(descriptor):
+        """Attach to the shared memory described by `descriptor`.
+
+        :return: Pair `(memory, points)` where `points` is an instance of
+          :class:`data.TimedPoints` backed by the shared memory.  Keep a
+          reference to `memory` for as long as `points` is in use.
+        """
+        from multiprocessing import shared_memory as _shared_memory
+        name, length = descriptor
+        memory = _shared_memory.SharedMemory(name=name)
+        times, coords = _SharedTimedPoints._arrays(memory, length)
+        return memory, _data.TimedPoints._from_ordered_arrays(times, coords)
+
+    def close(self):
+        self._memory.close()
+        self._memory.unlink()
+
+
+# State for `_hit_rate_tasks`, set once per worker process.
+_hit_rate_state = None
+
+def _hit_rate_init(provider, provider_points, data, coverage_levels):
+    global _hit_rate_state
+    memory, data = _SharedTimedPoints.attach(data)
+    memories = [memory]
+    if provider_points is not None:
+        memory, provider._points = _SharedTimedPoints.attach(provider_points)
+        memories.append(memory)
+    _hit_rate_state = (provider, data, coverage_levels, memories)
+
+def _hit_rate_tasks(args):
+    return [_hit_rate_task(_hit_rate_state, *a) for a in args]
+
+def _hit_rate_task(state, start, end, seed):
+    """Score one time range.  Returns a list of rows
+    `(prediction_index, hits, total, cell_count)`."""
+    provider, data, coverage_levels = state[:3]
+    points = data.time_window(start, end)
+    if points.number_data_points == 0:
+        return []
+    if seed is not None:
+        _np.random.seed(seed)
+    preds = provider.predict(start)
+    try:
+        preds = list(preds)
+        indices = range(len(preds))
+    except TypeError:
+        preds, indices = [preds], [-1]
+    rows = []
+    for index, pred in zip(indices, preds):
+        counts = hit_counts(pred, points, coverage_levels)
+        hits = [counts[level][0] for level in coverage_levels]
+        cell_count = _np.ma.sum(~_np.ma.getmaskarray(pred.intensity_matrix))
+        rows.append((index, hits, points.number_data_points, int(cell_count)))
+    return rows
+
+
 class HitRateEvaluator(_predictors.DataTrainer):
     """Abstracts the task of running a "trainer" and/or "predictor" over a set
     of data, producing a prediction, and then comparing this prediction against
@@ -1292,8 +1967,7 @@ class HitRateEvaluator(_predictors.DataTrainer):
         self._logger = _logging.getLogger(__name__)
         
     def _points(self, start, end):
-        mask = (self.data.timestamps >= start) & (self.data.timestamps < end)
-        return self.data[mask]
+        return self.data.time_window(start, end)
         
     @staticmethod
     def time_range(start, end, length):
@@ -1351,3 +2025,81 @@ class HitRateEvaluator(_predictors.DataTrainer):
                     prediction = preds
                     )
         return HitRateResult(out, details)
+
+    def run_parallel(self, times, coverage_levels, processes=None, seed=None,
+            chunk_size=1):
+        """As :meth:`run` but distributing the time ranges over a pool of
+        worker processes.  The events, and the events held by the provider
+        (if it is a :class:`StandardPredictionProvider`), are placed in shared
+        memory once, rather than being sent to every task.  The predictions
+        themselves are not returned.
+
+        :param times: Iterable of (start, end) times.  A prediction will be
+          made for the time `start` and then evaluated across the range `start`
+          to `end`.
+        :param coverage_levels: Iterable of *percentage* coverage levels to
+          test the hit rate for.
+        :param processes: The number of worker processes, or `None` to use
+          the number of CPUs.  If 1, run in this process.  Worker processes
+          need Python 3.8 or later, for :mod:`multiprocessing.shared_memory`.
+        :param seed: If not `None`, the global :mod:`numpy.random` state is
+          seeded before each prediction with a value derived from `seed` and
+          the index of the time range, so that providers which sample
+          randomly give the same results however the work is distributed.
+          When run in this process, the global state is restored afterwards.
+        :param chunk_size: The number of time ranges to send to a worker at
+          once.
+
+        :return: Instance of :class:`HitRateTable`
+        """
+        coverage_levels = list(coverage_levels)
+        times = list(times)
+        if seed is None:
+            seeds = [None] * len(times)
+        else:
+            seeds = _np.random.SeedSequence(seed).generate_state(len(times)).tolist()
+        args = [(start, end, s) for (start, end), s in zip(times, seeds)]
+        chunks = [args[i:i+chunk_size] for i in range(0, len(args), chunk_size)]
+
+        if processes == 1 or len(chunks) <= 1:
+            state = (self._provider, self.data, coverage_levels)
+            # Seeding is done in this process, so restore the caller's state
+            random_state = _np.random.get_state()
+            try:
+                results = [[_hit_rate_task(state, *a) for a in chunk] for chunk in chunks]
+            finally:
+                if seed is not None:
+                    _np.random.set_state(random_state)
+        else:
+            results = self._run_pool(chunks, coverage_levels, processes)
+
+        starts, indices, hits, totals, cell_counts = [], [], [], [], []
+        for (start, _, _), rows in zip(args, (r for chunk in results for r in chunk)):
+            for index, hit, total, cell_count in rows:
+                starts.append(_np.datetime64(start))
+                indices.append(index)
+                hits.append(hit)
+                totals.append(total)
+                cell_counts.append(cell_count)
+        return HitRateTable(starts, indices, coverage_levels, hits, totals, cell_counts)
+
+    def _run_pool(self, chunks, coverage_levels, processes):
+        shared = [_SharedTimedPoints(self.data)]
+        try:
+            provider, provider_points = self._provider, None
+            if isinstance(provider, StandardPredictionProvider):
+                if provider.points is self.data:
+                    provider_points = shared[0].descriptor
+                else:
+                    shared.append(_SharedTimedPoints(provider.points))
+                    provider_points = shared[-1].descriptor
+                provider = _copy.copy(provider)
+                provider._points = None
+            self._logger.debug("Running %s over %d chunks", self._provider, len(chunks))
+            with _futures.ProcessPoolExecutor(max_workers=processes,
+                    initializer=_hit_rate_init, initargs=(provider,
+                    provider_points, shared[0].descriptor, coverage_levels)) as executor:
+                return list(executor.map(_hit_rate_tasks, chunks))
+        finally:
+            for s in shared:
+                s.close()
@@ -78,25 +78,190 @@ def grid_intersection(geometry, grid):
 
     :return: List of pairs (x,y) of grid cells which intersect.
     """
+    xstart, ystart, mask = _rasterise(geometry, grid, "overlap")
+    gy, gx = _np.nonzero(mask)
+    return list(zip((gx + xstart).tolist(), (gy + ystart).tolist()))
+
+def _grid_bounds(geometry, grid):
+    """The range of grid cells `(xstart, ystart, width, height)` which cover
+    the bounding box of the geometry."""
     minx, miny, maxx, maxy = geometry.bounds
     xstart = int(_np.floor((minx - grid.xoffset) / grid.xsize))
     xend = int(_np.floor((maxx - grid.xoffset) / grid.xsize))
     ystart = int(_np.floor((miny - grid.yoffset) / grid.ysize))
     yend = int(_np.floor((maxy - grid.yoffset) / grid.ysize))
+    return xstart, ystart, xend - xstart + 1, yend - ystart + 1
+
+def _polygon_edges(geometry):
+    """Array of shape `(n,4)` of all the edges `(x1, y1, x2, y2)` of all the
+    rings (exterior and holes) of all the polygons in the geometry."""
+    edges = []
+    def add(geo):
+        if hasattr(geo, "geoms"):
+            for g in geo.geoms:
+                add(g)
+        elif geo.geom_type == "Polygon" and not geo.is_empty:
+            for ring in [geo.exterior, *geo.interiors]:
+                coords = _np.asarray(ring.coords)[:,:2]
+                edges.append(_np.hstack([coords[:-1], coords[1:]]))
+    add(geometry)
+    if len(edges) == 0:
+        return _np.empty((0, 4))
+    edges = _np.concatenate(edges)
+    return edges[_np.any(edges[:,:2] != edges[:,2:], axis=1)]
+
+def _scanline_centres(edges, width, height):
+    """Which cells of the `width` by `height` unit grid, with origin at
+    `(0,0)`, have centres inside the polygon(s) formed by `edges`, using the
+    even-odd rule."""
+    x1, y1, x2, y2 = edges.T
+    # Edge crosses the scanline `y = j + 0.5` if `min(y1,y2) <= j+0.5 < max(y1,y2)`
+    jstart = _np.ceil(_np.minimum(y1, y2) - 0.5)
+    jend = _np.ceil(_np.maximum(y1, y2) - 0.5)
+    jstart, jend = _np.clip(jstart, 0, height), _np.clip(jend, 0, height)
+    counts = (jend - jstart).astype(_np.int64)
+    indices = _np.repeat(_np.arange(len(edges)), counts)
+    rows = jstart[indices].astype(_np.int64) + (_np.arange(len(indices))
+        - _np.repeat(_np.cumsum(counts) - counts, counts))
+    t = (rows + 0.5 - y1[indices]) / (y2 - y1)[indices]
+    xs = x1[indices] + t * (x2 - x1)[indices]
+    # Sort crossings along each scanline; consecutive pairs bound the inside
+    order = _np.lexsort((xs, rows))
+    rows, xs = rows[order], xs[order]
+    cells = _np.clip(_np.ceil(xs - 0.5), 0, width).astype(_np.int64)
+    diff = _np.zeros((height, width + 1), dtype=_np.int64)
+    _np.add.at(diff, (rows[0::2], cells[0::2]), 1)
+    _np.add.at(diff, (rows[1::2], cells[1::2]), -1)
+    return _np.cumsum(diff, axis=1)[:,:width] > 0
+
+def _boundary_cells(edges):
+    """Find the cells of the unit grid, with origin at `(0,0)`, which the
+    edges pass through.
+
+    :return: `(gx, gy, on_border)` where `on_border` is `True` for pieces of
+      edge which only run along the border of the cell.
+    """
+    indices, gx, gy, t1, t2 = intersect_lines_grid(edges, _data.Grid(1, 1, 0, 0))
+    x1, y1, x2, y2 = edges[indices].T
+    px1, px2 = x1 + t1 * (x2 - x1), x1 + t2 * (x2 - x1)
+    py1, py2 = y1 + t1 * (y2 - y1), y1 + t2 * (y2 - y1)
+    on_border = _np.zeros(len(indices), dtype=bool)
+    for p1, p2, g in [(px1, px2, gx), (py1, py2, gy)]:
+        for side in [g, g + 1]:
+            on_border |= (_np.abs(p1 - side) < 1e-9) & (_np.abs(p2 - side) < 1e-9)
+    return gx, gy, on_border
+
+def _local_edges(geometry, grid):
+    """Find the cells covering the geometry, and the polygon edges in the
+    coordinates of those cells.
+
+    :return: `(xstart, ystart, width, height, edges)`
+    """
+    xstart, ystart, width, height = _grid_bounds(geometry, grid)
+    xo = grid.xoffset + xstart * grid.xsize
+    yo = grid.yoffset + ystart * grid.ysize
+    edges = _polygon_edges(geometry)
+    edges = (edges - [xo, yo, xo, yo]) / [grid.xsize, grid.ysize, grid.xsize, grid.ysize]
+    return xstart, ystart, width, height, edges
+
+def _rasterise(geometry, grid, mode):
+    """Rasterise the geometry onto the cells of `grid` covering its bounding
+    box.
+
+    :return: `(xstart, ystart, mask)` where `mask[y,x]` is `True` if the cell
+      `(x + xstart, y + ystart)` is selected.
+    """
+    if mode not in ("overlap", "centre"):
+        raise ValueError("Unknown mode: {}".format(mode))
+    xstart, ystart, width, height, edges = _local_edges(geometry, grid)
+    mask = _scanline_centres(edges, width, height)
+    if mode == "overlap" and len(edges) > 0:
+        # Add cells whose interior is crossed by the boundary
+        gx, gy, on_border = _boundary_cells(edges)
+        keep = (~on_border) & (gx >= 0) & (gx < width) & (gy >= 0) & (gy < height)
+        mask[gy[keep], gx[keep]] = True
+    return xstart, ystart, mask
+
+def _intersects_xy(geometry, xcs, ycs):
+    """Exact test of which points intersect (are inside, or on the boundary
+    of) the geometry."""
+    try:
+        import shapely
+        shapely.prepare(geometry)
+        return _np.asarray(shapely.intersects_xy(geometry, xcs, ycs), dtype=bool)
+    except (ImportError, AttributeError):
+        import shapely.prepared
+        geo = shapely.prepared.prep(geometry)
+        return _np.asarray([geo.intersects(_geometry.Point(x, y))
+            for x, y in zip(xcs, ycs)], dtype=bool)
+
+def points_in_geometry(geometry, xcs, ycs, resolution=512):
+    """Find which points intersect (are inside, or on the boundary of) the
+    geometry.  The geometry is rasterised once onto a grid, of about
+    `resolution` cells along its longer side.  Points in cells wholly inside
+    or wholly outside the geometry are classified by array lookup, and only
+    points near the boundary are tested exactly, using `shapely`.
 
-    intersections = []
-    for y in range(ystart, yend + 1):
-        yy = grid.yoffset + y * grid.ysize
-        for x in range(xstart, xend + 1):
-            xx = grid.xoffset + x * grid.xsize
-            poly = _geometry.Polygon([[xx, yy], [xx + grid.xsize, yy],
-                    [xx + grid.xsize, yy + grid.ysize], [xx, yy + grid.ysize]])
-            poly = poly.intersection(geometry)
-            if not poly.is_empty and poly.area > 0:
-                intersections.append((x, y))
-    return intersections
-
-def mask_grid_by_intersection(geometry, grid):
+    :param geometry: Geometry object to intersect with.
+    :param xcs: Array of x coordinates.
+    :param ycs: Array of y coordinates, of the same length.
+
+    :return: Boolean array, `True` for points which intersect.
+    """
+    xcs = _np.asarray(xcs, dtype=_np.float64)
+    ycs = _np.asarray(ycs, dtype=_np.float64)
+    minx, miny, maxx, maxy = geometry.bounds
+    size = max(maxx - minx, maxy - miny) / resolution
+    if geometry.geom_type not in ("Polygon", "MultiPolygon") or not size > 0:
+        return _intersects_xy(geometry, xcs, ycs)
+    grid = _data.Grid(size, size, minx, miny)
+    xstart, ystart, width, height, edges = _local_edges(geometry, grid)
+    # Pad by one cell all round, so that points just outside the bounding box
+    # are considered to be near the boundary
+    inside = _np.zeros((height + 2, width + 2), dtype=bool)
+    inside[1:-1,1:-1] = _scanline_centres(edges, width, height)
+    near = _np.zeros((height + 2, width + 2), dtype=bool)
+    gx, gy, _ = _boundary_cells(edges)
+    gx, gy = _np.clip(gx + 1, 0, width + 1), _np.clip(gy + 1, 0, height + 1)
+    near[gy, gx] = True
+    # Dilate, to allow for rounding when assigning points to cells
+    dilated = near.copy()
+    for dx, dy in [(-1,-1), (-1,0), (-1,1), (0,-1), (0,1), (1,-1), (1,0), (1,1)]:
+        dilated[max(dy,0):height+2+min(dy,0), max(dx,0):width+2+min(dx,0)] |= (
+            near[max(-dy,0):height+2+min(-dy,0), max(-dx,0):width+2+min(-dx,0)])
+
+    px = _np.floor((xcs - minx) / size) - xstart + 1
+    py = _np.floor((ycs - miny) / size) - ystart + 1
+    valid = (px >= 0) & (px < width + 2) & (py >= 0) & (py < height + 2)
+    px, py = px[valid].astype(_np.int64), py[valid].astype(_np.int64)
+    result = _np.zeros(len(xcs), dtype=bool)
+    within = inside[py, px]
+    exact = dilated[py, px]
+    if _np.any(exact):
+        where = _np.nonzero(valid)[0][exact]
+        within[exact] = _intersects_xy(geometry, xcs[where], ycs[where])
+    result[valid] = within
+    return result
+
+def rasterise_geometry(geometry, grid, mode="overlap"):
+    """Generate a :class:`MaskedGrid` from the polygons in the geometry, using
+    a scanline algorithm in `numpy`.  Polygons may have holes, and
+    multi-polygons are supported.  The returned grid has the same layout as
+    :func:`mask_grid_by_intersection`.
+
+    :param geometry: Geometry object to intersect with.  Only (multi-)polygons
+      are considered.
+    :param grid: The :class:`Grid` instance describing the grid.
+    :param mode: "overlap" to select cells which intersect the geometry with
+      non-zero area, or "centre" to select cells whose centre lies inside the
+      geometry.
+    """
+    xstart, ystart, mask = _rasterise(geometry, grid, mode)
+    xo = grid.xoffset + xstart * grid.xsize
+    yo = grid.yoffset + ystart * grid.ysize
+    return _data.MaskedGrid(grid.xsize, grid.ysize, xo, yo, ~mask)
+
+def mask_grid_by_intersection(geometry, grid, mode="intersects"):
     """Generate a :class:`MaskedGrid` by intersecting the grid with the
     geometry.  The returned grid may have a different x/y offset, so that it
     can contain all grid cells which intersect with the geometry.  However,
@@ -105,15 +270,14 @@ def mask_grid_by_intersection(geometry, grid):
 
     :param geometry: Geometry object to intersect with.
     :param grid: The :class:`Grid` instance describing the grid.
+    :param mode: "intersects" (the default) uses `shapely` to select every
+      cell which intersects the geometry, even if only along an edge.  This
+      is slow for large grids.  "overlap" and "centre" use the much faster
+      :func:`rasterise_geometry`.
     """
-    minx, miny, maxx, maxy = geometry.bounds
-    xstart = int(_np.floor((minx - grid.xoffset) / grid.xsize))
-    xend = int(_np.floor((maxx - grid.xoffset) / grid.xsize))
-    ystart = int(_np.floor((miny - grid.yoffset) / grid.ysize))
-    yend = int(_np.floor((maxy - grid.yoffset) / grid.ysize))
-    width = xend - xstart + 1
-    height = yend - ystart + 1
-
+    if mode != "intersects":
+        return rasterise_geometry(geometry, grid, mode)
+    xstart, ystart, width, height = _grid_bounds(geometry, grid)
     mask = _np.empty((height, width), dtype=_np.bool)
     xo = grid.xoffset + xstart * grid.xsize
     yo = grid.yoffset + ystart * grid.ysize
@@ -152,51 +316,39 @@ def mask_grid_by_points_intersection(timed_points, grid, bbox=False):
     width = xend - xstart + 1
     height = yend - ystart + 1
 
-    mask = _np.zeros((height, width), dtype=_np.bool)
+    mask = _np.zeros((height, width), dtype=bool)
     xo = grid.xoffset + xstart * grid.xsize
     yo = grid.yoffset + ystart * grid.ysize
     if not bbox:
-        def intersect(xx, yy):
-            mask = ( (xcs >= xx) & (ycs >= yy)
-                & (xcs <= (xx+grid.xsize)) & (ycs <= (yy+grid.ysize)) )
-            return _np.any(mask)
-        for y in range(height):
-            yy = yo + y * grid.ysize
-            for x in range(width):
-                xx = xo + x * grid.xsize
-                if not intersect(xx, yy):
-                    mask[y][x] = True
+        fx, fy = (xcs - xo) / grid.xsize, (ycs - yo) / grid.ysize
+        gx = _np.clip(_np.floor(fx), 0, width - 1).astype(_np.int64)
+        gy = _np.clip(_np.floor(fy), 0, height - 1).astype(_np.int64)
+        # A point on the border between cells is in both cells (or, at a
+        # corner, all four)
+        left = (fx == gx) & (gx > 0)
+        gx = _np.concatenate([gx, gx[left] - 1])
+        gy = _np.concatenate([gy, gy[left]])
+        fy = _np.concatenate([fy, fy[left]])
+        below = (fy == gy) & (gy > 0)
+        gx = _np.concatenate([gx, gx[below]])
+        gy = _np.concatenate([gy, gy[below] - 1])
+        counts = _np.bincount(gy * width + gx, minlength=width * height)
+        mask = (counts == 0).reshape((height, width))
     
     return _data.MaskedGrid(grid.xsize, grid.ysize, xo, yo, mask)
 
 
 def intersect_timed_points(timed_points, geo):
-    """Intersect the :class:`TimedPoints` data with the geometry, using
-    `shapely`.
+    """Intersect the :class:`TimedPoints` data with the geometry.  Duplicate
+    points, and the time order, are preserved.  See
+    :func:`points_in_geometry`.
     
     :param timed_points: Instance of :class:`TimedPoints`
     :param geo: A geometry object
     
     :return: Instance of :class:`TimedPoints`
     """
-    points = [ (x,y) for x,y in zip(timed_points.xcoords, timed_points.ycoords) ]
-    mp = _geometry.MultiPoint(points)
-    mp = mp.intersection(geo)
-    # type of mp: <class 'shapely.geometry.multipoint.MultiPoint'>
-    # type of np-asarray-mp: <class 'numpy.ndarray'>
-    # shape of np-asarray-mp: (23653, 2)
-    # type of pt in _np.asarray(mp): <class 'numpy.ndarray'>
-    # shape of pt in _np.asarray(mp): (2,)
-    
-    # NOTE: The slicing "[:,:2]" in this next line was added because
-    #  using some geojson files somehow resulted in points with 3
-    #  dimensions here, immediately after the above "mp.intersection(geo)"
-    #  line. Forcing the slice here to only take the first 2 dimensions
-    #  is a workaround until that bug can be understood and fixed.
-    points_we_want = set(tuple(pt) for pt in _np.asarray(mp)[:,:2])
-    #points_we_want = set(tuple(pt) for pt in _np.asarray(mp))
-    mask = [pt in points_we_want for pt in points]
-    mask = _np.array(mask, dtype=_np.bool)
+    mask = points_in_geometry(geo, timed_points.xcoords, timed_points.ycoords)
     return timed_points[mask]
 
 
@@ -423,7 +575,61 @@ def full_intersect_line_grid(line, grid):
         search = (start[0]*(1-t2) + end[0]*t2, start[1]*(1-t2) + end[1]*t2)
     
     return segments, intervals
-    
+
+def intersect_lines_grid(quads, grid, tolerance=1e-9):
+    """Intersect many lines with a grid at once.  Each line is split at every
+    point where it crosses a vertical or horizontal grid line, and each piece
+    then lies in exactly one grid cell.  Vectorised version of
+    :func:`full_intersect_line_grid`.
+
+    :param quads: Array of shape `(n,4)` where each row is a line segment
+      `(x1, y1, x2, y2)`.
+    :param grid: Instance of :class:`data.Grid` or same interface.
+    :param tolerance: Pieces shorter than this (in line coordinates) are
+      merged with their neighbours.  This avoids slivers where a line passes
+      (almost) exactly through the corner of a grid cell.
+
+    :return: `(indices, gx, gy, t1, t2)` arrays, one entry for each piece.
+      The piece of line `indices[i]` from line coordinate `t1[i]` to `t2[i]`
+      is in the grid cell `(gx[i], gy[i])`.  Ordered by line, and then by
+      position along the line.  Every line has at least one piece.
+    """
+    quads = _np.asarray(quads, dtype=_np.float64).reshape((-1, 4))
+    n = quads.shape[0]
+    x1 = (quads[:,0] - grid.xoffset) / grid.xsize
+    y1 = (quads[:,1] - grid.yoffset) / grid.ysize
+    x2 = (quads[:,2] - grid.xoffset) / grid.xsize
+    y2 = (quads[:,3] - grid.yoffset) / grid.ysize
+    
+    breaks_index, breaks_t = [_np.arange(n), _np.arange(n)], [_np.zeros(n), _np.ones(n)]
+    for start, end in [(x1, x2), (y1, y2)]:
+        # Grid lines at integers `k` with `min(start,end) < k <= max(start,end)`
+        fstart, fend = _np.floor(start), _np.floor(end)
+        counts = _np.abs(fend - fstart).astype(_np.int64)
+        indices = _np.repeat(_np.arange(n), counts)
+        offsets = _np.arange(len(indices)) - _np.repeat(_np.cumsum(counts) - counts, counts)
+        k = _np.minimum(fstart, fend)[indices] + 1 + offsets
+        t = (k - start[indices]) / (end - start)[indices]
+        inside = (t > tolerance) & (t < 1 - tolerance)
+        breaks_index.append(indices[inside])
+        breaks_t.append(t[inside])
+    breaks_index = _np.concatenate(breaks_index)
+    breaks_t = _np.concatenate(breaks_t)
+    order = _np.lexsort((breaks_t, breaks_index))
+    breaks_index, breaks_t = breaks_index[order], breaks_t[order]
+    # Crossing a vertical and a horizontal grid line at (almost) the same place
+    keep = _np.ones(len(breaks_t), dtype=bool)
+    keep[1:] = (breaks_index[1:] != breaks_index[:-1]) | (breaks_t[1:] - breaks_t[:-1] > tolerance)
+    breaks_index, breaks_t = breaks_index[keep], breaks_t[keep]
+
+    starts = _np.nonzero(breaks_index[1:] == breaks_index[:-1])[0]
+    indices = breaks_index[starts]
+    t1, t2 = breaks_t[starts], breaks_t[starts + 1]
+    tmid = (t1 + t2) / 2
+    gx = _np.floor(x1[indices] * (1 - tmid) + x2[indices] * tmid).astype(_np.int64)
+    gy = _np.floor(y1[indices] * (1 - tmid) + y2[indices] * tmid).astype(_np.int64)
+    return indices, gx, gy, t1, t2
+
 
 try:
     import rtree as _rtree
@@ -7,6 +7,7 @@ Transform lon/lat coords into meters
 
 from . import predictor
 import open_cp.gui.import_file_model as import_file_model
+import open_cp.data
 import logging
 import numpy as _np
 from open_cp.gui.common import CoordType
@@ -50,7 +51,18 @@ except:
     logging.getLogger(__name__).error("Failed to load `pyproj`.")
 
 
-class ViaUTM():
+class _Projector():
+    """Base class for projecting with a :class:`pyproj.Proj` instance, which
+    projects whole arrays at a time (in chunks)."""
+    def __call__(self, lon, lat):
+        lon, lat = _np.asarray(lon), _np.asarray(lat)
+        if len(lon.shape) != 1:
+            return self._proj(lon, lat)
+        x, y = open_cp.data.project_lon_lat(lon, lat, self._proj)
+        return x, y
+
+
+class ViaUTM(_Projector):
     """Use the suitable UTM for the input data.
 
     https://en.wikipedia.org/wiki/Universal_Transverse_Mercator_coordinate_system
@@ -60,19 +72,14 @@ class ViaUTM():
     def __init__(self, xcoords):
         average_longitude = _np.average(_np.asarray(xcoords))
         utm_zone = int(_np.floor((average_longitude + 180) / 6) + 1)
-        self._proj = pyproj.Proj(datum="NAD83", ellps="GRS80", proj="utm", units="m", zone=utm_zone)
+        self._proj = open_cp.data.get_projection(proj_string=
+            "+proj=utm +zone={} +datum=NAD83 +ellps=GRS80 +units=m".format(utm_zone))
 
-    def __call__(self, lon, lat):
-        return self._proj(lon, lat)
 
-
-class EPSG():
+class EPSG(_Projector):
     """Use an epsg setting"""
     def __init__(self, epsg):
-        self._proj = pyproj.Proj(init="epsg:"+str(epsg))
-
-    def __call__(self, lon, lat):
-        return self._proj(lon, lat)
+        self._proj = open_cp.data.get_projection(epsg)
 
 
 class BritishNationalGrid(EPSG):
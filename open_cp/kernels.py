@@ -431,7 +431,10 @@ class GaussianBase():
             raise ValueError("Data is {} dimensional but asked to evaluate on {} dimensional data".format(self.dimension, pts.shape[0]))
         out = self._fast_call(pts)
         if out is None:
-            out = _np.asarray([self(pt)[0] for pt in pts.T])
+            # Evaluate in blocks small enough for `_fast_call`
+            chunk = max(1, 100000 // (self.data.shape[0] * self.data.shape[1]))
+            out = _np.concatenate([self._fast_call(pts[:,i:i+chunk])
+                for i in range(0, pts.shape[1], chunk)])
         return out
 
     def _too_large(self, pts):
@@ -791,18 +794,24 @@ class GaussianEdgeCorrectGrid(GaussianBase, _EdgeCorrect):
         pt = pt.T # Now shape (N, 2)
         self._recalc()
         hSi = self._cache[-1]
-        offset = (pt - [self._grid.xoffset, self._grid.yoffset])[None,:,:]
-        pts = _np.dot(self._cache[3], hSi)[:,None,:] + offset
-        pts = _np.floor_divide(pts, _np.asarray([self._grid.xsize, self._grid.ysize])[None,None,:]).astype(_np.int)
-
-        m = (pts >= [0,0]) & (pts < [self._grid.xextent, self._grid.yextent])
-        m = (m[:,:,0] & m[:,:,1])
-        
+        sx, sy = _np.dot(self._cache[3], hSi).T
+        # Pad the mask with invalid cells, so points outside the grid can be
+        # clipped to the border
+        valid = _np.ones((self._grid.yextent + 2, self._grid.xextent + 2), dtype=bool)
+        valid[1:-1, 1:-1] = self._grid.mask
+        valid = ~valid
+        x = (pt[:,0] - self._grid.xoffset) / self._grid.xsize
+        y = (pt[:,1] - self._grid.yoffset) / self._grid.ysize
+        sx, sy = sx / self._grid.xsize, sy / self._grid.ysize
         factor = _np.empty(pt.shape[0])
-        for i in range(pt.shape[0]):
-            gx, gy = pts[:,i,:][m[:,i],:].T
-            valid = self._grid.mask[gy, gx]
-            factor[i] = valid.shape[0] - _np.sum(valid)
+        # Work in blocks to bound memory use
+        chunk = 1000
+        for start in range(0, pt.shape[0], chunk):
+            gx = _np.floor(sx[:,None] + x[None,start:start+chunk])
+            gy = _np.floor(sy[:,None] + y[None,start:start+chunk])
+            gx = _np.clip(gx, -1, self._grid.xextent).astype(_np.int64) + 1
+            gy = _np.clip(gy, -1, self._grid.yextent).astype(_np.int64) + 1
+            factor[start:start+chunk] = _np.sum(valid[gy, gx], axis=0)
         return factor / (self._k * self._m)
 
     def __call__(self, pts):
@@ -18,6 +18,9 @@ import io as _io
 import base64 as _base64
 import json as _json
 import collections as _collections
+import heapq as _heapq
+import operator as _operator
+import math as _math
 
 _logger = _logging.getLogger(__name__)
 
@@ -185,7 +188,8 @@ class PlanarGraphNodeBuilder():
     one to the other in the generated graph.
 
     This class is slow when the graph is large.  See
-    :class`:PlanarGraphNodeOneShot` as well.
+    :class`:PlanarGraphNodeHashBuilder` and :class`:PlanarGraphNodeOneShot`
+    as well.
     
     These (weaker) assumptions are suitable for the US TIGER/Lines data, for
     example.
@@ -252,6 +256,77 @@ class PlanarGraphNodeBuilder():
         return PlanarGraph(vertices, self.edges)
 
 
+class PlanarGraphNodeHashBuilder(PlanarGraphNodeBuilder):
+    """A drop-in replacement for :class:`PlanarGraphNodeBuilder` which gives
+    the same graphs, but which stores nodes in a uniform grid of "buckets",
+    with the bucket size equal to the tolerance.  Only the neighbouring
+    buckets need to be searched when adding a node, and so the time taken to
+    build a graph is linear in the number of path vertices.
+
+    Also accepts paths in bulk, see :meth:`add_paths`.
+    """
+    def __init__(self):
+        super().__init__()
+        self._buckets = dict()
+
+    @PlanarGraphNodeBuilder.tolerance.setter
+    def tolerance(self, v):
+        self._tolerance = v
+        self._buckets = dict()
+        for index, (x, y) in enumerate(self._nodes):
+            self._buckets.setdefault(self._bucket(x, y), []).append(index)
+
+    def _bucket(self, x, y):
+        if self._tolerance <= 0:
+            return (x, y)
+        return (_math.floor(x / self._tolerance), _math.floor(y / self._tolerance))
+
+    def _add_node(self, x, y):
+        bx, by = self._bucket(x, y)
+        best, best_distsq = -1, _math.inf
+        if self._tolerance > 0:
+            for cx in (bx - 1, bx, bx + 1):
+                for cy in (by - 1, by, by + 1):
+                    for index in self._buckets.get((cx, cy), ()):
+                        nx, ny = self._nodes[index]
+                        distsq = (nx - x)**2 + (ny - y)**2
+                        # Break ties by the earliest node, as `argmin` does
+                        if distsq < best_distsq or (distsq == best_distsq and index < best):
+                            best, best_distsq = index, distsq
+        if best_distsq < self._tolerance * self._tolerance:
+            return best
+        self._nodes.append((x, y))
+        index = len(self._nodes) - 1
+        self._buckets.setdefault((bx, by), []).append(index)
+        return index
+
+    def add_paths(self, coords, path_lengths):
+        """Add many "paths" at once.  Equivalent to calling :meth:`add_path`
+        for each path in turn.
+
+        :param coords: Array of shape `(N,2)` (or `(N,3)` with the third
+          column ignored) of the vertices of all the paths, concatenated.
+        :param path_lengths: Array of the number of vertices in each path,
+          summing to `N`.
+        """
+        coords = _np.asarray(coords, dtype=_np.float64)
+        path_lengths = _np.asarray(path_lengths, dtype=_np.int64)
+        if len(coords.shape) != 2 or coords.shape[1] < 2:
+            raise ValueError("Coordinates should be of shape (N,2)")
+        if _np.any(path_lengths < 0) or _np.sum(path_lengths) != coords.shape[0]:
+            raise ValueError("Path lengths should sum to the number of coordinates")
+        # Paths with only one vertex give no edges, and so add no nodes
+        used = _np.repeat(path_lengths > 1, path_lengths)
+        keys = _np.asarray([self._add_node(x, y) for x, y in
+            coords[used, :2].tolist()], dtype=_np.int64)
+        # An edge joins each vertex to the next, except across paths
+        ends = _np.cumsum(path_lengths[path_lengths > 1])
+        starts = _np.ones(len(keys), dtype=bool)
+        starts[ends - 1] = False
+        starts = _np.nonzero(starts)[0]
+        self._edges.extend(zip(keys[starts].tolist(), keys[starts + 1].tolist()))
+
+
 class PlanarGraphBuilder():
     """General purpose builder class.  Can be constructed from a
     :class:`PlanarGraph` instance; is designed for mutating a
@@ -398,6 +473,8 @@ class Graph():
     :param vertices: An iterables of of keys.
     :param edges: An iterable of (unordered) pairs `(key1, key2)`.
     """
+    _lookup_dicts = None
+
     def __init__(self, vertices, edges, lengths=None):
         self._vertices = set()
         for key in vertices:
@@ -420,32 +497,39 @@ class Graph():
             self._lengths = _np.asarray(lengths)
             if len(self._lengths) != len(self._edges):
                 raise ValueError("Should be as many lengths as edges.")
-        self._precompute()
-    
-    def _precompute(self):
-        self._neighbours = {k:set() for k in self._vertices}
-        for key1, key2 in self.edges:
-            self._neighbours[key1].add(key2)
-            self._neighbours[key2].add(key1)
-        for k in list(self._neighbours.keys()):
-            self._neighbours[k] = list(self._neighbours[k])
-            self._neighbours[k].sort()
-    
-        self._neighbourhood_edges = dict()
-        for index, edge in enumerate(self.edges):
-            for key in edge:
-                if key not in self._neighbourhood_edges:
-                    self._neighbourhood_edges[key] = []
-                self._neighbourhood_edges[key].append(index)
-        for k in list(self._neighbourhood_edges.keys()):
-            self._neighbourhood_edges[k].sort()
-            
-        self._edges_inverse = dict()
-        for index, edge in enumerate(self._edges):
-            self._edges_inverse[edge] = (index, 1)
-            e = (edge[1], edge[0])
-            self._edges_inverse[e] = (index, -1)
-    
+        self._csr = None
+        self._lookup_dicts = None
+
+    @property
+    def csr(self):
+        """The :class:`CSRAdjacency` view of the graph, which is built on first
+        use, and then cached.  Neighbourhood lookups, and most algorithms,
+        use this view."""
+        if getattr(self, "_csr", None) is None:
+            self._csr = CSRAdjacency(self)
+        return self._csr
+
+    def _lookups(self):
+        # Dictionaries for looking up single vertices and edges, which is
+        # much faster than going via the arrays of the CSR view.  Built from
+        # that view on first use, and then cached.
+        if self._lookup_dicts is None:
+            csr = self.csr
+            keys = csr.keys
+            indptr, neighbours, _ = csr._as_lists()
+            incident = csr.incident_edges.tolist()
+            neighbours_of, edges_of = dict(), dict()
+            for i, key in enumerate(keys):
+                start, end = indptr[i], indptr[i + 1]
+                neighbours_of[key] = [keys[j] for j in neighbours[start:end]]
+                edges_of[key] = incident[start:end]
+            edges_inverse = dict()
+            for index, (key1, key2) in enumerate(self.edges):
+                edges_inverse[(key1, key2)] = (index, 1)
+                edges_inverse[(key2, key1)] = (index, -1)
+            self._lookup_dicts = (neighbours_of, edges_of, edges_inverse)
+        return self._lookup_dicts
+
     @property
     def vertices(self):
         """A set (do not mutate!) of `key`s."""
@@ -479,20 +563,24 @@ class Graph():
           `order==1` if `self.edges[index] == (key1, key2)` while
           `order==-1` if `self.edges[index] == (key2, key1)`.
         """
-        return self._edges_inverse[(key1, key2)]
+        lookups = self._lookup_dicts or self._lookups()
+        return lookups[2][(key1, key2)]
 
     def neighbours(self, vertex_key):
         """A list of all the neighbours of the given vertex"""
-        return self._neighbours[vertex_key]
+        lookups = self._lookup_dicts or self._lookups()
+        return lookups[0][vertex_key]
     
     def neighbourhood_edges(self, vertex_key):
         """A list of all the edges (as indicies into `self.edges`) incident
         with the given vertex."""
-        return self._neighbourhood_edges[vertex_key]
+        lookups = self._lookup_dicts or self._lookups()
+        return lookups[1][vertex_key]
 
     def degree(self, vertex_key):
         """The degree (number of neighbours) of the vertex."""
-        return len(self.neighbourhood_edges(vertex_key))
+        lookups = self._lookup_dicts or self._lookups()
+        return len(lookups[0][vertex_key])
     
     def paths_between(self, key_start, key_end, max_length=None):
         """Iterable yielding all paths which start and end at the given
@@ -576,22 +664,30 @@ class Graph():
         The ordering is that we walk the edge which appears _last_ in the
         :attr:`edges` list first.
         """
-        todo = [ ([key1], 0.0) ]
+        csr = self.csr
+        keys = csr.keys
+        indptr, incident, ends, lengths = self._walk_lists()
+        avoid = {csr.index_of(key1), csr.index_of(key2)}
+        todo = [ ([csr.index_of(key1)], 0.0) ]
         while len(todo) > 0:
             partial_path, current_length = todo.pop()
-            okay = yield partial_path, current_length
+            okay = yield [keys[i] for i in partial_path], current_length
             if not okay:
                 continue
-            end_key = partial_path[-1]
-            for edge_index in self.neighbourhood_edges(end_key):
-                k1, k2 = self.edges[edge_index]
-                if (k1, k2) == (key1, key2) or (k2, k1) == (key1, key2):
+            end = partial_path[-1]
+            for edge_index in incident[indptr[end] : indptr[end+1]]:
+                k1, k2 = ends[edge_index]
+                if k1 in avoid and k2 in avoid:
                     continue
-                if k2 == end_key:
-                    k1, k2 = k2, k1
-                new_length = current_length + self.length(edge_index)
-                if k2 not in partial_path:
-                    todo.append((partial_path + [k2], new_length))
+                other = k1 + k2 - end
+                if other not in partial_path:
+                    todo.append((partial_path + [other], current_length + lengths[edge_index]))
+
+    def _walk_lists(self):
+        # Python lists of the CSR data, for the inner loops of the walkers
+        if self._lengths is None:
+            raise ValueError("No lengths.")
+        return self.csr._incidence_lists()
 
     def walk_with_degrees(self, start_key, initial_avoid_key, max_length, max_degree):
         """Find all paths which start at `start_key`, do _not_ immediately
@@ -616,38 +712,39 @@ class Graph():
         """
         yield (None, 0, 0, 1)
         
+        csr = self.csr
+        indptr, incident, ends, lengths = self._walk_lists()
+        start = csr.index_of(start_key)
+        try:
+            avoid = csr.index_of(initial_avoid_key)
+        except KeyError:
+            avoid = None
         todo = []
-        for i in self.neighbourhood_edges(start_key):
-            k1, k2 = self.edges[i]
-            if k2 == start_key:
-                k1, k2 = k2, k1
-            if k2 == initial_avoid_key:
+        for i in incident[indptr[start] : indptr[start+1]]:
+            k1, k2 = ends[i]
+            if k1 + k2 - start == avoid:
                 continue
-            todo.append((start_key, i, 0, 1, {start_key}))
+            todo.append((start, i, 0, 1, {start}))
         
         while len(todo) > 0:
             old_vertex, edge_index, old_length, total_degree, vertices_in_path = todo.pop()
-            k1, k2 = self.edges[edge_index]
-            if k2 == old_vertex:
-                k1, k2 = k2, k1
-            new_vertex = k2
-            new_length = old_length + self.length(edge_index)
-            fact = self.degree(old_vertex) - 1
+            k1, k2 = ends[edge_index]
+            new_vertex = k1 + k2 - old_vertex
+            new_length = old_length + lengths[edge_index]
+            fact = indptr[old_vertex + 1] - indptr[old_vertex] - 1
             new_total_degree = total_degree
             if fact > 0:
                 new_total_degree *= fact
-            new_vertices_in_path = set(vertices_in_path)
-            new_vertices_in_path.add(new_vertex)
             if new_total_degree > max_degree:
                 continue
             yield edge_index, old_length, new_length, new_total_degree
             if new_length >= max_length:
                 continue
-            for i in self.neighbourhood_edges(new_vertex):
-                k1, k2 = self.edges[i]
-                if k2 == new_vertex:
-                    k1, k2 = k2, k1
-                if k2 in new_vertices_in_path:
+            new_vertices_in_path = set(vertices_in_path)
+            new_vertices_in_path.add(new_vertex)
+            for i in incident[indptr[new_vertex] : indptr[new_vertex+1]]:
+                k1, k2 = ends[i]
+                if k1 + k2 - new_vertex in new_vertices_in_path:
                     continue
                 todo.append((new_vertex, i, new_length, new_total_degree, new_vertices_in_path))
             
@@ -772,6 +869,56 @@ class PlanarGraph(Graph):
         json = _bz2.decompress(data).decode("UTF8")
         return PlanarGraph.from_json(json)
         
+    def dump_binary(self, filename):
+        """Write to a binary file which can be read back with
+        :meth:`from_binary`, using memory mapping if desired.  This is
+        larger than :meth:`dump_bytes`, as it is not compressed, but is much
+        faster to load.  As well as the geometry, the edge lengths and the
+        adjacency structure (see :attr:`csr`) are stored.
+
+        The file starts with a short header (see :data:`BINARY_FORMAT_VERSION`)
+        describing the arrays which follow, each of which is aligned to a 64
+        byte boundary.
+
+        The keys need to be integers.
+
+        :param filename: The file to write to.
+        """
+        csr = self.csr
+        try:
+            keys = _np.asarray(csr.keys, dtype=_np.int64)
+            if not _np.all(keys == _np.asarray(csr.keys)):
+                raise ValueError()
+        except (TypeError, ValueError):
+            raise ValueError("Vertex keys need to be integers.")
+        arrays = [("keys", keys), ("coords", csr.coords), ("edge_vertices", csr.edge_vertices),
+            ("lengths", csr.lengths), ("indptr", csr.indptr),
+            ("neighbours", csr.neighbours), ("edge_indices", csr.edge_indices),
+            ("weights", csr.weights), ("incident_edges", csr.incident_edges)]
+        _write_arrays(filename, arrays)
+
+    @staticmethod
+    def from_binary(filename, mmap_mode="r"):
+        """Load a graph written by :meth:`dump_binary`.  The file is trusted:
+        the checks made by the usual constructor are skipped.
+
+        :param filename: The file to read from.
+        :param mmap_mode: As for :func:`numpy.load`: "r" (the default) to
+          memory map the arrays, or `None` to read them into memory.
+
+        :return: A new instance of :class:`PlanarGraph`.  The cached
+          :attr:`csr` view, and :attr:`lengths`, use the stored arrays.
+        """
+        arrays = _read_arrays(filename, mmap_mode)
+        keys = arrays["keys"].tolist()
+        xcs, ycs = arrays["coords"].tolist()
+        graph = PlanarGraph.__new__(PlanarGraph)
+        graph._vertices = dict(zip(keys, zip(xcs, ycs)))
+        graph._edges = list(zip(*arrays["keys"][arrays["edge_vertices"]].tolist()))
+        graph._lengths = arrays["lengths"]
+        graph._csr = CSRAdjacency._from_stored(keys, arrays)
+        return graph
+
     @staticmethod
     def _load_numpy_array(b64data):
         if isinstance(b64data, str):
@@ -870,6 +1017,21 @@ class PlanarGraph(Graph):
         index, t = self._projector.project_point(x, y)
         return self._edges[index], t
 
+    def project_points_to_graph(self, xcoords, ycoords):
+        """Projects many points to the nearest edges in the graph, using a
+        :class:`BatchPointProjector`.
+
+        :param xcoords: Array of x coordinates.
+        :param ycoords: Array of y coordinates.
+
+        :return: `(edge_indices, t)` where `edge_indices` is an array of
+          indices into :attr:`edges` and `t` an array of the (fractional)
+          distance along each edge, as in :meth:`project_point_to_graph`.
+        """
+        if getattr(self, "_batch_projector", None) is None:
+            self._batch_projector = BatchPointProjector(self.as_quads())
+        return self._batch_projector.project_points(xcoords, ycoords)
+
 
 try:
     import rtree as _rtree
@@ -930,10 +1092,222 @@ class PointProjector():
             h += h
 
 
+class BatchPointProjector():
+    """Projects many points at once to the nearest of a collection of line
+    segments, without needing `rtree`.  The bounding box of each segment is
+    recorded in every cell of a uniform grid which it meets.  For each point,
+    we then search outwards in square "rings" of grid cells, of growing
+    width, until the closest segment found is nearer than any segment not yet
+    examined could be.  All
+    the geometry is vectorised across points.
+
+    Gives the same answers as :class:`PointProjector`, including breaking
+    ties in favour of the segment with the smallest index.
+
+    :param quads: Array of shape `(N, 4)` of segments `(x1, y1, x2, y2)`.
+    :param cell_size: The width and height of the grid cells.  Defaults to
+      half the mean length of the segments.  If this would give more than
+      :attr:`MAX_CELLS_PER_SEGMENT` times as many cells as segments (for
+      example, with distant clusters of short segments) then the cells are
+      enlarged until it does not.
+    :param chunk_size: The number of points to project at once, which bounds
+      the memory used.
+    """
+    def __init__(self, quads, cell_size=None, chunk_size=100000):
+        self._quads = _np.asarray(quads, dtype=_np.float64).reshape((-1, 4))
+        self._chunk_size = chunk_size
+        if len(self._quads) == 0:
+            raise ValueError("Need at least one segment")
+        self._columns = [_np.ascontiguousarray(c) for c in self._quads.T]
+        x1, y1, x2, y2 = self._columns
+        if cell_size is None:
+            cell_size = _np.mean(_np.sqrt((x2 - x1)**2 + (y2 - y1)**2)) / 2
+            if not cell_size > 0:
+                cell_size = 1.0
+        self._xmin = min(_np.min(x1), _np.min(x2))
+        self._ymin = min(_np.min(y1), _np.min(y2))
+        xextent = max(_np.max(x1), _np.max(x2)) - self._xmin
+        yextent = max(_np.max(y1), _np.max(y2)) - self._ymin
+        max_cells = max(1024, BatchPointProjector.MAX_CELLS_PER_SEGMENT * len(self._quads))
+        cell_size = float(cell_size)
+        while (_np.floor(xextent / cell_size) + 1) * (_np.floor(yextent / cell_size) + 1) > max_cells:
+            cells = (xextent / cell_size + 1) * (yextent / cell_size + 1)
+            cell_size *= max(1.01, _np.sqrt(cells / max_cells))
+        self._cell_size = cell_size
+        cx1, cy1 = self._cells(_np.minimum(x1, x2), _np.minimum(y1, y2))
+        cx2, cy2 = self._cells(_np.maximum(x1, x2), _np.maximum(y1, y2))
+        self._width, self._height = int(_np.max(cx2)) + 1, int(_np.max(cy2)) + 1
+
+        # Each segment is listed in every cell of its bounding box
+        nx, ny = cx2 - cx1 + 1, cy2 - cy1 + 1
+        counts = nx * ny
+        segments, within = self._expand(_np.zeros_like(counts), counts)
+        rep_nx = nx[segments]
+        cells = (cy1[segments] + within // rep_nx) * self._width + cx1[segments] + within % rep_nx
+        order = _np.lexsort((segments, cells))
+        self._cell_segments = segments[order]
+        self._cell_ptr = _np.zeros(self._width * self._height + 1, dtype=_np.int64)
+        _np.cumsum(_np.bincount(cells, minlength=self._width * self._height),
+            out=self._cell_ptr[1:])
+
+    #: The grid is limited to this many cells for each segment.
+    MAX_CELLS_PER_SEGMENT = 4
+
+    @property
+    def cell_size(self):
+        """The size of the grid cells actually used."""
+        return self._cell_size
+
+    def _cells(self, x, y):
+        cx = _np.floor((_np.asarray(x) - self._xmin) / self._cell_size).astype(_np.int64)
+        cy = _np.floor((_np.asarray(y) - self._ymin) / self._cell_size).astype(_np.int64)
+        return cx, cy
+
+    def _project(self, points, segments):
+        """For each pair, the squared distance and parameter `t`."""
+        x1, y1 = self._columns[0][segments], self._columns[1][segments]
+        vx = self._columns[2][segments] - x1
+        vy = self._columns[3][segments] - y1
+        dx, dy = points[0] - x1, points[1] - y1
+        with _np.errstate(divide="ignore", invalid="ignore"):
+            t = (dx * vx + dy * vy) / (vx * vx + vy * vy)
+        t = _np.clip(_np.nan_to_num(t), 0, 1)
+        ex = points[0] - (x1 + t * vx)
+        ey = points[1] - (y1 + t * vy)
+        return ex * ex + ey * ey, t
+
+    @staticmethod
+    def _expand(starts, counts):
+        """For each `i`, the values `starts[i], ..., starts[i] + counts[i] - 1`,
+        concatenated, and the index `i` for each value."""
+        owners = _np.repeat(_np.arange(len(counts)), counts)
+        offsets = _np.arange(_np.sum(counts)) - _np.repeat(_np.cumsum(counts) - counts, counts)
+        return owners, _np.repeat(starts, counts) + offsets
+
+    def _rectangles(self, rects):
+        """Cells, inside the grid, of a list of rectangles `(xlow, xhigh,
+        ylow, yhigh)` of arrays, one rectangle per point.
+
+        :return: `(owners, cells)` where `owners` indexes the points, and is
+          sorted.
+        """
+        all_owners, all_cells = [], []
+        for xlow, xhigh, ylow, yhigh in rects:
+            xlow, xhigh = _np.maximum(xlow, 0), _np.minimum(xhigh, self._width - 1)
+            ylow, yhigh = _np.maximum(ylow, 0), _np.minimum(yhigh, self._height - 1)
+            widths = _np.maximum(xhigh - xlow + 1, 0)
+            counts = widths * _np.maximum(yhigh - ylow + 1, 0)
+            owners, within = self._expand(_np.zeros_like(counts), counts)
+            all_cells.append((ylow[owners] + within // widths[owners]) * self._width
+                + xlow[owners] + within % widths[owners])
+            all_owners.append(owners)
+        owners = _np.concatenate(all_owners)
+        order = _np.argsort(owners, kind="stable")
+        return owners[order], _np.concatenate(all_cells)[order]
+
+    def _annulus_cells(self, cx, cy, inner, outer):
+        """For each point, the cells, inside the grid, at Chebyshev distance
+        from `(cx, cy)` greater than `inner` and at most `outer`."""
+        if inner < 0:
+            return self._rectangles([(cx - outer, cx + outer, cy - outer, cy + outer)])
+        return self._rectangles([
+            (cx - outer, cx + outer, cy - outer, cy - inner - 1),
+            (cx - outer, cx + outer, cy + inner + 1, cy + outer),
+            (cx - outer, cx - inner - 1, cy - inner, cy + inner),
+            (cx + inner + 1, cx + outer, cy - inner, cy + inner)])
+
+    def _candidates(self, point_indices, cx, cy, inner, outer):
+        """All pairs `(point index, segment)` for segments in cells at
+        Chebyshev distance from the point's cell in `(inner, outer]`."""
+        owners, cells = self._annulus_cells(cx, cy, inner, outer)
+        starts = self._cell_ptr[cells]
+        counts = self._cell_ptr[cells + 1] - starts
+        pair_owners, positions = self._expand(starts, counts)
+        return point_indices[owners[pair_owners]], self._cell_segments[positions]
+
+    def project_points(self, xcoords, ycoords):
+        """Project each point to the nearest segment.
+
+        :param xcoords: Array of x coordinates.
+        :param ycoords: Array of y coordinates.
+
+        :return: `(indices, t)` where `indices` is an array of indices of the
+          closest segments, and `t` an array of the parameter `0 <= t <= 1`
+          along each segment at which the projected point lies.
+        """
+        points = _np.vstack([_np.asarray(xcoords, dtype=_np.float64).ravel(),
+                             _np.asarray(ycoords, dtype=_np.float64).ravel()])
+        indices = _np.empty(points.shape[1], dtype=_np.int64)
+        t = _np.empty(points.shape[1])
+        for start in range(0, points.shape[1], self._chunk_size):
+            end = start + self._chunk_size
+            indices[start:end], t[start:end] = self._project_chunk(points[:,start:end])
+        return indices, t
+
+    def _project_chunk(self, points):
+        n = points.shape[1]
+        best_dist = _np.full(n, _np.inf)
+        best_index = _np.full(n, len(self._quads), dtype=_np.int64)
+        best_t = _np.zeros(n)
+        cx, cy = self._cells(points[0], points[1])
+        # Search outwards in square annuli of growing width, starting with the
+        # first "ring" of cells which meets the grid.  `inner` is the
+        # (Chebyshev) radius already searched.
+        inner = _np.maximum(_np.maximum(-cx, cx - self._width + 1),
+            _np.maximum(-cy, cy - self._height + 1))
+        inner = _np.maximum(inner, 0) - 1
+        width = _np.ones(n, dtype=_np.int64)
+        # Once this far out, every segment has been seen
+        last_radius = _np.maximum(_np.maximum(cx, self._width - 1 - cx),
+            _np.maximum(cy, self._height - 1 - cy))
+        todo = _np.arange(n)
+        while len(todo) > 0:
+            outer = inner + width
+            pairs = _np.unique(_np.stack([inner[todo], outer[todo]]), axis=1)
+            for r_in, r_out in pairs.T.tolist():
+                group = todo[(inner[todo] == r_in) & (outer[todo] == r_out)]
+                owners, segments = self._candidates(group, cx[group], cy[group], r_in, r_out)
+                if len(owners) == 0:
+                    continue
+                distsq, t = self._project(points[:,owners], segments)
+                # `owners` is sorted, so reduce over each run to find, for each
+                # point, the closest segment with the smallest index
+                starts = _np.flatnonzero(_np.r_[True, owners[1:] != owners[:-1]])
+                run_lengths = _np.diff(_np.r_[starts, len(owners)])
+                closest = _np.minimum.reduceat(distsq, starts)
+                is_closest = distsq == _np.repeat(closest, run_lengths)
+                choice = _np.minimum.reduceat(_np.where(is_closest, segments,
+                    len(self._quads)), starts)
+                is_choice = is_closest & (segments == _np.repeat(choice, run_lengths))
+                positions = _np.minimum.reduceat(_np.where(is_choice,
+                    _np.arange(len(owners)), len(owners)), starts)
+                owners, segments = owners[starts], choice
+                distsq, t = closest, t[positions]
+                better = ((distsq < best_dist[owners]) |
+                    ((distsq == best_dist[owners]) & (segments < best_index[owners])))
+                owners, segments = owners[better], segments[better]
+                best_dist[owners] = distsq[better]
+                best_index[owners] = segments
+                best_t[owners] = t[better]
+            # Unseen segments are more than `outer * cell_size` away
+            bound = outer[todo] * self._cell_size
+            finished = (best_dist[todo] < bound * bound) | (outer[todo] >= last_radius[todo])
+            # Widths go 1, 1, 2, 3, ... as the first ring is just one cell
+            width[todo] = _np.where(inner[todo] < 0, 1, width[todo] + 1)
+            inner[todo] = outer[todo]
+            todo = todo[~finished]
+        return best_index, best_t
+
+
 class TimedNetworkPoints(_data.TimeStamps):
     """A variant of :class:`Data.TimedPoints` where each event has a location
     given by reference to a graph.
 
+    The data is stored as four arrays (timestamps, start keys, end keys and
+    distances) in time order.  Slicing, and selecting a time window with
+    :meth:`time_window`, returns a new instance holding views of these arrays,
+    without copying.
+
     :param timestamps: An array of timestamps (must be convertible to
       :class:`numpy.datetime64`).
     :param locations: An iterable of pairs `(edge, t)` where `edge` is a pair
@@ -942,18 +1316,55 @@ class TimedNetworkPoints(_data.TimeStamps):
     """
     def __init__(self, timestamps, locations):
         super().__init__(timestamps)
-        self._start_keys = []
-        self._end_keys = []
-        distances = []
+        start_keys, end_keys, distances = [], [], []
         for ((key1, key2), t) in locations:
-            self._start_keys.append(key1)
-            self._end_keys.append(key2)
+            start_keys.append(key1)
+            end_keys.append(key2)
             distances.append(float(t))
-        self._start_keys = _np.asarray(self._start_keys)
-        self._end_keys = _np.asarray(self._end_keys)
-        self._distances = _np.asarray(distances)
         if len(distances) != len(self.timestamps):
             raise ValueError("Number of locations should match the number of timestamps")
+        self._start_keys = _np.asarray(start_keys)
+        self._end_keys = _np.asarray(end_keys)
+        self._distances = _np.asarray(distances, dtype=_np.float64)
+
+    @staticmethod
+    def _from_ordered_arrays(timestamps, start_keys, end_keys, distances):
+        """Construct without any checks or copying."""
+        tnp = TimedNetworkPoints.__new__(TimedNetworkPoints)
+        tnp._timestamps = timestamps
+        tnp._start_keys = start_keys
+        tnp._end_keys = end_keys
+        tnp._distances = distances
+        return tnp
+
+    @staticmethod
+    def from_arrays(timestamps, start_keys, end_keys, distances, sort=False):
+        """Construct a new instance directly from arrays.
+
+        :param timestamps: An array of timestamps (must be convertible to
+          :class:`numpy.datetime64`).
+        :param start_keys: Array of the keys of the start vertex of the edge
+          each event lies on.
+        :param end_keys: Array of the keys of the end vertex.
+        :param distances: Array of the distance, between 0 and 1, along each
+          edge.
+        :param sort: If `True` then sort the events into time order (stably).
+          Otherwise the timestamps must already be in time order.
+        """
+        timestamps = _np.asarray(timestamps, dtype="datetime64[ms]")
+        start_keys = _np.asarray(start_keys)
+        end_keys = _np.asarray(end_keys)
+        distances = _np.asarray(distances, dtype=_np.float64)
+        if not (len(timestamps) == len(start_keys) == len(end_keys) == len(distances)):
+            raise ValueError("Number of locations should match the number of timestamps")
+        if sort:
+            order = _np.argsort(timestamps, kind="stable")
+            timestamps, start_keys = timestamps[order], start_keys[order]
+            end_keys, distances = end_keys[order], distances[order]
+        elif _np.any(timestamps[1:] < timestamps[:-1]):
+            raise ValueError("Input must be time ordered")
+        return TimedNetworkPoints._from_ordered_arrays(timestamps, start_keys,
+            end_keys, distances)
 
     @staticmethod
     def project_timed_points(timed_points, graph):
@@ -962,10 +1373,12 @@ class TimedNetworkPoints(_data.TimeStamps):
         :param timed_points: Instance of :class:`data.TimedPoints`
         :param graph: Instance of :class:`PlanarGraph`
         """
-        def projector():
-            for x, y in zip(timed_points.xcoords, timed_points.ycoords):
-                yield graph.project_point_to_graph(x, y)
-        return TimedNetworkPoints(timed_points.timestamps, projector())
+        indices, t = graph.project_points_to_graph(timed_points.xcoords, timed_points.ycoords)
+        edges = graph.edges
+        start_keys = _np.asarray([edges[i][0] for i in indices.tolist()])
+        end_keys = _np.asarray([edges[i][1] for i in indices.tolist()])
+        return TimedNetworkPoints.from_arrays(timed_points.timestamps,
+            start_keys, end_keys, t)
 
     @property
     def distances(self):
@@ -974,38 +1387,62 @@ class TimedNetworkPoints(_data.TimeStamps):
 
     @property
     def start_keys(self):
-        """List of vertices which form the start of the edges"""
+        """Array of vertices which form the start of the edges"""
         return self._start_keys
 
     @property
     def end_keys(self):
-        """List of vertices which form the end of the edges"""
+        """Array of vertices which form the end of the edges"""
         return self._end_keys
 
+    def __len__(self):
+        return len(self._timestamps)
+
     def __getitem__(self, index):
-        if isinstance(index, int):
+        if isinstance(index, (int, _np.integer)):
             return [self.timestamps[index], self.start_keys[index], self.end_keys[index], self.distances[index]]
-        # Assume slice-like object
-        data = list(zip(self.timestamps[index], self.start_keys[index],
-                self.end_keys[index], self.distances[index]))
-        data.sort(key = lambda tup : tup[0])
-        new_times = [t for t,_,_,_ in data]
-        locations = [((k1,k2),t) for _,k1,k2,t in data]
-        return TimedNetworkPoints(new_times, locations)
+        if isinstance(index, slice):
+            if index.step is None or index.step > 0:
+                # Basic slicing gives views, already in time order
+                return self._from_ordered_arrays(self._timestamps[index],
+                    self._start_keys[index], self._end_keys[index],
+                    self._distances[index])
+            index = _np.arange(len(self))[index]
+        index = _np.asarray(index)
+        if index.dtype != _np.bool_:
+            # Integer indices may be in any order
+            index = index[_np.argsort(self._timestamps[index], kind="stable")]
+        return self._from_ordered_arrays(self._timestamps[index],
+            self._start_keys[index], self._end_keys[index], self._distances[index])
+
+    def time_window(self, start=None, end=None):
+        """Select the events with `start <= timestamp < end`, by binary search.
+        The returned instance holds views of our data.
+
+        :param start: The start time, or `None` to start with the first event.
+        :param end: The end time (exclusive), or `None` to finish with the
+          last event (inclusive).
+        """
+        first, last = 0, len(self)
+        if start is not None:
+            first = _np.searchsorted(self._timestamps, _np.datetime64(start), side="left")
+        if end is not None:
+            last = _np.searchsorted(self._timestamps, _np.datetime64(end), side="left")
+        return self[first : max(first, last)]
 
     def to_timed_points(self, graph):
-        """Use the graph object to convert to absolute coordinates.list
+        """Use the graph object to convert to absolute coordinates.
 
         :param graph: Instance of :class:`PlanarGraph` to use.
 
         :return: Instance of :class:`data.TimedPoints`
         """
-        xcs, ycs = [], []
-        for key1, key2, t in zip(self.start_keys, self.end_keys, self.distances):
-            x, y = graph.edge_to_coords(key1, key2, t)
-            xcs.append(x)
-            ycs.append(y)
-        return _data.TimedPoints.from_coords(self.timestamps, xcs, ycs)
+        csr = graph.csr
+        starts = csr.coords[:, csr.indices_of(self._start_keys)]
+        ends = csr.coords[:, csr.indices_of(self._end_keys)]
+        t = self._distances
+        coords = starts * (1 - t) + ends * t
+        return _data.TimedPoints(self.timestamps, coords)
 
 
 def approximately_equal(graph1, graph2, tolerance=0.1):
@@ -1093,58 +1530,486 @@ def to_derived_graph(graph, use_edge_indicies=False):
         builder.lengths = lengths
     return builder.build()
 
-def shortest_paths(graph, vertex_key):
+#: Version number written by :meth:`PlanarGraph.dump_binary`
+BINARY_FORMAT_VERSION = 1
+
+_BINARY_MAGIC = b"OPENCP-GRAPH\n"
+_BINARY_ALIGN = 64
+
+def _write_arrays(filename, arrays):
+    """Write a header, and then each array, in little-endian byte order,
+    aligned for memory mapping."""
+    arrays = [(name, _np.ascontiguousarray(array, dtype=_np.asarray(array).dtype.newbyteorder("<")))
+        for name, array in arrays]
+    header, offset = dict(), 0
+    for name, array in arrays:
+        header[name] = {"dtype" : array.dtype.str, "shape" : list(array.shape), "offset" : offset}
+        offset += -(-array.nbytes // _BINARY_ALIGN) * _BINARY_ALIGN
+    header = _json.dumps({"version" : BINARY_FORMAT_VERSION, "arrays" : header}).encode("UTF8")
+    start = len(_BINARY_MAGIC) + 8 + len(header)
+    start = -(-start // _BINARY_ALIGN) * _BINARY_ALIGN
+    with open(filename, "wb") as file:
+        file.write(_BINARY_MAGIC)
+        file.write(len(header).to_bytes(8, "little"))
+        file.write(header)
+        file.write(bytes(start - file.tell()))
+        for name, array in arrays:
+            file.write(array.tobytes())
+            file.write(bytes(-array.nbytes % _BINARY_ALIGN))
+
+def _read_arrays(filename, mmap_mode):
+    """Read the arrays written by :func:`_write_arrays`.
+
+    :return: Dictionary from name to array.
+    """
+    with open(filename, "rb") as file:
+        if file.read(len(_BINARY_MAGIC)) != _BINARY_MAGIC:
+            raise ValueError("Not a graph file")
+        length = int.from_bytes(file.read(8), "little")
+        header = _json.loads(file.read(length).decode("UTF8"))
+        if header["version"] != BINARY_FORMAT_VERSION:
+            raise ValueError("Unsupported graph file version: {}".format(header["version"]))
+        start = file.tell()
+        start = -(-start // _BINARY_ALIGN) * _BINARY_ALIGN
+        arrays = dict()
+        for name, info in header["arrays"].items():
+            dtype, shape = _np.dtype(info["dtype"]), tuple(info["shape"])
+            offset = start + info["offset"]
+            if mmap_mode is None or _np.prod(shape) == 0:
+                file.seek(offset)
+                count = int(_np.prod(shape))
+                arrays[name] = _np.fromfile(file, dtype=dtype, count=count).reshape(shape)
+            else:
+                arrays[name] = _np.memmap(filename, dtype=dtype, mode=mmap_mode,
+                    offset=offset, shape=shape)
+    return arrays
+
+
+class CSRAdjacency():
+    """The adjacency structure of a :class:`Graph` in "compressed sparse row"
+    form.  Usually accessed via :attr:`Graph.csr`, which caches an instance.
+    Vertices are labelled `0, ..., n-1` in the order of :attr:`keys` (sorted,
+    if the keys can be sorted), and the (directed) neighbours of vertex `i`
+    are `neighbours[indptr[i] : indptr[i+1]]`, in increasing order, reached
+    along the edges `edge_indices[indptr[i] : indptr[i+1]]` of length
+    `weights[...]`.  If the graph has no lengths, then each edge has length 1.
+    The same slice of :attr:`incident_edges` gives the incident edges in
+    increasing order.
+
+    All arrays are read-only, and the class is immutable.
+
+    :param graph: Instance of :class:`Graph`
+    """
+    def __init__(self, graph):
+        try:
+            self._keys = sorted(graph.vertices)
+        except TypeError:
+            self._keys = list(graph.vertices)
+        self._identity_keys = all(type(k) is int for k in self._keys) and (
+            len(self._keys) == 0 or
+            (self._keys[0] == 0 and self._keys[-1] == len(self._keys) - 1))
+        self._key_index = {k:i for i, k in enumerate(self._keys)}
+        n, m = len(self._keys), graph.number_edges
+        if self._identity_keys:
+            ends = _np.asarray(graph.edges, dtype=_np.int64).reshape((m, 2)).T.copy()
+        else:
+            ends = _np.empty((2, m), dtype=_np.int64)
+            for i, (k1, k2) in enumerate(graph.edges):
+                ends[0, i] = self._key_index[k1]
+                ends[1, i] = self._key_index[k2]
+        if graph.lengths is None:
+            lengths = _np.ones(m)
+        else:
+            lengths = _np.asarray(graph.lengths, dtype=_np.float64)
+        self._coords = None
+        if isinstance(graph.vertices, dict):
+            self._coords = _np.asarray([graph.vertices[k] for k in self._keys],
+                dtype=_np.float64).reshape((n, 2)).T.copy()
+        self._build(n, ends, lengths)
+
+    def _build(self, n, ends, lengths):
+        m = ends.shape[1]
+        sources = _np.concatenate([ends[0], ends[1]])
+        targets = _np.concatenate([ends[1], ends[0]])
+        edge_indices = _np.concatenate([_np.arange(m), _np.arange(m)])
+        order = _np.lexsort((targets, sources))
+        self._indptr = _np.zeros(n + 1, dtype=_np.int64)
+        _np.cumsum(_np.bincount(sources, minlength=n), out=self._indptr[1:])
+        self._neighbours = targets[order]
+        self._edge_indices = edge_indices[order]
+        self._weights = _np.concatenate([lengths, lengths])[order]
+        self._incident_edges = edge_indices[_np.lexsort((edge_indices, sources))]
+        self._edge_vertices = ends
+        self._lengths = lengths
+        for array in [self._indptr, self._neighbours, self._edge_indices,
+                self._weights, self._incident_edges, self._edge_vertices,
+                self._lengths, self._coords]:
+            if array is not None:
+                array.setflags(write=False)
+        self._lists = None
+        self._incidence = None
+
+    @property
+    def keys(self):
+        """List of vertex keys, giving the labelling of vertices."""
+        return self._keys
+
+    def index_of(self, key):
+        """The label of the vertex with the given key."""
+        return self._key_index[key]
+
+    def indices_of(self, keys, missing=None):
+        """Array of the labels of the vertices with the given keys.
+
+        :param missing: If `None` then raise `KeyError` on an unknown key,
+          otherwise use this value as the label of unknown keys.
+        """
+        if self._identity_keys:
+            keys = _np.asarray(keys)
+            labels = keys.astype(_np.int64)
+            bad = (labels < 0) | (labels >= len(self._keys)) | (labels != keys)
+            if _np.any(bad):
+                if missing is None:
+                    raise KeyError(keys)
+                labels[bad] = missing
+            return labels
+        if missing is None:
+            return _np.asarray([self._key_index[k] for k in keys], dtype=_np.int64)
+        return _np.asarray([self._key_index.get(k, missing) for k in keys], dtype=_np.int64)
+
+    @property
+    def number_vertices(self):
+        return len(self._keys)
+
+    @property
+    def number_edges(self):
+        return self._edge_vertices.shape[1]
+
+    @property
+    def indptr(self):
+        return self._indptr
+
+    @property
+    def neighbours(self):
+        return self._neighbours
+
+    @property
+    def edge_indices(self):
+        return self._edge_indices
+
+    @property
+    def weights(self):
+        return self._weights
+
+    @property
+    def incident_edges(self):
+        return self._incident_edges
+
+    @property
+    def edge_vertices(self):
+        """Array of shape `(2, number_edges)` giving the labels of the
+        vertices of each edge, in the order of :attr:`Graph.edges`."""
+        return self._edge_vertices
+
+    @property
+    def lengths(self):
+        """Array of the length of each edge."""
+        return self._lengths
+
+    @property
+    def coords(self):
+        """For a :class:`PlanarGraph`, array of shape `(2, number_vertices)` of
+        the coordinates of each vertex.  Otherwise `None`."""
+        return self._coords
+
+    def degrees(self, labels=None):
+        """Array of the degree of each vertex, or of the vertices with the
+        given labels."""
+        degrees = _np.diff(self._indptr)
+        if labels is None:
+            return degrees
+        return degrees[labels]
+
+    def degree(self, label):
+        return int(self._indptr[label + 1] - self._indptr[label])
+
+    def neighbours_of(self, label):
+        """Array of the labels of the neighbours of the vertex."""
+        return self._neighbours[self._indptr[label] : self._indptr[label + 1]]
+
+    def incident_edges_of(self, label):
+        """Array of the indices of the edges incident with the vertex, in
+        increasing order."""
+        return self._incident_edges[self._indptr[label] : self._indptr[label + 1]]
+
+    def other_ends(self, edge_indices, labels):
+        """For each edge in `edge_indices`, which is incident with the vertex
+        with the corresponding label in `labels`, the label of the vertex at
+        the other end of the edge."""
+        ends = self._edge_vertices[:, edge_indices]
+        return ends[0] + ends[1] - labels
+
+    def find_edge(self, label1, label2):
+        """Find the edge between the vertices, raising `KeyError` if there is
+        none.
+
+        :return: `(index, order)` as :meth:`Graph.find_edge`.
+        """
+        start, end = self._indptr[label1], self._indptr[label1 + 1]
+        i = start + _np.searchsorted(self._neighbours[start:end], label2)
+        if i == end or self._neighbours[i] != label2:
+            raise KeyError((self._keys[label1], self._keys[label2]))
+        index = int(self._edge_indices[i])
+        return index, (1 if self._edge_vertices[0, index] == label1 else -1)
+
+    def find_edges(self, labels1, labels2):
+        """Vectorised version of :meth:`find_edge`.  Vertex pairs which are not
+        joined by an edge (or where either label is `-1`) are given an index
+        of `-1` and an order of `0`.
+
+        :return: `(indices, orders)` a pair of arrays.
+        """
+        labels1 = _np.asarray(labels1, dtype=_np.int64)
+        labels2 = _np.asarray(labels2, dtype=_np.int64)
+        n = self.number_vertices
+        # Neighbours are sorted within each row, so these codes are sorted
+        codes = _np.repeat(_np.arange(n, dtype=_np.int64), self.degrees()) * n + self._neighbours
+        queries = labels1 * n + labels2
+        i = _np.searchsorted(codes, queries)
+        found = (labels1 >= 0) & (labels2 >= 0) & (i < len(codes))
+        found[found] = codes[i[found]] == queries[found]
+        indices = _np.full(len(queries), -1, dtype=_np.int64)
+        indices[found] = self._edge_indices[i[found]]
+        orders = _np.zeros(len(queries), dtype=_np.int64)
+        orders[found] = _np.where(self._edge_vertices[0, indices[found]] == labels1[found], 1, -1)
+        return indices, orders
+
+    def to_sparse_matrix(self):
+        """A :class:`scipy.sparse.csr_matrix` of edge lengths."""
+        import scipy.sparse as _sparse
+        n = self.number_vertices
+        return _sparse.csr_matrix((self._weights, self._neighbours, self._indptr),
+            shape=(n, n))
+
+    def to_graph(self):
+        """Construct a :class:`Graph` with integer keys given by the labels
+        used here."""
+        return Graph(range(self.number_vertices), self._edge_vertices.T.tolist(),
+            self._lengths)
+
+    def to_planar_graph(self):
+        """Construct a :class:`PlanarGraph` with integer keys given by the
+        labels used here.  Only possible if :attr:`coords` is set."""
+        if self._coords is None:
+            raise ValueError("No vertex coordinates")
+        vertices = zip(range(self.number_vertices), *self._coords.tolist())
+        return PlanarGraph(vertices, self._edge_vertices.T.tolist())
+
+    @staticmethod
+    def from_arrays(xcoords, ycoords, edges):
+        """Construct directly from arrays, without an intermediate
+        :class:`PlanarGraph`.  Vertices are labelled by their index into the
+        coordinate arrays, and are also the keys.
+
+        :param xcoords: Array of x coordinates of vertices.
+        :param ycoords: Array of y coordinates of vertices.
+        :param edges: Array of shape `(number_edges, 2)` of pairs of vertex
+          indices.
+        """
+        adjacency = CSRAdjacency.__new__(CSRAdjacency)
+        n = len(xcoords)
+        adjacency._keys = list(range(n))
+        adjacency._identity_keys = True
+        adjacency._key_index = _IdentityDict(n)
+        adjacency._coords = _np.vstack([_np.asarray(xcoords, dtype=_np.float64),
+                                        _np.asarray(ycoords, dtype=_np.float64)])
+        ends = _np.asarray(edges, dtype=_np.int64).reshape((-1, 2)).T.copy()
+        xy = adjacency._coords[:, ends]
+        lengths = _np.sqrt(_np.sum((xy[:,0] - xy[:,1])**2, axis=0))
+        adjacency._build(n, ends, lengths)
+        return adjacency
+
+    @staticmethod
+    def _from_stored(keys, arrays):
+        """Construct from the arrays saved by :meth:`PlanarGraph.dump_binary`
+        without any recomputation."""
+        adjacency = CSRAdjacency.__new__(CSRAdjacency)
+        n = len(keys)
+        adjacency._keys = keys
+        adjacency._identity_keys = n == 0 or (keys[0] == 0 and keys[-1] == n - 1)
+        if adjacency._identity_keys:
+            adjacency._key_index = _IdentityDict(n)
+        else:
+            adjacency._key_index = {k:i for i, k in enumerate(keys)}
+        adjacency._coords = arrays["coords"]
+        adjacency._indptr = arrays["indptr"]
+        adjacency._neighbours = arrays["neighbours"]
+        adjacency._edge_indices = arrays["edge_indices"]
+        adjacency._weights = arrays["weights"]
+        adjacency._incident_edges = arrays["incident_edges"]
+        adjacency._lengths = arrays["lengths"]
+        adjacency._edge_vertices = arrays["edge_vertices"]
+        adjacency._lists = None
+        adjacency._incidence = None
+        return adjacency
+
+    def _as_lists(self):
+        # Python lists are much faster than arrays in the inner loop of
+        # Dijkstra's algorithm
+        if self._lists is None:
+            self._lists = (self._indptr.tolist(), self._neighbours.tolist(),
+                           self._weights.tolist())
+        return self._lists
+
+    def _incidence_lists(self):
+        # As above, for walking edge by edge
+        if self._incidence is None:
+            self._incidence = (self._indptr.tolist(), self._incident_edges.tolist(),
+                self._edge_vertices.T.tolist(), self._lengths.tolist())
+        return self._incidence
+
+
+class _IdentityDict():
+    """Maps `i` to `i` for `0 <= i < n`, without storage."""
+    def __init__(self, n):
+        self._n = n
+
+    def __getitem__(self, key):
+        try:
+            index = _operator.index(key)
+        except TypeError:
+            raise KeyError(key)
+        if index < 0 or index >= self._n:
+            raise KeyError(key)
+        return index
+
+
+def dijkstra(adjacency, sources, source_distances=None, max_length=None):
+    """Dijkstra's algorithm, using a binary heap, on a :class:`CSRAdjacency`
+    instance.  Runs in time `O((V + E) log V)`.
+
+    Ties are broken deterministically: vertices at equal distance are visited
+    in increasing index order, and the previous vertex of `u` is the first
+    visited vertex giving the shortest distance to `u`.  This need not be the
+    choice made by the (set based) implementation in earlier versions, so
+    when shortest paths are not unique, `prevs`, and anything derived from
+    it, can differ from earlier versions.
+
+    :param adjacency: Instance of :class:`CSRAdjacency`
+    :param sources: Iterable of vertex labels to start from.
+    :param source_distances: Optional iterable of initial distances of each
+      of the `sources`; defaults to 0.
+    :param max_length: If not `None`, do not explore beyond this distance.
+      Vertices further away are treated as not being connected.
+
+    :return: `(distances, prevs, order)` where `distances` is an array of
+      the distance to each vertex (`inf` if not connected), `prevs` is an
+      array giving the previous vertex label in the shortest path (a source
+      is its own previous vertex, and `-1` means not connected), and `order`
+      is an array of the vertex labels, in the order they were visited.
+    """
+    indptr, neighbours, weights = adjacency._as_lists()
+    n = adjacency.number_vertices
+    inf = float("inf")
+    cutoff = inf if max_length is None else max_length
+    dist = [inf] * n
+    prevs = [-1] * n
+    done = bytearray(n)
+    order = []
+    if source_distances is None:
+        source_distances = [0.0] * len(sources)
+    heap = []
+    for v, d in zip(sources, source_distances):
+        if d <= cutoff and d < dist[v]:
+            dist[v] = d
+            prevs[v] = v
+            heap.append((d, v))
+    _heapq.heapify(heap)
+    while heap:
+        d, v = _heapq.heappop(heap)
+        if done[v]:
+            continue
+        done[v] = 1
+        order.append(v)
+        for j in range(indptr[v], indptr[v+1]):
+            u = neighbours[j]
+            nd = d + weights[j]
+            if nd < dist[u] and nd <= cutoff:
+                dist[u] = nd
+                prevs[u] = v
+                _heapq.heappush(heap, (nd, u))
+    return _np.asarray(dist), _np.asarray(prevs, dtype=_np.int64), _np.asarray(order, dtype=_np.int64)
+
+def shortest_paths_batch(graph, vertex_keys, max_length=None):
+    """Find the shortest paths from each of many vertices to all other
+    vertices, building the adjacency structure only once.
+
+    :param graph: :class:`Graph` to use
+    :param vertex_keys: Iterable of keys of vertices to start from.
+    :param max_length: If not `None`, do not explore beyond this distance.
+
+    :return: `(keys, distances, prevs)` where `keys` is a list giving the
+      ordering of the vertices, `distances` is an array of shape
+      `(len(vertex_keys), len(keys))` giving distances (`-1` if not
+      connected) and `prevs` is an array of the same shape giving the index
+      into `keys` of the previous vertex in the path (`-1` if not connected).
+    """
+    adjacency = graph.csr
+    vertex_keys = list(vertex_keys)
+    distances = _np.empty((len(vertex_keys), adjacency.number_vertices))
+    prevs = _np.empty((len(vertex_keys), adjacency.number_vertices), dtype=_np.int64)
+    for row, key in enumerate(vertex_keys):
+        dist, prev, _ = dijkstra(adjacency, [adjacency.index_of(key)], max_length=max_length)
+        dist[prev == -1] = -1
+        distances[row], prevs[row] = dist, prev
+    return adjacency.keys, distances, prevs
+
+def shortest_paths(graph, vertex_key, max_length=None):
     """Uses Dijkstra's algorithm to find the shortest path from
     `vertex_key` to all other vertices.  If we have no lengths, then each
     edge has length 1.
+
+    :param max_length: If not `None`, do not explore beyond this distance.
+      Vertices further away are treated as not being connected.
     
     :return: `(lengths, prevs)` where `lengths` is a dictionary from key
         to length.  A length of -1 means that the vertex is not connected to
         `vertex_key`.  `prevs` is a dictionary from key to key, giving for
         each vertex the previous vertex in the path from `vertex_key` to that
         vertex.  Working backwards, you can hence construct all shortest
-        paths.
+        paths.  Where several shortest paths exist, the choice is made as
+        described in :func:`dijkstra`.
     """
-    shortest_length = { k : -1 for k in graph.vertices }
-    shortest_length[vertex_key] = 0
-    candidates = {vertex_key}
-    done = set()
-    prevs = {vertex_key:vertex_key}
-    while len(candidates) > 0:
-        next_vertex, min_dist = None, -1
-        for v in candidates:
-            dist = shortest_length[v]
-            if min_dist == -1 or dist < min_dist:
-                min_dist = dist
-                next_vertex = v
-        candidates.discard(next_vertex)
-        done.add(next_vertex)
-
-        for v in graph.neighbours(next_vertex):
-            edge_index, _ = graph.find_edge(next_vertex, v)
-            dist = min_dist + graph.length(edge_index)
-            current_dist = shortest_length[v]
-            if current_dist == -1 or current_dist > dist:
-                shortest_length[v] = dist
-                prevs[v] = next_vertex
-            if v not in done:
-                candidates.add(v)
-
-    return shortest_length, prevs
-
-def shortest_edge_paths(graph, edge_index, position=0.5):
+    adjacency = graph.csr
+    dist, prevs, order = dijkstra(adjacency, [adjacency.index_of(vertex_key)],
+        max_length=max_length)
+    keys = adjacency.keys
+    shortest_length = { k : -1 for k in keys }
+    for v in order:
+        shortest_length[keys[v]] = dist[v]
+    return shortest_length, {keys[v] : keys[prevs[v]] for v in order}
+
+def _shortest_from_edge(adjacency, graph, edge_index, position, max_length):
+    v1, v2 = adjacency.edge_vertices[:, edge_index]
+    length = 1.0 if graph.lengths is None else graph.lengths[edge_index]
+    return dijkstra(adjacency, [v1, v2], [length * position, length * (1 - position)],
+        max_length=max_length)
+
+def shortest_edge_paths(graph, edge_index, position=0.5, max_length=None):
     """Find the shortest path from the edge given
     by `edge_index`.  If we have no lengths, then each edge has length 1.
     This could be achieved by using the "derived graph", but our use will also
     require knowing the _vertex_ degree of the path.
 
     We use a simple modification of Dijkstra's algorithm whereby the initial
-    distance to 
+    distance to each end of the edge is the distance from `position`.
     
     :param graph: :class:`Graph` to use
     :param edge_index: The edge to start on
     :param position: `0 <= t <= 1` along the edge to start at.  Defaults
       to the midpoint.
+    :param max_length: If not `None`, do not explore beyond this distance.
+      Vertices further away are treated as not being connected.
 
     :return: `(lengths, prevs)` where `lengths` is a dictionary from key
         to length.  If a key is not present, it means that vertex is not
@@ -1152,95 +2017,201 @@ def shortest_edge_paths(graph, edge_index, position=0.5):
         giving for each vertex the previous vertex in the path from
         `vertex_key` to that vertex.  Working backwards, you can hence
         construct all shortest paths.  These paths will end at either vertex
-        of the initial edge.
+        of the initial edge.  Where several shortest paths exist, the choice
+        is made as described in :func:`dijkstra`.
     """
-    shortest_length = dict()
-    v1, v2 = graph.edges[edge_index]
-    shortest_length[v1] = graph.length(edge_index) * position
-    shortest_length[v2] = graph.length(edge_index) * (1 - position)
-    candidates = {v1, v2}
-    done = set()
-    prevs = {v1:v1, v2:v2}
-    while len(candidates) > 0:
-        next_vertex, min_dist = None, -1
-        for v in candidates:
-            dist = shortest_length[v]
-            if min_dist == -1 or dist < min_dist:
-                min_dist = dist
-                next_vertex = v
-        candidates.discard(next_vertex)
-        done.add(next_vertex)
-
-        for v in graph.neighbours(next_vertex):
-            edge_index, _ = graph.find_edge(next_vertex, v)
-            dist = min_dist + graph.length(edge_index)
-            if v not in shortest_length or shortest_length[v] > dist:
-                shortest_length[v] = dist
-                prevs[v] = next_vertex
-            if v not in done:
-                candidates.add(v)
-
-    return shortest_length, prevs
-
-def shortest_edge_paths_with_degrees(graph, edge_index):
+    adjacency = graph.csr
+    dist, prevs, order = _shortest_from_edge(adjacency, graph, edge_index,
+        position, max_length)
+    keys = adjacency.keys
+    shortest_length = {keys[v] : dist[v] for v in order}
+    return shortest_length, {keys[v] : keys[prevs[v]] for v in order}
+
+def _cumulative_degrees(adjacency, prevs, order):
+    """Product of `max(1, degree - 1)` along each shortest path."""
+    factors = _np.maximum(1, adjacency.degrees() - 1).tolist()
+    prevs = prevs.tolist()
+    degrees = [1] * adjacency.number_vertices
+    for v in order.tolist():
+        p = prevs[v]
+        degrees[v] = factors[v] if p == v else degrees[p] * factors[v]
+    return _np.asarray(degrees, dtype=_np.float64)
+
+def shortest_edge_paths_with_degrees(graph, edge_index, max_length=None):
     """Find the shortest paths between the middle of the `edge_index` to each
     other edge.  Also computes the "cumulative degree" of each path: that is,
     the product of `max(1, degree - 1)` over each vertex in the path.
 
+    :param max_length: If not `None`, do not explore beyond this distance from
+      the middle of `edge_index`.  Edges neither of whose vertices are within
+      this distance are treated as disconnected.
+
     :return: `(distances, degrees)` where `distances` is an array corresponding
       to `graph.edges`, as is `degrees`.  Edges which are disconnected from
-      `edge_index` will have `degress == 1` and `distances == -1`.
+      `edge_index` will have `degress == 1` and `distances == -1`.  Where
+      several shortest paths exist, the degree is that of the path chosen as
+      described in :func:`dijkstra`, and so can differ from earlier versions.
     """
-    shortest_length = dict()
-    v1, v2 = graph.edges[edge_index]
-    shortest_length[v1] = graph.length(edge_index) * 0.5
-    shortest_length[v2] = shortest_length[v1]
-    candidates = {v1, v2}
-    done = set()
-    degrees = dict()
-    degrees[v1] = max(1, graph.degree(v1) - 1)
-    degrees[v2] = max(1, graph.degree(v2) - 1)
-    while len(candidates) > 0:
-        next_vertex, min_dist = None, -1
-        for v in candidates:
-            dist = shortest_length[v]
-            if min_dist == -1 or dist < min_dist:
-                min_dist = dist
-                next_vertex = v
-        candidates.discard(next_vertex)
-        done.add(next_vertex)
-
-        for v in graph.neighbours(next_vertex):
-            i, _ = graph.find_edge(next_vertex, v)
-            dist = min_dist + graph.length(i)
-            if v not in shortest_length or shortest_length[v] > dist:
-                shortest_length[v] = dist
-                degrees[v] = degrees[next_vertex] * max(1, graph.degree(v) - 1)
-            if v not in done:
-                candidates.add(v)
-
-    distances = _np.empty(graph.number_edges)
-    cum_degrees = _np.empty(graph.number_edges)
-    for i in range(graph.number_edges):
-        if i == edge_index:
-            distances[i] = 0
-            cum_degrees[i] = 1
+    adjacency = graph.csr
+    return _edge_distances_with_degrees(adjacency, graph, edge_index, max_length)
+
+def _edge_distances_with_degrees(adjacency, graph, edge_index, max_length):
+    dist, prevs, order = _shortest_from_edge(adjacency, graph, edge_index, 0.5, max_length)
+    vertex_degrees = _cumulative_degrees(adjacency, prevs, order)
+    k1, k2 = adjacency.edge_vertices
+    le1, le2 = dist[k1], dist[k2]
+    use_first = le1 < le2
+    nearest = _np.where(use_first, le1, le2)
+    lengths = _np.ones(graph.number_edges) if graph.lengths is None else graph.lengths
+    distances = nearest + lengths * 0.5
+    cum_degrees = _np.where(use_first, vertex_degrees[k1], vertex_degrees[k2])
+    disconnected = ~_np.isfinite(nearest)
+    distances[disconnected] = -1
+    cum_degrees[disconnected] = 1
+    distances[edge_index] = 0
+    cum_degrees[edge_index] = 1
+    return distances, cum_degrees
+
+def shortest_edge_paths_with_degrees_batch(graph, edge_indices, max_length=None):
+    """As :func:`shortest_edge_paths_with_degrees` but for many starting
+    edges, building the adjacency structure only once.
+
+    :return: `(distances, degrees)` arrays of shape
+      `(len(edge_indices), number_edges)`.
+    """
+    adjacency = graph.csr
+    edge_indices = list(edge_indices)
+    distances = _np.empty((len(edge_indices), graph.number_edges))
+    degrees = _np.empty((len(edge_indices), graph.number_edges))
+    for row, edge_index in enumerate(edge_indices):
+        distances[row], degrees[row] = _edge_distances_with_degrees(adjacency,
+            graph, edge_index, max_length)
+    return distances, degrees
+
+def walk_with_degrees_bounded(graph, start_key, initial_avoid_key, max_length,
+        max_degree, tolerance=None, tail_mass=None, min_weight=0):
+    """As :meth:`Graph.walk_with_degrees` but returns arrays, and can avoid
+    re-exploring equivalent parts of the search tree.
+
+    Two partial walks are "equivalent" if they have just walked the same
+    directed edge, have the same cumulative degree product, have the same
+    length (up to `tolerance`) and have visited the same vertices, _amongst
+    those vertices which could still be reached_.  For a
+    :class:`PlanarGraph` we bound the reachable vertices using Euclidean
+    distance, and so on a grid-like network many walks are equivalent.  The
+    results of the first such walk are copied, not recomputed.  With
+    `tolerance=0` or `None` the output is identical, row for row, to that of
+    :meth:`Graph.walk_with_degrees`.  Checking for equivalence has a cost, and
+    on networks where few walks collapse (including simple grids) it is
+    faster to leave `tolerance` as `None`.
+
+    The current walk is held in a stack of vertices, and not as copies of
+    sets of visited vertices.
+
+    :param tolerance: Walk lengths are deemed equal if they agree to within
+      this (absolute) distance.  If `None` (the default) then never collapse
+      walks.
+    :param tail_mass: Optional function of the length walked, returning an
+      upper bound for the total weight which can be assigned at or beyond
+      this length.  Typically the integral of the kernel from this length.
+    :param min_weight: If `tail_mass` is given, then stop exploring a walk
+      once `tail_mass(length) / degree` falls below this.  Only checked as a
+      walk leaves a junction, as this is where the degree grows.
+
+    :return: Tuple `(edges, previous_lengths, current_lengths, degrees)` of
+      arrays, one entry for each value which :meth:`Graph.walk_with_degrees`
+      would yield.  The first entry is always `(-1, 0, 0, 1)`.
+    """
+    csr = graph.csr
+    indptr, incident, ends, lengths = graph._walk_lists()
+    start = csr.index_of(start_key)
+    try:
+        avoid = csr.index_of(initial_avoid_key)
+    except KeyError:
+        avoid = None
+    coords = csr.coords
+    if coords is not None:
+        xcs, ycs = coords.tolist()
+        # A walk can touch vertices at most one edge beyond its length
+        reach = max_length + (max(lengths) if len(lengths) > 0 else 0)
+    truncate = tail_mass is not None and min_weight > 0
+
+    out_edges, out_start, out_end, out_degree = [-1], [0], [0], [1]
+    # The stack of states to explore: `(depth, edge, length, degree)`
+    stack = []
+    for i in incident[indptr[start] : indptr[start+1]]:
+        k1, k2 = ends[i]
+        if k1 + k2 - start != avoid:
+            stack.append((0, i, 0, 1))
+    path, on_path = [start], [False] * csr.number_vertices
+    on_path[start] = True
+    memo, open_records = dict(), []
+
+    while len(stack) > 0:
+        while len(open_records) > 0 and len(stack) <= open_records[-1][2]:
+            key, first, _ = open_records.pop()
+            memo[key] = (first, len(out_edges))
+        depth, edge_index, old_length, total_degree = stack.pop()
+        while len(path) > depth + 1:
+            on_path[path.pop()] = False
+        old_vertex = path[-1]
+        k1, k2 = ends[edge_index]
+        new_vertex = k1 + k2 - old_vertex
+        new_length = old_length + lengths[edge_index]
+        fact = indptr[old_vertex + 1] - indptr[old_vertex] - 1
+        new_total_degree = total_degree
+        if fact > 0:
+            new_total_degree *= fact
+        if new_total_degree > max_degree:
             continue
-        k1, k2 = graph.edges[i]
-        le = graph.length(i) * 0.5
-        if k1 not in shortest_length:
-            distances[i] = -1
-            cum_degrees[i] = 1
+        if truncate and fact > 1 and tail_mass(old_length) / new_total_degree < min_weight:
             continue
-        le1, le2 = shortest_length[k1], shortest_length[k2]
-        if le1 < le2:
-            distances[i] = le1 + le
-            cum_degrees[i] = degrees[k1]
-        else:
-            target = k2
-            distances[i] = le2 + le
-            cum_degrees[i] = degrees[k2]
-    return distances, cum_degrees
+        if new_length >= max_length:
+            out_edges.append(edge_index)
+            out_start.append(old_length)
+            out_end.append(new_length)
+            out_degree.append(new_total_degree)
+            continue
+
+        # Only walks arriving at a junction are worth collapsing
+        if tolerance is not None and indptr[new_vertex + 1] - indptr[new_vertex] > 2:
+            if coords is None:
+                relevant = frozenset(path)
+            else:
+                bound = (reach - new_length) * (1 + 1e-9)
+                bound *= bound
+                x, y = xcs[new_vertex], ycs[new_vertex]
+                relevant = frozenset(u for u in path
+                    if (xcs[u] - x)**2 + (ycs[u] - y)**2 <= bound)
+            rounded = old_length if tolerance == 0 else round(old_length / tolerance)
+            key = (edge_index, old_vertex, new_total_degree, rounded, relevant)
+            if key in memo:
+                first, last = memo[key]
+                out_edges.extend(out_edges[first:last])
+                out_degree.extend(out_degree[first:last])
+                delta = old_length - out_start[first]
+                if delta == 0:
+                    out_start.extend(out_start[first:last])
+                    out_end.extend(out_end[first:last])
+                else:
+                    out_start.extend(x + delta for x in out_start[first:last])
+                    out_end.extend(x + delta for x in out_end[first:last])
+                continue
+            open_records.append((key, len(out_edges), len(stack)))
+
+        out_edges.append(edge_index)
+        out_start.append(old_length)
+        out_end.append(new_length)
+        out_degree.append(new_total_degree)
+        path.append(new_vertex)
+        on_path[new_vertex] = True
+        for i in incident[indptr[new_vertex] : indptr[new_vertex+1]]:
+            k1, k2 = ends[i]
+            if not on_path[k1 + k2 - new_vertex]:
+                stack.append((depth + 1, i, new_length, new_total_degree))
+
+    return (_np.asarray(out_edges, dtype=_np.int64), _np.asarray(out_start, dtype=_np.float64),
+        _np.asarray(out_end, dtype=_np.float64), _np.asarray(out_degree, dtype=_np.float64))
 
 def segment_graph(graph):
     """Partition the edges of a graph into "segments", where a segment is a
@@ -1319,17 +2290,11 @@ def connected_components(graph):
     
     :return: Generated sets of maximally connected vertices.
     """
-    done = set()
-    for v in graph.vertices:
-        if v in done:
-            continue
-        com = set()
-        todo = [v]
-        while len(todo) > 0:
-            next_v = todo.pop()
-            if next_v in com:
-                continue
-            com.add(next_v)
-            todo.extend(graph.neighbours(next_v))
-        done.update(com)
-        yield com
+    import scipy.sparse.csgraph as _csgraph
+    csr = graph.csr
+    number, labels = _csgraph.connected_components(csr.to_sparse_matrix(), directed=False)
+    order = _np.argsort(labels, kind="mergesort")
+    splits = _np.searchsorted(labels[order], _np.arange(1, number))
+    keys = csr.keys
+    for component in _np.split(order, splits):
+        yield {keys[i] for i in component.tolist()}
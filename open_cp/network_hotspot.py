@@ -21,6 +21,10 @@ import numpy as _np
 from scipy import ndimage as _ndimage
 import logging as _logging
 import datetime as _datetime
+import collections as _collections
+import hashlib as _hashlib
+import os as _os
+import tempfile as _tempfile
 
 _logger = _logging.getLogger(__name__)
 
@@ -199,6 +203,8 @@ class Predictor():
         self.time_kernel_unit = _np.timedelta64(1, "D")
         self.time_kernel = None
         self.kernel = None
+        self.walk_tolerance = None
+        self.walk_min_weight = 0
 
     @property
     def network_timed_points(self):
@@ -235,7 +241,30 @@ class Predictor():
     @kernel.setter
     def kernel(self, v):
         self._kernel = v
-        
+
+    @property
+    def walk_tolerance(self):
+        """Walks out from an event which agree in length to within this
+        distance, and are otherwise equivalent, are only explored once.  See
+        :func:`network.walk_with_degrees_bounded`.  Defaults to `None`, which
+        disables this; 0 collapses only exactly equivalent walks."""
+        return self._walk_tolerance
+
+    @walk_tolerance.setter
+    def walk_tolerance(self, v):
+        self._walk_tolerance = v
+
+    @property
+    def walk_min_weight(self):
+        """Stop walking out from an event once the weight which could still be
+        added to the risk falls below this.  Defaults to 0, which gives exact
+        results."""
+        return self._walk_min_weight
+
+    @walk_min_weight.setter
+    def walk_min_weight(self, v):
+        self._walk_min_weight = v
+
     def add(self, risks, edge, orient, offset, time_weight=1):
         """Internal use: add to the risks from all paths.
 
@@ -249,12 +278,18 @@ class Predictor():
         if orient == 1:
             start_key, avoid_key = avoid_key, start_key
         offset = (1.0 - offset) * self.graph.length(edge)
-        for index, start_length, end_length, degree in self.graph.walk_with_degrees(start_key, avoid_key, self.kernel.cutoff, 20000):
-            if index is None or index == -1:
-                a, b = 0, offset
-                index = edge
-            else:
-                a, b = start_length + offset, end_length + offset
+        tail_mass = None
+        if self.walk_min_weight > 0:
+            cutoff = self.kernel.cutoff
+            tail_mass = lambda s : self.kernel.integrate(s + offset, cutoff) * time_weight
+        indices, starts, ends, degrees = network.walk_with_degrees_bounded(
+            self.graph, start_key, avoid_key, self.kernel.cutoff, 20000,
+            self.walk_tolerance, tail_mass, self.walk_min_weight)
+        indices[0] = edge
+        starts, ends = starts + offset, ends + offset
+        starts[0], ends[0] = 0, offset
+        for index, a, b, degree in zip(indices.tolist(), starts.tolist(),
+                ends.tolist(), degrees.tolist()):
             if a >= self.kernel.cutoff:
                 continue
             risks[index] += self.kernel.integrate(a, b) * time_weight / degree
@@ -270,6 +305,28 @@ class Predictor():
         self.add(risks, edge_index, 1, dist, tw)
         self.add(risks, edge_index, -1, 1.0 - dist, tw)
 
+    def _weighted_events(self, predict_time, cutoff_time):
+        """The events between `cutoff_time` and `predict_time`, and their
+        time weights."""
+        data = self.network_timed_points.time_window(cutoff_time, predict_time)
+        if predict_time is None:
+            predict_time = self.network_timed_points.time_range[1]
+        predict_time = _np.datetime64(predict_time)
+
+        times = (predict_time - data.timestamps) / self.time_kernel_unit
+        return data, self.time_kernel(times)
+
+    def _event_edges(self, data):
+        """Arrays `(edges, orients)` of the edge each event lies on, as
+        :meth:`network.Graph.find_edge`, looked up in one go."""
+        csr = self.graph.csr
+        edges, orients = csr.find_edges(csr.indices_of(data.start_keys),
+            csr.indices_of(data.end_keys))
+        if _np.any(edges == -1):
+            i = _np.nonzero(edges == -1)[0][0]
+            raise KeyError((data.start_keys[i], data.end_keys[i]))
+        return edges, orients
+
     def predict(self, predict_time=None, cutoff_time=None):
         """Make a prediction.
 
@@ -279,27 +336,13 @@ class Predictor():
         :param cutoff_time: Use only events after this time.  If `None` then use
           all events from the start of the input data.
         """
-        if cutoff_time is None:
-            cutoff_time = self.network_timed_points.time_range[0]
-        cutoff_time = _np.datetime64(cutoff_time)
-        mask = (self.network_timed_points.timestamps >= cutoff_time)
-        if predict_time is not None:
-            predict_time = _np.datetime64(predict_time)
-            mask &= (self.network_timed_points.timestamps < predict_time)
-        else:
-            predict_time = self.network_timed_points.time_range[1]
-        data = self.network_timed_points[mask]
-
-        times = (predict_time - data.timestamps) / self.time_kernel_unit
-        time_weights = self.time_kernel(times)
+        data, time_weights = self._weighted_events(predict_time, cutoff_time)
         risks = _np.zeros(len(self.graph.edges))
-        _logger.debug("Making prediction with %s events using %s/%s", len(times), self.kernel, self.time_kernel)
-        progress = _logger_mod.ProgressLogger(len(times), _datetime.timedelta(minutes=2), _logger)
-        for tw, key1, key2, dist in zip(time_weights, data.start_keys,
-                data.end_keys, data.distances):
-            edge_index, orient = self.graph.find_edge(key1, key2)
-            if orient == -1:
-                dist = 1.0 - dist
+        _logger.debug("Making prediction with %s events using %s/%s", len(time_weights), self.kernel, self.time_kernel)
+        progress = _logger_mod.ProgressLogger(len(time_weights), _datetime.timedelta(minutes=2), _logger)
+        edges, orients = self._event_edges(data)
+        dists = _np.where(orients == -1, 1.0 - data.distances, data.distances)
+        for tw, edge_index, dist in zip(time_weights, edges.tolist(), dists.tolist()):
             self.add_edge(risks, edge_index, dist, tw)
             progress.increase_count()
         risks /= self.graph.lengths
@@ -307,6 +350,128 @@ class Predictor():
         return Result(self.graph, risks)
 
 
+class LRUCache():
+    """A dictionary-like cache holding at most `max_size` entries, discarding
+    the least recently used entry when full.  Counts "hits" and "misses".
+
+    :param max_size: The maximum number of entries, or `None` for no limit.
+    """
+    def __init__(self, max_size=None):
+        if max_size is not None and max_size < 1:
+            raise ValueError("Maximum size must be positive")
+        self._max_size = max_size
+        self._data = _collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    def get(self, key, compute):
+        """Return the entry for `key`, calling `compute()` and storing the
+        result if there is no such entry."""
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            value = compute()
+            self[key] = value
+            return value
+        self.hits += 1
+        self._data.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if self._max_size is not None:
+            while len(self._data) > self._max_size:
+                self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        """Remove all entries, but do not reset the statistics."""
+        self._data.clear()
+
+    def __repr__(self):
+        return "LRUCache(size={}/{}, hits={}, misses={})".format(len(self),
+            self._max_size, self.hits, self.misses)
+
+
+def graph_hash(graph):
+    """A hex string hash of the structure and edge lengths of the graph,
+    suitable for naming cached data."""
+    csr = graph.csr
+    digest = _hashlib.sha1()
+    digest.update(repr(csr.keys).encode())
+    digest.update(_np.ascontiguousarray(csr.edge_vertices).tobytes())
+    digest.update(_np.ascontiguousarray(csr.lengths).tobytes())
+    return digest.hexdigest()
+
+
+class ArrayStore():
+    """A directory of cached arrays, for sharing per-edge data between
+    processes and between runs.  Data is stored in a sub-directory for each
+    graph and set of parameters.  Files are written to a unique temporary
+    name and then atomically renamed, so any number of processes and threads
+    may read (and write) concurrently, and will only ever see complete files.
+
+    :param directory: The directory to use, which will be created if needed.
+    """
+    def __init__(self, directory):
+        self._directory = directory
+        _os.makedirs(directory, exist_ok=True)
+
+    @property
+    def directory(self):
+        return self._directory
+
+    def namespace(self, graph, **params):
+        """Name of the sub-directory for this graph and parameters, for
+        passing to :meth:`load` and :meth:`save`."""
+        parts = [graph_hash(graph)]
+        parts.extend("{}={}".format(k, params[k]) for k in sorted(params))
+        return "_".join(parts)
+
+    def _filename(self, namespace, key):
+        return _os.path.join(self._directory, namespace, "_".join(str(k) for k in key) + ".npz")
+
+    def load(self, namespace, key):
+        """Load the arrays for `key` (a tuple), or return `None`."""
+        try:
+            with _np.load(self._filename(namespace, key)) as file:
+                return tuple(file["arr_{}".format(i)] for i in range(len(file.files)))
+        except FileNotFoundError:
+            return None
+
+    def save(self, namespace, key, arrays):
+        """Save the tuple of arrays for `key` (a tuple)."""
+        filename = self._filename(namespace, key)
+        _os.makedirs(_os.path.dirname(filename), exist_ok=True)
+        fd, temp = _tempfile.mkstemp(suffix=".tmp", dir=_os.path.dirname(filename))
+        try:
+            with _os.fdopen(fd, "wb") as file:
+                _np.savez(file, *arrays)
+            _os.replace(temp, filename)
+        except:
+            _os.remove(temp)
+            raise
+
+    def get(self, namespace, key, compute):
+        """Load the arrays for `key`, or compute and save them."""
+        arrays = self.load(namespace, key)
+        if arrays is None:
+            arrays = tuple(compute())
+            self.save(namespace, key, arrays)
+        return arrays
+
+
 class FastPredictor(Predictor):
     """A version of :class:`Predictor` which needs to be "compiled", and then
     can quickly perform predictors.  It performs lazy initialisation, so making
@@ -319,38 +484,64 @@ class FastPredictor(Predictor):
     :param predictor: An :class:`Predictor` to initialise from.
     :param max_length: The maximum "support" length which any (spatial) kernel
       will be able to have.
+    :param cache_size: The maximum number of edges to cache walks for, or
+      `None` for no limit.  The same limit applies to the cache of kernel
+      values.
+    :param store: Optional instance of :class:`ArrayStore` used to share
+      walks between processes and runs.
+
+    Walks are made once, to `max_length`, for any kernel, and so
+    :attr:`walk_min_weight` (which depends on the kernel and the events) is
+    ignored.  Changing :attr:`walk_tolerance` discards the cached walks.
     """
-    def __init__(self, predictor, max_length):
+    def __init__(self, predictor, max_length, cache_size=None, store=None):
+        self._cache_size = cache_size
         super().__init__(predictor.network_timed_points, predictor.graph)
         self.time_kernel_unit = predictor.time_kernel_unit
         self.time_kernel = predictor.time_kernel
         self.kernel = predictor.kernel
         self._max_length = max_length
-        self._cache = dict()
+        self._cache = LRUCache(cache_size)
         self._idx_cache = _np.array([])
-        self._add_cache = dict()
-        
+        self._store = store
+        self._walk_tolerance_used = self.walk_tolerance
+        self._namespace = None
+
+    @property
+    def cache(self):
+        """The :class:`LRUCache` of walks."""
+        return self._cache
+
+    def _walk(self, edge, orient):
+        _logger.debug("Populating cache for %s", (edge, orient))
+        start_key, avoid_key = self.graph.edges[edge]
+        if orient == 1:
+            start_key, avoid_key = avoid_key, start_key
+        index, start, end, degree = network.walk_with_degrees_bounded(
+            self.graph, start_key, avoid_key, self._max_length, 20000,
+            self.walk_tolerance)
+        index[0] = edge
+        return (index, start, end, 1.0 / degree)
+
+    def _check_walk_params(self):
+        # Cached walks are only valid for the tolerance they were made with
+        if self.walk_tolerance != self._walk_tolerance_used:
+            self._walk_tolerance_used = self.walk_tolerance
+            self._namespace = None
+            self._cache.clear()
+            self._add_cache.clear()
+        if self._store is not None and self._namespace is None:
+            self._namespace = self._store.namespace(self.graph, walk="degrees",
+                max_length=self._max_length, walk_tolerance=self.walk_tolerance)
+
     def _get(self, edge, orient):
         key = (edge, orient)
-        if key not in self._cache:
-            _logger.debug("Populating cache for %s", key)
-            start_key, avoid_key = self.graph.edges[edge]
-            if orient == 1:
-                start_key, avoid_key = avoid_key, start_key
-            data = list(self.graph.walk_with_degrees(start_key, avoid_key, self._max_length, 20000))
-            index = _np.empty(len(data), dtype=_np.int)
-            start = _np.empty(len(data))
-            end = _np.empty(len(data))
-            degree = _np.empty(len(data))
-            for i, (idx, st, en, deg) in enumerate(data):
-                if i==0:
-                    idx = edge
-                index[i] = idx
-                start[i] = st
-                end[i] = en
-                degree[i] = 1.0 / deg
-            self._cache[key] = (index, start, end, degree)
-        return self._cache[key]
+        if self._store is None:
+            compute = lambda : self._walk(edge, orient)
+        else:
+            compute = lambda : self._store.get(self._namespace, key,
+                lambda : self._walk(edge, orient))
+        return self._cache.get(key, compute)
 
     def add(self, risks, edge, orient, offset, time_weight=1):
         """Internal use: add to the risks from all paths.
@@ -361,22 +552,26 @@ class FastPredictor(Predictor):
         :param offset: How far along the edge we are (between 0 and 1)
         :param time_weight: How much to scale by
         """
+        if self.kernel.cutoff > self._max_length:
+            raise ValueError("Build from maximum length {}".format(self._max_length))
+        self._check_walk_params()
         key = (edge, orient, offset)
-        if key not in self._add_cache:
-            if self.kernel.cutoff > self._max_length:
-                raise ValueError("Build from maximum length {}".format(self._max_length))
-            offset = (1.0 - offset) * self.graph.length(edge)
-            index, start, end, degree = self._get(edge, orient)
-            start = _np.array(start) + offset
-            end = _np.array(end) + offset
-            start[0] = 0
-            mask = start < self.kernel.cutoff
-            index, start, end, degree = index[mask], start[mask], end[mask], degree[mask]
-            to_add = self.kernel.integrate(start, end) * degree
-            if len(self._idx_cache) != len(risks):
-                self._idx_cache = _np.arange(len(risks))
-            self._add_cache[key] = _ndimage.sum(to_add, labels=index, index=self._idx_cache)
-        risks += self._add_cache[key] * time_weight
+        to_add = self._add_cache.get(key, lambda : self._kernel_values(
+            len(risks), edge, orient, offset))
+        risks += to_add * time_weight
+
+    def _kernel_values(self, size, edge, orient, offset):
+        offset = (1.0 - offset) * self.graph.length(edge)
+        index, start, end, degree = self._get(edge, orient)
+        start = _np.array(start) + offset
+        end = _np.array(end) + offset
+        start[0] = 0
+        mask = start < self.kernel.cutoff
+        index, start, end, degree = index[mask], start[mask], end[mask], degree[mask]
+        to_add = self.kernel.integrate(start, end) * degree
+        if len(self._idx_cache) != size:
+            self._idx_cache = _np.arange(size)
+        return _ndimage.sum(to_add, labels=index, index=self._idx_cache)
 
     @property
     def kernel(self):
@@ -385,10 +580,163 @@ class FastPredictor(Predictor):
 
     @kernel.setter
     def kernel(self, v):
-        self._add_cache = dict()
+        self._add_cache = LRUCache(self._cache_size)
         self._kernel = v
 
 
+class KernelMatrixPredictor(Predictor):
+    """A version of :class:`Predictor` which precomputes, for each edge, the
+    risk added to every edge by a unit event on that edge.  The position of an
+    event along its edge is rounded to the centre of one of `offset_bins`
+    equal "bins", so with a single bin, events are moved to the middle of
+    their edge.  This gives a sparse matrix `K`, with a row for each edge
+    and bin, and a column for each edge, and a prediction is then a
+    time-weighted histogram of events multiplied by `K`.
+
+    Building `K` (the :meth:`compile` step, performed lazily) is as slow as a
+    prediction from :class:`Predictor` using one event on each edge, but
+    afterwards predictions are fast, and :meth:`save` and :meth:`load` allow
+    `K` to be reused.  Changing the (space) kernel or :attr:`walk_tolerance`
+    discards `K`; the time kernel may be freely changed.  As `K` does not
+    depend on the events, :attr:`walk_min_weight` is ignored.
+
+    :param predictor: An :class:`Predictor` to initialise from.
+    :param offset_bins: The number of bins to split each edge into.
+    """
+    def __init__(self, predictor, offset_bins=10):
+        super().__init__(predictor.network_timed_points, predictor.graph)
+        self.time_kernel_unit = predictor.time_kernel_unit
+        self.time_kernel = predictor.time_kernel
+        self._offset_bins = int(offset_bins)
+        if self._offset_bins < 1:
+            raise ValueError("Need at least one bin")
+        self.kernel = predictor.kernel
+
+    @property
+    def offset_bins(self):
+        """The number of bins each edge is split into."""
+        return self._offset_bins
+
+    @property
+    def kernel(self):
+        """The spatial / network kernel"""
+        return self._kernel
+
+    @kernel.setter
+    def kernel(self, v):
+        self._matrix = None
+        self._kernel = v
+
+    @property
+    def matrix(self):
+        """The sparse matrix `K`, of shape `(number_edges * offset_bins,
+        number_edges)`.  Row `e * offset_bins + b` is the risk (not divided by
+        edge length) from a unit event in bin `b` of edge `e`, where distance
+        along the edge is measured from `graph.edges[e][0]`."""
+        if self._matrix is None or self._matrix_walk_params != self._walk_params():
+            self.compile()
+        return self._matrix
+
+    def _walk_params(self):
+        # `walk_min_weight` is not used in building `K`
+        return (self.walk_tolerance,)
+
+    def compile(self):
+        """Build the matrix `K`."""
+        import scipy.sparse as _sparse
+        graph, bins, cutoff = self.graph, self._offset_bins, self.kernel.cutoff
+        _logger.debug("Building kernel matrix for %s edges using %s", graph.number_edges, self.kernel)
+        progress = _logger_mod.ProgressLogger(graph.number_edges, _datetime.timedelta(minutes=2), _logger)
+        dists = (_np.arange(bins) + 0.5) / bins
+        rows, cols, values = [], [], []
+        for edge in range(graph.number_edges):
+            length = graph.length(edge)
+            for orient, offsets in [(1, dists), (-1, 1.0 - dists)]:
+                start_key, avoid_key = graph.edges[edge]
+                if orient == 1:
+                    start_key, avoid_key = avoid_key, start_key
+                index, start, end, degree = network.walk_with_degrees_bounded(
+                    graph, start_key, avoid_key, cutoff, 20000, self.walk_tolerance)
+                index[0] = edge
+                for b, offset in enumerate((1.0 - offsets) * length):
+                    a, c = start + offset, end + offset
+                    a[0], c[0] = 0, offset
+                    mask = a < cutoff
+                    to_add = self.kernel.integrate(a[mask], c[mask]) / degree[mask]
+                    rows.append(_np.full(len(to_add), edge * bins + b))
+                    cols.append(index[mask])
+                    values.append(to_add)
+            progress.increase_count()
+        shape = (graph.number_edges * bins, graph.number_edges)
+        # Duplicate entries (several walks reaching the same edge) are summed
+        self._matrix = _sparse.csr_matrix((_np.concatenate(values),
+            (_np.concatenate(rows), _np.concatenate(cols))), shape=shape)
+        self._matrix.eliminate_zeros()
+        self._matrix_walk_params = self._walk_params()
+
+    def _event_rows(self, data):
+        """The row of `K` for each event."""
+        edges, orients = self._event_edges(data)
+        dists = _np.asarray(data.distances, dtype=_np.float64)
+        dists = _np.where(orients == -1, 1.0 - dists, dists)
+        bins = _np.clip((dists * self._offset_bins).astype(_np.int64), 0, self._offset_bins - 1)
+        return edges * self._offset_bins + bins
+
+    def predict(self, predict_time=None, cutoff_time=None):
+        """Make a prediction.
+
+        :param predict_time: Use only events before this time, and treat this
+          as the time 0 point for the time kernel.  If `None` then use the
+          last time-stamp in the input data.
+        :param cutoff_time: Use only events after this time.  If `None` then use
+          all events from the start of the input data.
+        """
+        data, time_weights = self._weighted_events(predict_time, cutoff_time)
+        matrix = self.matrix
+        histogram = _np.bincount(self._event_rows(data), weights=time_weights,
+            minlength=matrix.shape[0])
+        risks = matrix.T.dot(histogram) / self.graph.lengths
+        return Result(self.graph, risks)
+
+    def save(self, filename):
+        """Save the matrix `K`, computing it if necessary, to a `numpy` "npz"
+        file.  A fingerprint of the graph, kernel and :attr:`walk_tolerance`
+        is saved with it.
+
+        :raises ValueError: If the kernel has no `__repr__`, as then the
+          fingerprint would not be stable between runs.
+        """
+        fingerprint = self._fingerprint()
+        matrix = self.matrix
+        _np.savez_compressed(filename, data=matrix.data, indices=matrix.indices,
+            indptr=matrix.indptr, shape=matrix.shape, offset_bins=self._offset_bins,
+            fingerprint=fingerprint)
+
+    def load(self, filename):
+        """Load a matrix previously saved with :meth:`save`.
+
+        :raises ValueError: If the file was saved using a different graph,
+          kernel, walk tolerance or number of bins, or if the kernel has no
+          `__repr__`.
+        """
+        import scipy.sparse as _sparse
+        with _np.load(filename) as file:
+            if (int(file["offset_bins"]) != self._offset_bins or
+                    str(file["fingerprint"]) != self._fingerprint()):
+                raise ValueError("Saved kernel matrix is for a different graph or kernel")
+            matrix = _sparse.csr_matrix((file["data"], file["indices"], file["indptr"]),
+                shape=tuple(file["shape"]))
+        self._matrix = matrix
+        self._matrix_walk_params = self._walk_params()
+
+    def _fingerprint(self):
+        if type(self.kernel).__repr__ is object.__repr__:
+            raise ValueError("Kernel {} needs a __repr__ which describes its "
+                "parameters to save or load a kernel matrix".format(type(self.kernel)))
+        return "{}/{}/walk_tolerance={}".format(repr(self.kernel),
+            graph_hash(self.graph), self.walk_tolerance)
+
+
 class ApproxPredictor(Predictor):
     """Uses an approximation to the KDE method: we compute the minimal distance
     between the edge of the event and the edge we're interested in, compute
@@ -414,35 +762,47 @@ class ApproxPredictor(Predictor):
           We ignore and set to 0.5
         :param tw: How much to scale by
         """
-        dists, prevs = network.shortest_edge_paths(self.graph, edge_index, 0.5)
-        to_add = _np.zeros(self.graph.number_edges, dtype=_np.float)
-        for i in range(self.graph.number_edges):
-            if i == edge_index:
-                to_add[i] = self.kernel(0)
-                continue
-            k1, k2 = self.graph.edges[i]
-            le = self.graph.length(i) * 0.5
-            if k1 not in dists:
-                continue
-            le1, le2 = dists[k1], dists[k2]
-            if le1 < le2:
-                target = k1
-                weight = self.kernel(le1 + le)
-            else:
-                target = k2
-                weight = self.kernel(le2 + le)
-            if weight == 0:
-                continue
-            cum_deg = max(1, self.graph.degree(target) - 1)
-            while True:
-                next_target = prevs[target]
-                if next_target == target:
-                    break
-                target = next_target
-                cum_deg *= max(1, self.graph.degree(target) - 1)
-            to_add[i] = weight / cum_deg
+        mask, toadd = self._kernel_values(edge_index)
+        risks[mask] += toadd * tw
+
+    def _get(self, edge_index):
+        # Edges beyond the cutoff get no weight, so need not be explored
+        try:
+            max_length = self.kernel.cutoff
+        except NotImplementedError:
+            max_length = None
+        return network.shortest_edge_paths_with_degrees(self.graph, edge_index, max_length)
+
+    def _kernel_values(self, edge_index):
+        """Mask of edges reachable from `edge_index`, and the risk added to
+        each by a unit event."""
+        kernel_dists, cumulative_degrees = self._get(edge_index)
+        mask = kernel_dists > -1
+        return mask, self.kernel(kernel_dists[mask]) / cumulative_degrees[mask] * self.graph.lengths[mask]
 
-        risks += to_add * self.graph.lengths * tw
+    def predict(self, predict_time=None, cutoff_time=None):
+        """Make a prediction.  As the position of an event along its edge is
+        ignored, all events on the same edge are processed together.
+
+        :param predict_time: Use only events before this time, and treat this
+          as the time 0 point for the time kernel.  If `None` then use the
+          last time-stamp in the input data.
+        :param cutoff_time: Use only events after this time.  If `None` then use
+          all events from the start of the input data.
+        """
+        data, time_weights = self._weighted_events(predict_time, cutoff_time)
+        edges, _ = self._event_edges(data)
+        edge_weights = _np.bincount(edges, weights=time_weights, minlength=self.graph.number_edges)
+        risks = _np.zeros(self.graph.number_edges)
+        source_edges = _np.nonzero(edge_weights)[0]
+        _logger.debug("Making prediction with %s events on %s edges using %s/%s",
+            len(time_weights), len(source_edges), self.kernel, self.time_kernel)
+        progress = _logger_mod.ProgressLogger(len(source_edges), _datetime.timedelta(minutes=2), _logger)
+        for edge_index in source_edges.tolist():
+            self.add_edge(risks, edge_index, 0.5, edge_weights[edge_index])
+            progress.increase_count()
+        risks /= self.graph.lengths
+        return Result(self.graph, risks)
 
 
 class ApproxPredictorCaching(ApproxPredictor):
@@ -450,16 +810,36 @@ class ApproxPredictorCaching(ApproxPredictor):
     as :class:`FastPredictor` and also caches spatial kernel data.
 
     :param predictor: An :class:`Predictor` to initialise from.
+    :param cache_size: The maximum number of edges to cache data for, or
+      `None` for no limit.
+    :param store: Optional instance of :class:`ArrayStore` used to share
+      data between processes and runs.
     """
-    def __init__(self, predictor):
+    def __init__(self, predictor, cache_size=None, store=None):
+        self._cache_size = cache_size
         super().__init__(predictor)
-        self._cache = dict()
-        self._add_cache = dict()
+        self._cache = LRUCache(cache_size)
+        self._store = store
+        if store is not None:
+            self._namespace = store.namespace(self.graph, walk="shortest")
+
+    @property
+    def cache(self):
+        """The :class:`LRUCache` of shortest path data."""
+        return self._cache
 
     def _get_data(self, edge_index):
         _logger.debug("ApproxPredictorCaching: Calculating for %s", edge_index)
         return network.shortest_edge_paths_with_degrees(self.graph, edge_index)
 
+    def _get(self, edge_index):
+        if self._store is None:
+            compute = lambda : self._get_data(edge_index)
+        else:
+            compute = lambda : self._store.get(self._namespace, (edge_index,),
+                lambda : self._get_data(edge_index))
+        return self._cache.get(edge_index, compute)
+
     def add_edge(self, risks, edge_index, dist, tw):
         """Internal use.  Add both contributions to an edge.
 
@@ -469,13 +849,7 @@ class ApproxPredictorCaching(ApproxPredictor):
           We ignore and set to 0.5
         :param tw: How much to scale by
         """
-        if edge_index not in self._add_cache:
-            if edge_index not in self._cache:
-                self._cache[edge_index] = self._get_data(edge_index)
-            kernel_dists, cumulative_degrees = self._cache[edge_index]
-            mask = kernel_dists > -1
-            self._add_cache[edge_index] = mask, self.kernel(kernel_dists[mask]) / cumulative_degrees[mask] * self.graph.lengths[mask]
-        mask, toadd = self._add_cache[edge_index]
+        mask, toadd = self._add_cache.get(edge_index, lambda : self._kernel_values(edge_index))
         risks[mask] += toadd * tw
 
     @property
@@ -485,7 +859,7 @@ class ApproxPredictorCaching(ApproxPredictor):
 
     @kernel.setter
     def kernel(self, v):
-        self._add_cache = dict()
+        self._add_cache = LRUCache(self._cache_size)
         self._kernel = v
 
 
@@ -38,6 +38,7 @@ References
 
 from . import predictors
 from . import kernels
+from . import sepp_base as _sepp_base
 import numpy as _np
 import logging as _logging
 
@@ -283,25 +284,62 @@ class StocasticDecluster():
         """Return the initial "p matrix"."""
         return initial_p_matrix(self.points, self.initial_time_bandwidth, self.initial_space_bandwidth)
 
-    def run_optimisation(self, iterations=20):
+    def p_matrix_from_kernels(self, background_kernel, trigger_kernel):
+        """Compute the "p matrix" for the current data from already estimated
+        kernels; for example, those from training on a previous, overlapping,
+        window of data.  Suitable for passing as `initial_p` to
+        :meth:`run_optimisation`."""
+        return p_matrix_fast(self.points, background_kernel, trigger_kernel,
+            time_cutoff = self.time_cutoff, space_cutoff = self.space_cutoff)
+
+    def run_optimisation(self, iterations=20, initial_p=None, tolerance=None,
+            checkpoint=None):
         """Runs the optimisation algorithm by taking an initial estimation of
         the probability matrix, and then running the optimisation step.  If
         this step ever classifies most events as background, or as triggered,
         then optimisation will fail.  Tuning the initial bandwidth parameters
         may help.
 
-        :param iterations: The number of optimisation steps to perform.
+        :param iterations: The (maximum) number of optimisation steps to
+          perform.
+        :param initial_p: Optionally, the probability matrix to start from,
+          instead of :meth:`initial_p_matrix`.  See
+          :meth:`p_matrix_from_kernels`.
+        :param tolerance: If not `None`, then stop once the
+          :func:`open_cp.sepp_base.p_matrix_change` between successive
+          probability matrices is less than this.
+        :param checkpoint: Optional instance of
+          :class:`open_cp.sepp_base.Checkpoint`.  If the checkpoint holds state
+          from a run with the same data, settings and initial probability
+          matrix, optimisation resumes from there.
 
         :return: :class:`OptimisationResult` instance
         """
-        p = self.initial_p_matrix()
-        errors = []
+        p = self.initial_p_matrix() if initial_p is None else initial_p
+        errors, change = [], None
+        start = 0
+        if checkpoint is not None:
+            key = checkpoint.key(self.points, _sepp_base._class_name(self), p,
+                self.background_kernel_estimator, self.trigger_kernel_estimator,
+                self.space_cutoff, self.time_cutoff)
+            saved = checkpoint.load(key)
+            if saved is not None:
+                start, (p, errors, change, bkernel, tkernel, random_state) = saved
+                _np.random.set_state(random_state)
         logger = _logging.getLogger(__name__)
-        for iter in range(iterations):
+        for iter in range(start, iterations):
+            if tolerance is not None and change is not None and change < tolerance:
+                logger.debug("Converged after %s iterations", iter)
+                break
             pnew, bkernel, tkernel = self.next_iteration(p)
             errors.append(_np.sum((pnew - p) ** 2))
+            change = _sepp_base.p_matrix_change(p, pnew)
             p = pnew
             logger.debug("Completed iteration %s", iter)
+            if checkpoint is not None:
+                converged = tolerance is not None and change < tolerance
+                checkpoint.save(key, iter + 1, (p, errors, change, bkernel, tkernel,
+                    _np.random.get_state()), force = (iter + 1 == iterations or converged))
         kernel = make_kernel(self.points, bkernel, tkernel)
         return OptimisationResult(kernel=kernel, p=p, background_kernel=bkernel,
             trigger_kernel=tkernel, ell2_error=_np.sqrt(_np.asarray(errors)),
@@ -610,17 +648,33 @@ class SEPPTrainer(predictors.DataTrainer):
         decluster.points = self.as_time_space_points(cutoff_time)
         return decluster
 
-    def train(self, cutoff_time=None, iterations=40):
+    def train(self, cutoff_time=None, iterations=40, warm_start=None,
+            tolerance=None, checkpoint=None):
         """Perform the (slow) training step on historical data.  This estimates
         kernels, and returns an object which can make predictions.
 
         :param cutoff_time: If specified, then limit the historical data to
           before this time.
-        :param iterations: The number of iterations of the optimisation
-          algorithm to apply.
+        :param iterations: The (maximum) number of iterations of the
+          optimisation algorithm to apply.
+        :param warm_start: Optionally, a :class:`SEPPPredictor` from a previous
+          training run, typically on an overlapping window of data.  The
+          initial probability matrix is computed from its kernels, using the
+          time-averaged background kernel.
+        :param tolerance: If not `None`, then stop once the
+          :func:`open_cp.sepp_base.p_matrix_change` between successive
+          iterations is less than this.
+        :param checkpoint: Optional instance of
+          :class:`open_cp.sepp_base.Checkpoint` to periodically save progress
+          to, and to resume from.
         
         :return: A :class:`SEPPPredictor` instance.
         """
         decluster = self.make_stocastic_decluster(cutoff_time)
-        result = decluster.run_optimisation(iterations=iterations)
+        initial_p = None
+        if warm_start is not None:
+            initial_p = decluster.p_matrix_from_kernels(
+                warm_start.adjusted_background_kernel, warm_start.trigger_kernel)
+        result = decluster.run_optimisation(iterations=iterations,
+            initial_p=initial_p, tolerance=tolerance, checkpoint=checkpoint)
         return SEPPPredictor(result, self.data.timestamps[0], self.data.timestamps[-1])
@@ -12,6 +12,9 @@ from . import data as _ocp_data
 import numpy as _np
 import datetime as _datetime
 import logging as _logging
+import pickle as _pickle
+import hashlib as _hashlib
+import os as _os
 _logger = _logging.getLogger(__name__)
 
 class ModelBase():
@@ -483,6 +486,101 @@ class Optimiser():
         raise NotImplementedError()
 
 
+class Checkpoint():
+    """Periodically saves the state of an optimisation to disk, so that a long
+    run can be resumed after it is interrupted.  The state is pickled, and
+    written to a temporary file which then replaces `filename`, so an
+    interruption while saving does not corrupt an existing checkpoint.
+
+    Each checkpoint is stored with a "key" computed from the data being
+    trained on, the class doing the training, the state optimisation started
+    from, and `tag`.  A checkpoint with a different key is ignored when
+    loading.
+
+    :param filename: The file to save to.
+    :param every: Save after every this many iterations.
+    :param tag: Optional string to include in the key; for example, a
+      description of settings which the key would not otherwise capture.
+    """
+    def __init__(self, filename, every=1, tag=None):
+        self._filename = filename
+        self._every = every
+        self._tag = tag
+        self._logger = _logging.getLogger(__name__)
+
+    @property
+    def filename(self):
+        return self._filename
+
+    @property
+    def tag(self):
+        return self._tag
+
+    def key(self, data, *settings):
+        """Compute a key identifying the data, an array, the optional
+        `settings` and :attr:`tag`.  Each setting should be an array, or an
+        object which can be pickled.
+        """
+        data = _np.ascontiguousarray(data)
+        digest = _hashlib.sha1(data.tobytes())
+        for setting in settings:
+            if isinstance(setting, _np.ndarray):
+                setting = _np.ascontiguousarray(setting)
+                digest.update(setting.tobytes() + str(setting.shape).encode())
+            else:
+                digest.update(_pickle.dumps(setting))
+        digest.update(repr(self._tag).encode())
+        return digest.hexdigest() + str(data.shape)
+
+    def load(self, key):
+        """Load the state, if it exists and was saved with the same `key`.
+
+        :return: Pair `(iteration, state)` or `None`.
+        """
+        try:
+            with open(self._filename, "rb") as file:
+                saved = _pickle.load(file)
+        except FileNotFoundError:
+            return None
+        if saved["key"] != key:
+            self._logger.warning("Ignoring checkpoint %s saved for different data", self._filename)
+            return None
+        self._logger.info("Resuming from iteration %d from %s", saved["iteration"], self._filename)
+        return saved["iteration"], saved["state"]
+
+    def save(self, key, iteration, state, force=False):
+        """Save the state, if `iteration` is a multiple of `every` or if
+        `force` is set."""
+        if not force and iteration % self._every != 0:
+            return
+        temp = self._filename + ".tmp"
+        with open(temp, "wb") as file:
+            _pickle.dump({"key": key, "iteration": iteration, "state": state}, file)
+        _os.replace(temp, self._filename)
+        self._logger.debug("Saved iteration %d to %s", iteration, self._filename)
+
+    def remove(self):
+        """Delete the checkpoint file, if it exists."""
+        try:
+            _os.remove(self._filename)
+        except FileNotFoundError:
+            pass
+
+
+def p_matrix_change(p, pnew):
+    """The largest absolute difference between entries of two "p"
+    matrices.  This is the measure which the `tolerance` of
+    :meth:`Trainer.train` and of
+    :meth:`open_cp.sepp.StocasticDecluster.run_optimisation` is compared
+    against."""
+    return _np.max(_np.abs(_np.asarray(pnew) - _np.asarray(p)))
+
+
+def _class_name(obj):
+    cls = type(obj)
+    return cls.__module__ + "." + cls.__qualname__
+
+
 class _BaseTrainer(predictors.DataTrainer):
     def __init__(self):
         self.time_unit = _np.timedelta64(1, "D")
@@ -558,26 +656,67 @@ class Trainer(_BaseTrainer):
         """
         raise NotImplementedError()
         
+    def warm_start_model(self, model, fixed, data):
+        """Return the model from which optimisation is performed, when warm
+        starting from `model`, typically the result of training on a previous,
+        overlapping, window of data.  The pair `(fixed, data)` is as returned
+        by :meth:`make_data`.  By default, returns `model` unchanged; subclasses
+        may override to adjust any parameters which depend upon the data.
+        """
+        return model
+
     @property
     def _optimiser(self):
         """The class to be used as the optimiser"""
         raise NotImplementedError()
         
-    def train(self, predict_time=None, iterations=1):
+    def train(self, predict_time=None, iterations=1, model=None,
+            tolerance=None, checkpoint=None):
         """Optimise the model.
         
         :predict_time: Crop the data to before this time, and use this time
           as the end point.  If `None` then use the final timestamp in the
           data, rounded up by the currently in use time unit.
+        :param iterations: The (maximum) number of iterations to perform.
+        :param model: Optionally, a model to "warm start" from, instead of
+          :meth:`initial_model`.  See :meth:`warm_start_model`.
+        :param tolerance: If not `None`, then stop once the
+          :func:`p_matrix_change` between successive iterations is less than
+          this.
+        :param checkpoint: Optional instance of :class:`Checkpoint`.  If the
+          checkpoint holds state from a run of this class on the same data,
+          from the same starting model, optimisation resumes from there.
         
         :return: Instances of :class:`Model`.
         """
-        fixed, data = self.make_data(predict_time)        
-        model = self.initial_model(fixed, data)
-        for _ in range(iterations):
+        fixed, data = self.make_data(predict_time)
+        if model is None:
+            model = self.initial_model(fixed, data)
+        else:
+            model = self.warm_start_model(model, fixed, data)
+        start, last_p = 0, None
+        if checkpoint is not None:
+            key = checkpoint.key(data, _class_name(self), model)
+            saved = checkpoint.load(key)
+            if saved is not None:
+                start, (model, last_p, random_state) = saved
+                _np.random.set_state(random_state)
+        for iteration in range(start, iterations):
             opt = self._optimiser(model, data)
+            if tolerance is not None:
+                if last_p is not None and p_matrix_change(last_p, opt.p) < tolerance:
+                    self._logger.debug("Converged after %d iterations", iteration)
+                    if checkpoint is not None:
+                        checkpoint.save(key, iteration,
+                            (model, last_p, _np.random.get_state()), force=True)
+                    break
+                last_p = opt.p
             model = opt.iterate()
             self._logger.debug(model)
+            if checkpoint is not None:
+                checkpoint.save(key, iteration + 1,
+                    (model, last_p, _np.random.get_state()),
+                    force = (iteration + 1 == iterations))
         return model
     
     
@@ -7,7 +7,7 @@ Produces synthetic data based upon simple random models.
 Currently overlaps a bit with the `Sampler` classes from the `sources.sepp` module.
 """
 
-from ..data import TimedPoints
+from ..data import TimedPoints, Grid
 
 import numpy as _np
 import numpy.random as _npr
@@ -130,4 +130,231 @@ class KernelSampler():
         points = self.sampler(size)
         points[0] = points[0] * self.xscale + self.x
         points[1] = points[1] * self.yscale + self.y
-        return points
\ No newline at end of file
+        return points
+
+
+def _as_random_state(seed):
+    """Convert `seed` (`None`, an integer, or an existing instance) to an
+    instance of :class:`numpy.random.RandomState`."""
+    if isinstance(seed, _npr.RandomState):
+        return seed
+    return _npr.RandomState(seed)
+
+
+class AliasTable():
+    """Walker's alias method for sampling from a discrete distribution in
+    constant time per sample.  The table is built with Vose's algorithm,
+    which pairs under-weight and over-weight outcomes from two work lists,
+    in time linear in the number of outcomes.
+
+    :param weights: One dimensional array of non-negative weights, not all
+      zero.  Need not be normalised.
+    """
+    def __init__(self, weights):
+        weights = _np.asarray(weights, dtype=_np.float64).ravel()
+        if _np.any(weights < 0) or not _np.any(weights > 0):
+            raise ValueError("Weights must be non-negative, and not all zero")
+        n = len(weights)
+        q = (weights * (n / _np.sum(weights))).tolist()
+        prob = [1.0] * n
+        alias = list(range(n))
+        small = [i for i, x in enumerate(q) if x < 1]
+        large = [i for i, x in enumerate(q) if x >= 1]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            prob[s] = q[s]
+            alias[s] = l
+            q[l] = (q[l] + q[s]) - 1
+            if q[l] < 1:
+                small.append(l)
+            else:
+                large.append(l)
+        # Anything left over has weight 1, up to rounding error, and so keeps
+        # the defaults of probability 1 and aliasing itself.
+        self._prob = _np.asarray(prob)
+        self._alias = _np.asarray(alias, dtype=_np.int64)
+
+    @property
+    def probabilities(self):
+        """The probability of accepting the sampled cell, rather than its
+        alias."""
+        return self._prob
+
+    @property
+    def aliases(self):
+        return self._alias
+
+    def sample(self, size, random_state=None):
+        """Sample from the distribution.
+
+        :param size: The number of samples.
+        :param random_state: Optional :class:`numpy.random.RandomState`; if
+          `None` uses the global `numpy` random state.
+
+        :return: Array of shape `(size,)` of integer indices into the weights.
+        """
+        if random_state is None:
+            random_state = _npr
+        choice = random_state.randint(len(self._prob), size=size)
+        accept = random_state.random_sample(size) < self._prob[choice]
+        return _np.where(accept, choice, self._alias[choice])
+
+
+class GridSampler():
+    """Sample from the piecewise constant density given by a grid of
+    weights.  The alias table is built once, and then each sample costs
+    constant time: a cell is chosen, and then a point uniformly at random in
+    that cell.  Call as `sampler(N)` to make N samples, returning an array of
+    shape (2,N), so this can be used in place of :class:`KernelSampler`.
+
+    :param grid: An instance of :class:`open_cp.data.Grid` giving the size
+      and offset of the cells.
+    :param matrix: Two dimensional array of non-negative weights, indexed as
+      `[gy, gx]`.  Masked cells are given zero weight.
+    :param seed: Optional seed, or instance of
+      :class:`numpy.random.RandomState`.
+    """
+    def __init__(self, grid, matrix, seed=None):
+        self._xsize, self._ysize = grid.xsize, grid.ysize
+        self._xoffset, self._yoffset = grid.xoffset, grid.yoffset
+        matrix = _np.ma.filled(_np.ma.masked_invalid(_np.ma.asarray(matrix,
+                dtype=_np.float64)), 0)
+        self._shape = matrix.shape
+        self._table = AliasTable(matrix)
+        self._random_state = _as_random_state(seed)
+
+    @staticmethod
+    def from_prediction(prediction, seed=None):
+        """Construct from an instance of
+        :class:`open_cp.predictors.GridPrediction`, taking account of any
+        mask.
+        """
+        return GridSampler(prediction, prediction.intensity_matrix, seed)
+
+    @staticmethod
+    def from_kernel(kernel, region, cell_width, cell_height=None, seed=None):
+        """Rasterise the kernel by evaluating it at the centre of each grid
+        cell.
+
+        :param kernel: The kernel, callable with an array of shape (2,k).
+        :param region: A :class:`open_cp.data.RectangularRegion` instance.
+        :param cell_width: Width of each cell.
+        :param cell_height: Optional; height of each cell.  Defaults to
+          `cell_width`.
+        """
+        if cell_height is None:
+            cell_height = cell_width
+        xextent, yextent = region.grid_size(cell_width, cell_height)
+        xcs = region.xmin + (_np.arange(xextent) + 0.5) * cell_width
+        ycs = region.ymin + (_np.arange(yextent) + 0.5) * cell_height
+        xcs, ycs = _np.meshgrid(xcs, ycs)
+        matrix = _np.asarray(kernel(_np.vstack([xcs.ravel(), ycs.ravel()])))
+        grid = Grid(cell_width, cell_height, region.xmin, region.ymin)
+        return GridSampler(grid, matrix.reshape(xcs.shape), seed)
+
+    def sample_cells(self, size):
+        """Sample grid cells only.
+
+        :return: Pair `(gx, gy)` of arrays of shape `(size,)`.
+        """
+        cells = self._table.sample(size, self._random_state)
+        gy, gx = _np.unravel_index(cells, self._shape)
+        return gx, gy
+
+    def __call__(self, size=1):
+        gx, gy = self.sample_cells(size)
+        jitter = self._random_state.random_sample((2, size))
+        x = (gx + jitter[0]) * self._xsize + self._xoffset
+        y = (gy + jitter[1]) * self._ysize + self._yoffset
+        return _np.vstack([x, y])
+
+
+class EnvelopeRejectionSampler():
+    """Rejection sampler for a continuous kernel defined on a rectangular
+    region, using a piecewise constant "envelope" instead of a single global
+    maximum.  The region is divided into `bins` by `bins` cells, and the
+    kernel is evaluated on a `refine` by `refine` lattice in each cell to
+    estimate a local upper bound.  Candidates are drawn from the envelope with
+    an :class:`AliasTable`, so the acceptance rate stays high even for sharply
+    peaked kernels.  If a sample is ever found to exceed the envelope, the
+    bound of that cell is raised and the table rebuilt.
+
+    Call as `sampler(N)` to make N samples, returning an array of shape (2,N).
+
+    :param region: A :class:`open_cp.data.RectangularRegion` instance
+      describing the region the kernel is defined on.
+    :param kernel: The kernel, callable with an array of shape (2,k).
+    :param bins: The number of envelope cells in each direction.
+    :param refine: The number of points in each direction, in each cell, to
+      evaluate the kernel at when estimating the envelope.  At least 2.
+    :param safety: Factor to multiply the estimated local maxima by.
+    :param seed: Optional seed, or instance of
+      :class:`numpy.random.RandomState`.
+    """
+    def __init__(self, region, kernel, bins=32, refine=5, safety=1.5, seed=None):
+        self._region = region
+        self._kernel = kernel
+        self._bins = bins
+        self._random_state = _as_random_state(seed)
+        self._tried, self._accepted = 0, 0
+        self._envelope = self._estimate_envelope(refine) * safety
+        self._build_table()
+
+    def _estimate_envelope(self, refine):
+        n = self._bins * (refine - 1) + 1
+        xcs = _np.linspace(self._region.xmin, self._region.xmax, n)
+        ycs = _np.linspace(self._region.ymin, self._region.ymax, n)
+        xcs, ycs = _np.meshgrid(xcs, ycs)
+        values = _np.asarray(self._kernel(_np.vstack([xcs.ravel(), ycs.ravel()])))
+        values = values.reshape(n, n)
+        step, end = refine - 1, self._bins * (refine - 1)
+        envelope = _np.zeros((self._bins, self._bins))
+        for i in range(refine):
+            for j in range(refine):
+                v = values[i : i + end : step, j : j + end : step]
+                envelope = _np.maximum(envelope, v)
+        # Guard against a kernel which is zero on the lattice but not elsewhere
+        floor = _np.max(envelope) * 1e-6
+        return _np.maximum(envelope, floor)
+
+    def _build_table(self):
+        self._table = AliasTable(self._envelope)
+
+    @property
+    def envelope(self):
+        """Matrix of upper bounds for the kernel, indexed as `[y, x]`."""
+        return self._envelope
+
+    @property
+    def acceptance_rate(self):
+        """The proportion of candidates accepted so far."""
+        return self._accepted / max(1, self._tried)
+
+    def _candidates(self, size):
+        cells = self._table.sample(size, self._random_state)
+        gy, gx = _np.unravel_index(cells, self._envelope.shape)
+        jitter = self._random_state.random_sample((2, size))
+        x = (gx + jitter[0]) * (self._region.width / self._bins) + self._region.xmin
+        y = (gy + jitter[1]) * (self._region.height / self._bins) + self._region.ymin
+        return _np.vstack([x, y]), gy, gx
+
+    def __call__(self, size=1):
+        points = _np.empty((2, size))
+        count = 0
+        while count < size:
+            wanted = size - count
+            pts, gy, gx = self._candidates(wanted + wanted // 2 + 1)
+            k = _np.asarray(self._kernel(pts))
+            bound = self._envelope[gy, gx]
+            if _np.any(k > bound):
+                bad = k > bound
+                _np.maximum.at(self._envelope, (gy[bad], gx[bad]), k[bad] * 1.5)
+                self._build_table()
+                continue
+            accept = self._random_state.random_sample(len(k)) * bound <= k
+            self._tried += len(k)
+            self._accepted += _np.sum(accept)
+            pts = pts[:, accept][:, :wanted]
+            points[:, count : count + pts.shape[1]] = pts
+            count += pts.shape[1]
+        return points
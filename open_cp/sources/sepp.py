@@ -24,6 +24,8 @@ import abc as _abc
 import numpy as _np
 from numpy import timedelta64
 import itertools as _itertools
+import contextlib as _contextlib
+import concurrent.futures as _futures
 
 class SpaceTimeKernel(kernels.Kernel):
     """To produce a kernel as required by the samplers in this package,
@@ -359,6 +361,163 @@ class SelfExcitingPointProcess(Sampler):
         return SelfExcitingPointProcess.Sample(_np.asarray(output).T, _np.asarray(background_points),
             _np.asarray(trigger_deltas).T, _np.asarray(trigger_points).T)
 
+class OffspringSampler(metaclass=_abc.ABCMeta):
+    """Describes the "children" of a single event in a branching process, in
+    a form which allows all the children of a whole generation to be sampled
+    at once.  The number of children of each event is Poisson distributed with
+    mean :attr:`intensity`, and each child is displaced from its parent by an
+    independent sample from :meth:`sample_deltas`.
+    """
+    @property
+    @_abc.abstractmethod
+    def intensity(self):
+        """The expected number of children of each event."""
+        pass
+
+    @_abc.abstractmethod
+    def sample_deltas(self, size, random_state):
+        """Sample the displacements from parent to child.
+
+        :param size: The number of samples to return.
+        :param random_state: Instance of :class:`numpy.random.RandomState` to
+          use as the source of randomness.
+
+        :return: Array of shape (size,) for a time-only process, or of shape
+          (k, size) where the first coordinate is time.  Times should be
+          non-negative.
+        """
+        pass
+
+
+class ExponentialDecayOffspring(OffspringSampler):
+    """Time-only offspring with an exponentially decaying trigger kernel.
+    The equivalent of :class:`ExponentialDecaySampler`.
+
+    :param intensity: The expected number of children of each event.
+    :param exp_rate: The "rate" parameter of the exponential.
+    """
+    def __init__(self, intensity, exp_rate):
+        self._intensity = intensity
+        self.exp_rate = exp_rate
+
+    @property
+    def intensity(self):
+        return self._intensity
+
+    def sample_deltas(self, size, random_state):
+        return random_state.exponential(1 / self.exp_rate, size=size)
+
+
+class ExponentialDecayGaussianOffspring(ExponentialDecayOffspring):
+    """Space/time offspring: exponential decay in time, and an independent
+    Gaussian displacement in space.
+
+    :param intensity: The expected number of children of each event.
+    :param exp_rate: The "rate" parameter of the exponential.
+    :param variances: A pair of the variances of the Gaussian in each variable.
+    """
+    def __init__(self, intensity, exp_rate, variances):
+        super().__init__(intensity, exp_rate)
+        self.stds = _np.sqrt(_np.asarray(variances, dtype=_np.float64))
+
+    def sample_deltas(self, size, random_state):
+        times = super().sample_deltas(size, random_state)
+        space = random_state.standard_normal(size=(2, size)) * self.stds[:,None]
+        return _np.vstack([times, space])
+
+
+@_contextlib.contextmanager
+def _seeded_global_state(seed):
+    """Temporarily seed the global `numpy` random state, so that samplers which
+    use :mod:`numpy.random` directly give reproducible output."""
+    if seed is None:
+        yield
+        return
+    state = _np.random.get_state()
+    _np.random.seed(seed)
+    try:
+        yield
+    finally:
+        _np.random.set_state(state)
+
+def _branch(background, offspring, end_time, random_state):
+    """Simulate the cascade of children from the background events,
+    generation by generation.
+
+    :return: Tuple `(points, ancestors, deltas, parents)` where `points` are
+      all the events, in generation order, with the background events first;
+      `ancestors` gives, for each event, the index of the background event it
+      descends from; `deltas` are the displacements of each triggered event
+      from its parent, and `parents` the location of the parent.
+    """
+    generation = background
+    ancestors = _np.arange(background.shape[-1])
+    all_points, all_ancestors = [background], [ancestors]
+    all_deltas, all_parents = [], []
+    while generation.shape[-1] > 0:
+        counts = random_state.poisson(offspring.intensity, size=generation.shape[-1])
+        total = counts.sum()
+        if total == 0:
+            break
+        deltas = _np.asarray(offspring.sample_deltas(total, random_state))
+        parents = _np.repeat(generation, counts, axis=-1)
+        children = parents + deltas
+        times = children[0] if children.ndim > 1 else children
+        mask = times < end_time
+        generation = children[...,mask]
+        ancestors = _np.repeat(ancestors, counts)[mask]
+        all_points.append(generation)
+        all_ancestors.append(ancestors)
+        all_deltas.append(deltas[...,mask])
+        all_parents.append(parents[...,mask])
+    points = _np.concatenate(all_points, axis=-1)
+    ancestors = _np.concatenate(all_ancestors)
+    if len(all_deltas) > 0:
+        deltas = _np.concatenate(all_deltas, axis=-1)
+        parents = _np.concatenate(all_parents, axis=-1)
+    else:
+        deltas = background[...,:0]
+        parents = background[...,:0]
+    return points, ancestors, deltas, parents
+
+
+class BranchingProcessSampler(Sampler):
+    """Sample from a self-exciting point process model, as
+    :class:`SelfExcitingPointProcess`, but processing one "generation" of
+    events at a time.  The number of children of every event in a generation
+    is drawn with one call to the random number generator, and all the
+    children are then sampled together.  This is much faster for large
+    simulations.
+
+    :param background_sampler: Should follow the interface of :class:`Sampler`
+    :param offspring: Should follow the interface of :class:`OffspringSampler`
+    :param seed: Optional seed (or :class:`numpy.random.RandomState` instance)
+      to make the output reproducible.  The background sampler will be run with
+      the global `numpy` random state temporarily seeded from this.
+    """
+    def __init__(self, background_sampler, offspring, seed=None):
+        self.background_sampler = background_sampler
+        self.offspring = offspring
+        self._random_state = random._as_random_state(seed)
+        self._seeded = seed is not None
+
+    def sample(self, start_time, end_time):
+        return self.sample_with_details(start_time, end_time).points
+
+    def sample_with_details(self, start_time, end_time):
+        """Takes a sample from the process, but returns details, as an
+        instance of :class:`SelfExcitingPointProcess.Sample`"""
+        seed = self._random_state.randint(2**31 - 1) if self._seeded else None
+        with _seeded_global_state(seed):
+            background = self.background_sampler.sample(start_time, end_time)
+        background = _np.asarray(background, dtype=_np.float64)
+        points, _, deltas, parents = _branch(background, self.offspring,
+            end_time, self._random_state)
+        times = points[0] if points.ndim > 1 else points
+        points = points[...,_np.argsort(times, kind="mergesort")]
+        return SelfExcitingPointProcess.Sample(points, background, deltas, parents)
+
+
 def make_time_unit(length_of_time, minimal_time_unit=timedelta64(1,"ms")):
     """Utility method to create a `time_unit`.
     
@@ -438,4 +597,90 @@ class GridHawkesProcess(Sampler):
                 for t,x,y in zip(times, xcs, ycs):
                     points.append((t, x * grid_size, y * grid_size))
         points.sort(key = lambda triple : triple[0])
-        return _np.asarray(points).T
\ No newline at end of file
+        return _np.asarray(points).T
+
+
+def _sample_grid_chunk(mus, theta, omega, start_time, end_time, seed):
+    """Sample all the cells with background rates `mus` together.
+
+    :return: Pair `(times, cells)` of the event times, and the index into
+      `mus` of the cell each event occurred in.
+    """
+    random_state = _np.random.RandomState(seed)
+    counts = random_state.poisson(mus * (end_time - start_time))
+    times = random_state.random_sample(counts.sum()) * (end_time - start_time) + start_time
+    cells = _np.repeat(_np.arange(len(mus)), counts)
+    offspring = ExponentialDecayOffspring(theta, omega)
+    times, ancestors, _, _ = _branch(times, offspring, end_time, random_state)
+    return times, cells[ancestors]
+
+
+class BranchingGridHawkesProcess(GridHawkesProcess):
+    """As :class:`GridHawkesProcess` but all cells are simulated together,
+    one generation at a time, and optionally in parallel.  Cells are split
+    into fixed size chunks, each of which is given its own seed derived from
+    `seed`, so the output does not depend upon the number of processes used.
+
+    :param background_rates: An array of arbitrary shape, giving the background
+      rate in each "cell".
+    :param theta: The overall "intensity" of trigger / aftershock events.
+      Should be less than 1.
+    :param omega: The rate (or inverse scale) of the exponential kernel.
+    :param seed: Optional seed, to make the output reproducible.
+    :param processes: If greater than 1, the number of worker processes to
+      spread chunks of cells across.
+    :param chunk_size: The number of cells in each chunk.
+    """
+    def __init__(self, background_rates, theta, omega, seed=None, processes=1,
+            chunk_size=4096):
+        super().__init__(background_rates, theta, omega)
+        self._random_state = random._as_random_state(seed)
+        self.processes = processes
+        self.chunk_size = chunk_size
+
+    def _sample_flat(self, start_time, end_time):
+        mus = self.mus.ravel()
+        starts = list(range(0, len(mus), self.chunk_size))
+        seeds = self._random_state.randint(2**31 - 1, size=len(starts))
+        args = [(mus[s : s + self.chunk_size], self.theta, self.omega,
+                 start_time, end_time, seed) for s, seed in zip(starts, seeds)]
+        if self.processes is not None and self.processes > 1 and len(args) > 1:
+            with _futures.ProcessPoolExecutor(max_workers=self.processes) as executor:
+                results = list(executor.map(_sample_grid_chunk, *zip(*args)))
+        else:
+            results = [_sample_grid_chunk(*a) for a in args]
+        if len(results) == 0:
+            return _np.empty(0), _np.empty(0, dtype=_np.int64)
+        times = _np.concatenate([t for t, _ in results])
+        cells = _np.concatenate([c + s for (_, c), s in zip(results, starts)])
+        return times, cells
+
+    def sample(self, start_time, end_time):
+        """Will return an array of the same shape as that used by the
+        background event, each entry of which is an array of zero or
+        more times of events.
+        """
+        times, cells = self._sample_flat(start_time, end_time)
+        order = _np.lexsort((times, cells))
+        times, cells = times[order], cells[order]
+        splits = _np.searchsorted(cells, _np.arange(1, self.mus.size))
+        out = _np.empty(self.mus.size, dtype=object)
+        for index, cell_times in enumerate(_np.split(times, splits)):
+            out[index] = cell_times
+        return out.reshape(self.mus.shape)
+
+    def sample_to_randomised_grid(self, start_time, end_time, grid_size):
+        """Asuming that the background rate is a two-dimensional array,
+        generate (uniformly at random) event locations so when confinded to
+        a grid, the time-stamps agree with simulated data for that grid cell.
+        We treat the input background rate as a matrix, so it has entries
+        [row, col] or [y, x].
+        
+        :return: An array of shape (3,N) of N sampled points
+        """
+        times, cells = self._sample_flat(start_time, end_time)
+        rows, cols = _np.unravel_index(cells, self.mus.shape)
+        xcs = (self._random_state.random_sample(len(times)) + cols) * grid_size
+        ycs = (self._random_state.random_sample(len(times)) + rows) * grid_size
+        order = _np.argsort(times, kind="mergesort")
+        return _np.vstack([times, xcs, ycs])[:,order]
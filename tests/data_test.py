@@ -1,4 +1,5 @@
 import pytest
+import unittest.mock as mock
 from open_cp.data import Point, RectangularRegion, TimedPoints
 import open_cp.data
 import datetime
@@ -266,6 +267,130 @@ def test_TimedPoints_bin(timedpoints):
     np.testing.assert_allclose(ts.coords, timedpoints.coords)
 
 
+def test_TimedPoints_slicing(timedpoints):
+    tp = timedpoints[1:4]
+    assert tp.number_data_points == 3
+    assert np.shares_memory(tp.coords, timedpoints.coords)
+    np.testing.assert_array_equal(tp.timestamps, timedpoints.timestamps[1:4])
+
+    tp = timedpoints[::-1]
+    np.testing.assert_array_equal(tp.timestamps, timedpoints.timestamps)
+    np.testing.assert_array_equal(tp.coords, timedpoints.coords)
+
+    tp = timedpoints[np.asarray([3, 0, 4, 3])]
+    np.testing.assert_array_equal(tp.xcoords, timedpoints.xcoords[[0, 3, 3, 4]])
+    assert timedpoints[np.int64(2)][0] == timedpoints.timestamps[2]
+
+def test_TimedPoints_stable_resort():
+    times = [dt(2017,1,1), dt(2017,1,2), dt(2017,1,2), dt(2017,1,3)]
+    tp = TimedPoints.from_coords(times, [1, 2, 3, 4], [5, 6, 7, 8])
+    tp1 = tp[[3, 2, 1, 0]]
+    np.testing.assert_array_equal(tp1.xcoords, [1, 3, 2, 4])
+    np.testing.assert_array_equal(tp1.ycoords, [5, 7, 6, 8])
+    # The original is unchanged
+    np.testing.assert_array_equal(tp.xcoords, [1, 2, 3, 4])
+
+def test_TimedPoints_time_window(timedpoints):
+    tp = timedpoints.time_window(datetime.datetime(2017,1,2,14,23), datetime.datetime(2017,1,3,4,5))
+    np.testing.assert_array_equal(tp.coords, timedpoints.coords[:, 1:3])
+    assert np.shares_memory(tp.coords, timedpoints.coords)
+    assert timedpoints.time_window(end=datetime.datetime(2017,1,1)).empty
+    assert timedpoints.time_window(start=datetime.datetime(2017,1,5)).empty
+    assert timedpoints.time_window(datetime.datetime(2017,1,4), datetime.datetime(2017,1,3)).empty
+    assert timedpoints.time_window().number_data_points == 5
+
+    starts = [datetime.datetime(2017,1,d) for d in [1, 2, 3, 4, 5]]
+    ends = [datetime.datetime(2017,1,d) for d in [2, 3, 4, 5, 6]]
+    windows = timedpoints.time_windows(starts, ends)
+    assert [w.number_data_points for w in windows] == [0, 2, 2, 1, 0]
+    for start, end, window in zip(starts, ends, windows):
+        mask = (timedpoints.timestamps >= start) & (timedpoints.timestamps < end)
+        np.testing.assert_array_equal(window.coords, timedpoints.coords[:, mask])
+    with pytest.raises(ValueError):
+        timedpoints.time_windows(starts, ends[:2])
+
+    tp = timedpoints.events_before(datetime.datetime(2017,1,3,4,5))
+    assert tp.number_data_points == 4
+
+
+@pytest.fixture
+def event_store_data():
+    times = [datetime.datetime(2017,1,d) for d in [5, 2, 3, 2, 9, 7]]
+    x = [1, 2, 3, 4, 5, 6]
+    y = [10, 20, 30, 40, 50, 60]
+    types = ["theft", "assault", "theft", "burglary", "theft", "assault"]
+    return times, x, y, types
+
+def test_EventStore(event_store_data, tmpdir):
+    times, x, y, types = event_store_data
+    path = str(tmpdir.join("store"))
+    store = open_cp.data.EventStore.from_arrays(path, times, x, y,
+        {"type" : types, "count" : [1,2,3,4,5,6]})
+    assert len(store) == 6
+    # Stable sort by time
+    np.testing.assert_array_equal(store.coords[0], [2, 4, 3, 1, 6, 5])
+    assert store.timestamps.dtype == np.dtype("datetime64[ms]")
+    assert set(store.column_names) == {"type", "count"}
+    assert store.categories("type") == ["assault", "burglary", "theft"]
+    assert store.categories("count") is None
+    np.testing.assert_array_equal(store.codes("type"), [0, 1, 2, 2, 0, 2])
+    np.testing.assert_array_equal(store.column("count"), [2, 4, 3, 1, 6, 5])
+
+    store = open_cp.data.EventStore(path)
+    assert isinstance(store.coords, np.memmap)
+    assert store.time_window(datetime.datetime(2017,1,3), datetime.datetime(2017,1,7)) == slice(2, 4)
+    assert store.time_window(None, datetime.datetime(2017,1,1)) == slice(0, 0)
+    tp = store.timed_points(datetime.datetime(2017,1,3), datetime.datetime(2017,1,8))
+    np.testing.assert_array_equal(tp.xcoords, [3, 1, 6])
+    np.testing.assert_array_equal(tp.ycoords, [30, 10, 60])
+    assert tp.timestamps[0] == np.datetime64("2017-01-03")
+
+    bbox = RectangularRegion(xmin=2, xmax=5, ymin=0, ymax=45)
+    index = store.select(datetime.datetime(2017,1,2), None, bbox, chunk_size=2)
+    np.testing.assert_array_equal(index, [0, 1, 2])
+    np.testing.assert_array_equal(store.column("type", index), ["assault", "burglary", "theft"])
+    tp = store.timed_points(bbox=bbox)
+    np.testing.assert_array_equal(tp.xcoords, [2, 4, 3])
+
+def test_EventStore_create(event_store_data, tmpdir):
+    times, x, y, types = event_store_data
+    tp = TimedPoints.from_coords(times, x, y)
+    path = str(tmpdir.join("store"))
+    open_cp.data.EventStore.create(path, tp, coord_dtype=np.float32)
+    store = open_cp.data.EventStore(path, mmap_mode=None)
+    assert store.coords.dtype == np.float32
+    assert store.column_names == []
+    tp1 = store.timed_points()
+    assert tp1.coords.dtype == np.float64
+    np.testing.assert_array_equal(tp1.coords, tp.coords)
+    np.testing.assert_array_equal(tp1.timestamps, tp.timestamps)
+
+    with pytest.raises(ValueError):
+        open_cp.data.EventStore.create(path, tp, coord_dtype=np.int64)
+    with pytest.raises(ValueError):
+        open_cp.data.EventStore.from_arrays(path, times, x, y[:5])
+    with pytest.raises(ValueError):
+        open_cp.data.EventStore.from_arrays(path, times, x, y, {"coords" : x})
+
+def test_EventStore_overwrite(event_store_data, tmpdir):
+    times, x, y, types = event_store_data
+    path = str(tmpdir.join("store"))
+    open_cp.data.EventStore.from_arrays(path, times, x, y)
+    store = open_cp.data.EventStore.from_arrays(path, times[:3], x[:3], y[:3])
+    assert len(store) == 3
+    assert [p.basename for p in tmpdir.listdir()] == ["store"]
+
+    other = tmpdir.mkdir("other")
+    other.join("thesis.txt").write("important")
+    with pytest.raises(ValueError):
+        open_cp.data.EventStore.from_arrays(str(other), times, x, y)
+    assert other.join("thesis.txt").read() == "important"
+    assert sorted(p.basename for p in tmpdir.listdir()) == ["other", "store"]
+
+    empty = str(tmpdir.mkdir("empty"))
+    assert len(open_cp.data.EventStore.from_arrays(empty, times, x, y)) == len(times)
+
+
 def test_project_from_lon_lat():
     tp = TimedPoints([np.datetime64("2016-12")], [[-1.5],[50]])
     tp1 = open_cp.data.points_from_lon_lat(tp, epsg=7405)
@@ -276,4 +401,39 @@ def test_project_from_lon_lat():
     import pyproj, math
     proj = pyproj.Proj({"init": "epsg:4326"})
     tp2 = open_cp.data.points_from_lon_lat(tp, proj=proj)
-    npt.assert_allclose( tp.coords / 180 * math.pi, tp2.coords )
\ No newline at end of file
+    npt.assert_allclose( tp.coords / 180 * math.pi, tp2.coords )
+
+
+def test_get_projection():
+    proj = open_cp.data.get_projection(7405)
+    assert open_cp.data.get_projection(7405) is proj
+    assert open_cp.data.get_projection(proj_string="+proj=utm +zone=30 +units=m") is not proj
+    with pytest.raises(ValueError):
+        open_cp.data.get_projection()
+
+def test_project_lon_lat(tmpdir):
+    rng = np.random.RandomState(5)
+    lons = rng.random_sample(25) * 3 - 2
+    lats = rng.random_sample(25) * 3 + 50
+    proj = open_cp.data.get_projection(7405)
+    expected = np.asarray([proj(x, y) for x, y in zip(lons, lats)]).T
+    np.testing.assert_allclose(open_cp.data.project_lon_lat(lons, lats, proj, chunk_size=7), expected)
+
+    cache_dir = str(tmpdir.join("cache"))
+    got = open_cp.data.project_lon_lat(lons, lats, proj, cache_dir=cache_dir)
+    np.testing.assert_allclose(got, expected)
+    assert len(tmpdir.join("cache").listdir()) == 1
+    # Read back from the cache, and not recomputed
+    mock_proj = mock.Mock()
+    mock_proj.srs = proj.srs
+    got = open_cp.data.project_lon_lat(lons, lats, mock_proj, cache_dir=cache_dir)
+    np.testing.assert_allclose(got, expected)
+    assert not mock_proj.called
+
+    times = [datetime.datetime(2017,1,1)] * 25
+    tp = open_cp.data.points_from_lon_lat(TimedPoints(times, [lons, lats]),
+        epsg=7405, cache_dir=cache_dir)
+    np.testing.assert_allclose(tp.coords, expected)
+
+    with pytest.raises(ValueError):
+        open_cp.data.project_lon_lat(lons, lats[:5], proj)
@@ -123,6 +123,24 @@ def test_hit_rate_out_of_range(prediction):
     out = evaluation.hit_rates(prediction, tp, {1, 5, 100})
     assert set(out.values()) == {0}
     
+def test_hit_counts_ties_and_mask():
+    matrix = np.ma.array([[1,3,3,0], [3,3,2,3]], mask=[[False]*4, [False,False,False,True]])
+    pred = open_cp.predictors.GridPredictionArray(xsize=10, ysize=10, matrix=matrix)
+    # One event in each cell, and an extra in cell (0,0)
+    x = 5 + 10 * np.array([0,1,2,3,0,1,2,3,0])
+    y = 5 + 10 * np.array([0,0,0,0,1,1,1,1,0])
+    tp = open_cp.data.TimedPoints.from_coords([np.datetime64("2017-01-01")] * 9, x, y)
+    coverages = list(range(0, 101, 10))
+    out = evaluation.hit_counts(pred, tp, coverages)
+    for coverage in coverages:
+        covered = evaluation.top_slice(matrix, coverage / 100)
+        expected = np.sum(covered[y // 10, x // 10])
+        assert out[coverage] == (expected, 9)
+    # 7 valid cells; at 30% the 2 covered are the last two cells of risk 3
+    assert out[30] == (2, 9)
+    np.testing.assert_array_equal(evaluation.top_slice(matrix, 0.3),
+        [[False, False, False, False], [True, True, False, False]])
+
 @pytest.fixture
 def masked_prediction():
     mask = [[True, False, False, False], [True, True, False, True]]
@@ -214,6 +232,23 @@ def test_brier_score_mask_agg(masked_prediction):
     worst = (1/7)*((2/28)**2 + (2/10)**2) + (3/7)*((12/28)**2 + (5/10)**2) + (3/7)*((14/28)**2 + (3/10)**2)
     assert 1 - expected / worst == pytest.approx(skill)
 
+def test_multiscale_scores_all_sizes(masked_prediction):
+    masked_prediction1 = masked_prediction.renormalise()
+    tp = open_cp.data.TimedPoints.from_coords([np.datetime64("2017-01-01")] * 5,
+        [12,12, 22, 24,24], [3,3, 23, 5,5])
+    out = evaluation.multiscale_brier_scores(masked_prediction1, tp)
+    assert set(out) == {1, 2}
+    for size in [1, 2]:
+        expected = evaluation.multiscale_brier_score(masked_prediction1, tp, size)
+        assert out[size] == pytest.approx(expected)
+    expected = (1/7)*(2/28 - 2/10)**2 + (3/7)*(12/28 - 5/10)**2 + (3/7)*(14/28 - 3/10)**2
+    assert out[2][0] == pytest.approx(expected / 200)
+
+    out = evaluation.multiscale_kl_scores(masked_prediction1, tp, [2, 1])
+    assert out[1] == pytest.approx(evaluation.kl_score(masked_prediction1, tp))
+    with pytest.raises(ValueError):
+        evaluation.multiscale_kl_scores(masked_prediction1, tp, [3])
+
 def test_inverse_hit_rate2(masked_prediction1):
     t = [np.datetime64("2017-01-01")] * 3
     x = [12,12, 22]
@@ -282,6 +317,28 @@ def test_kl_score(prediction_with_zeros, timed_pts_5):
     expected += sum( _test_kl_log(1-x, 1-y) for x, y in zip(a, b) )
     assert expected / (200 * 8) == pytest.approx(score)
 
+def test_multiscale_kl_scores_tiny_risk():
+    # Summed-area table differences lose all precision for these windows
+    matrix = np.zeros((30, 30))
+    matrix[10:15, 10:15] = 1e-25
+    matrix[0, 0] = 1
+    pred = open_cp.predictors.GridPredictionArray(10, 10, matrix)
+    tp = open_cp.data.TimedPoints.from_coords([np.datetime64("2017-01-01")] * 3,
+        [115, 125, 135], [115, 125, 105])
+    out = evaluation.multiscale_kl_scores(pred, tp, [1, 3])
+    assert out[1] == pytest.approx(evaluation.kl_score(pred, tp))
+
+    counts = np.zeros((30, 30))
+    counts[[11, 12, 10], [11, 12, 13]] = 1
+    risk, u = [], []
+    for y in range(28):
+        for x in range(28):
+            risk.append(np.sum(matrix[y:y+3, x:x+3]))
+            u.append(np.sum(counts[y:y+3, x:x+3]))
+    risk, u = np.asarray(risk) / np.sum(risk), np.asarray(u) / np.sum(u)
+    expected = sum(_test_kl_log(a, b) + _test_kl_log(1-a, 1-b) for a, b in zip(u, risk))
+    assert out[3] == pytest.approx(expected / (28 * 28 * 100))
+
 def test_kl_score_multi(prediction_with_zeros, timed_pts_5):
     pred = prediction_with_zeros.renormalise()
     score = evaluation.multiscale_kl_score(pred, timed_pts_5, 1)
@@ -324,6 +381,23 @@ def test_bayesian_dirichlet_prior_masked():
     assert exp == pytest.approx(score)
     np.testing.assert_allclose(pred.intensity_matrix.data, [[1,2,3]])
 
+def test_bayesian_dirichlet_prior_non_integer_alpha():
+    # alpha = 10 * 2 / 17 = 1.176..., where np.arange(alpha, alpha + 1)
+    # has two entries
+    matrix = np.array([[15, 2]])
+    pred = open_cp.predictors.GridPredictionArray(xsize=10, ysize=20, matrix=matrix, xoffset=2, yoffset=3)
+    tp = open_cp.data.TimedPoints.from_coords([np.datetime64("2017-01-01T12:00")], [12], [5])
+    score = evaluation.bayesian_dirichlet_prior(pred, tp)
+
+    alpha = 10 * 2 / 17
+    exp = np.log(10 / alpha) + scipy.special.digamma(alpha + 1) - scipy.special.digamma(11)
+    assert score == pytest.approx(exp)
+
+    counts = evaluation.event_histogram(pred, tp, "2017-01-01", 1)
+    out = evaluation.batch_scores(np.array([matrix]), counts, pred,
+        scores=["bayesian_dirichlet_prior"])
+    assert out["bayesian_dirichlet_prior"][0] == pytest.approx(score)
+
 def test_bayesian_predictive():
     matrix = np.ma.array([[1,2]], mask=[False, False])
     pred = open_cp.predictors.GridPredictionArray(xsize=10, ysize=20, matrix=matrix, xoffset=2, yoffset=3)
@@ -437,6 +511,62 @@ def test_poisson_crps_score_with_mask():
     
     assert evaluation.poisson_crps_score(pred, tp) == pytest.approx(expected)
 
+def test_event_histogram():
+    grid = open_cp.data.MaskedGrid(xsize=10, ysize=20, xoffset=2, yoffset=3,
+        mask=[[False]*2, [False]*2])
+    t = [np.datetime64("2017-01-01T12:00"), np.datetime64("2017-01-02T01:00"),
+        np.datetime64("2017-01-02T02:00"), np.datetime64("2017-01-02T03:00"),
+        np.datetime64("2017-01-04T00:00")]
+    tp = open_cp.data.TimedPoints.from_coords(t, [2, 12, 12, 50, 2], [5, 25, 25, 5, 5])
+    counts = evaluation.event_histogram(grid, tp, "2017-01-01", 3)
+    assert counts.shape == (3, 2, 2)
+    np.testing.assert_array_equal(counts[0], [[1,0], [0,0]])
+    np.testing.assert_array_equal(counts[1], [[0,0], [0,2]])
+    np.testing.assert_array_equal(counts[2], [[0,0], [0,0]])
+
+def test_batch_scores():
+    mask = [[False, False, False], [True, False, True]]
+    matrices = [np.ma.array([[1,2,0],[3,4,5]], mask=mask),
+        np.ma.array([[1,1,1],[1,1,1]], mask=mask),
+        np.ma.array([[0,2,1],[0,1,0]], mask=mask)]
+    preds = [open_cp.predictors.GridPredictionArray(xsize=10, ysize=20,
+        matrix=m, xoffset=2, yoffset=3).renormalise() for m in matrices]
+    stack = np.ma.array([p.intensity_matrix for p in preds])
+    t = [np.datetime64("2017-01-01T12:00")] * 3 + [np.datetime64("2017-01-02T12:00")] * 2
+    tp = open_cp.data.TimedPoints.from_coords(t, [2, 2, 15, 22, 12], [5, 5, 5, 5, 30])
+    counts = evaluation.event_histogram(preds[0], tp, "2017-01-01", 3)
+
+    for chunk_size in [None, 2]:
+        out = evaluation.batch_scores(stack, counts, preds[0], chunk_size=chunk_size)
+        assert set(out) == set(evaluation.BATCH_SCORES)
+        for day in range(2):
+            points = tp[tp.timestamps < np.datetime64("2017-01-02")] if day == 0 else tp[3:]
+            pred = preds[day]
+            assert out["likelihood"][day] == pytest.approx(evaluation.likelihood(pred, points))
+            score, skill = evaluation.brier_score(pred, points)
+            assert out["brier_score"][day] == pytest.approx(score)
+            assert out["brier_skill"][day] == pytest.approx(skill)
+            assert out["kl_score"][day] == pytest.approx(evaluation.kl_score(pred, points))
+            assert out["poisson_crps_score"][day] == pytest.approx(evaluation.poisson_crps_score(pred, points))
+            assert out["bayesian_dirichlet_prior"][day] == pytest.approx(
+                evaluation.bayesian_dirichlet_prior(pred, points))
+            assert out["bayesian_predictive"][day] == pytest.approx(
+                evaluation.bayesian_predictive(pred, points))
+            assert out["ranking_score"][day] == pytest.approx(
+                np.mean(evaluation.ranking_score(pred, points)))
+        assert out["likelihood"][2] == 0
+        assert np.isnan(out["brier_score"][2])
+
+    out = evaluation.batch_scores(stack.data, counts, preds[0], mask=mask, scores=["kl_score"])
+    assert set(out) == {"kl_score"}
+    assert out["kl_score"][0] == pytest.approx(evaluation.kl_score(preds[0], tp[:3]))
+
+    with pytest.raises(ValueError):
+        evaluation.batch_scores(stack, counts, preds[0], scores=["bob"])
+    counts[0,1,0] = 1
+    with pytest.raises(ValueError):
+        evaluation.batch_scores(stack, counts, preds[0])
+
 @mock.patch("open_cp.evaluation._kernels")
 def test_score_kde(kernels_mock):
     mask = np.asarray([[True, False, False], [False]*3])
@@ -502,6 +632,61 @@ def test_score_kde_fixed_bandwidth(kernels_mock):
                                [[1,0],[0,1]])
     assert kernels_mock.GaussianEdgeCorrectGrid.return_value.bandwidth == 12.3
 
+@pytest.fixture
+def kde_scorer_data():
+    rng = np.random.RandomState(17)
+    mask = rng.random_sample((8, 10)) < 0.3
+    grid = open_cp.data.MaskedGrid(xsize=10, ysize=20, xoffset=5, yoffset=7, mask=mask)
+    preds, tps = [], []
+    for _ in range(3):
+        pred = open_cp.predictors.GridPredictionArray(xsize=10, ysize=20,
+            xoffset=5, yoffset=7, matrix=rng.random_sample((8, 10)))
+        pred.mask_with(grid)
+        preds.append(pred.renormalise())
+        gx, gy = np.nonzero(~mask.T)
+        choice = rng.randint(len(gx), size=20)
+        xcs = (gx[choice] + rng.random_sample(20)) * 10 + 5
+        ycs = (gy[choice] + rng.random_sample(20)) * 20 + 7
+        times = [datetime.datetime(2017,3,1)] * 20
+        tps.append(open_cp.data.TimedPoints.from_coords(times, xcs, ycs))
+    return grid, preds, tps
+
+def test_KDEScorer(kde_scorer_data):
+    grid, preds, tps = kde_scorer_data
+    for i, (pred, tp) in enumerate(zip(preds, tps)):
+        np.random.seed(i)
+        expected = evaluation.score_kde(pred, tp, grid)
+        np.random.seed(i)
+        scorer = evaluation.KDEScorer(grid)
+        assert scorer.score(pred, tp) == pytest.approx(expected)
+
+    np.random.seed(5)
+    expected = evaluation.score_kde_fixed_bandwidth(preds[0], tps[0], grid, 12.3)
+    np.random.seed(5)
+    scorer = evaluation.KDEScorer(grid, bandwidth=12.3)
+    assert scorer.bandwidth == 12.3
+    assert scorer.score(preds[0], tps[0]) == pytest.approx(expected)
+
+def test_KDEScorer_score_many(kde_scorer_data):
+    grid, preds, tps = kde_scorer_data
+    scorer = evaluation.KDEScorer(grid, bandwidth=15)
+    got = scorer.score_many(preds, tps)
+    assert got.shape == (3,)
+    # One bandwidth, so one set of correction factors
+    assert len(scorer._corrections) == 1
+    for pred, tp, score in zip(preds, tps, got):
+        assert scorer.score(pred, tp) == pytest.approx(score)
+
+    kde = scorer.kde_prediction(preds[0], tps[0])
+    assert np.ma.sum(kde.intensity_matrix) == pytest.approx(1)
+    np.testing.assert_array_equal(kde.intensity_matrix.mask, grid.mask)
+
+    with pytest.raises(ValueError):
+        scorer.score_many(preds, tps[:2])
+    with pytest.raises(ValueError):
+        scorer.score(preds[0], open_cp.data.TimedPoints.from_coords(
+            tps[0].timestamps[:2], tps[0].xcoords[:2], tps[0].ycoords[:2]))
+
 
 
 def test_grid_risk_coverage_to_graph(prediction):
@@ -600,6 +785,39 @@ def test_grid_risk_to_graph_split1(prediction, graph1):
     b.add_edge(1, 2)
     assert open_cp.network.approximately_equal(g, b.build())
 
+def test_GridNetworkIntersection(prediction, graph1):
+    inter = evaluation.GridNetworkIntersection(prediction, graph1)
+    assert inter.graph is graph1
+    # Edge (10,4) to (14,6) splits at x=12 into cells (0,0) and (1,0)
+    matrix = inter.matrix.toarray()
+    assert matrix.shape == (1, 8)
+    np.testing.assert_allclose(matrix[0], [np.sqrt(5), np.sqrt(5), 0, 0, 0, 0, 0, 0])
+    gx, gy = inter.most_cells()
+    np.testing.assert_array_equal(gx, [0])
+    np.testing.assert_array_equal(gy, [0])
+    np.testing.assert_allclose(inter.risks_most(prediction), [1])
+
+    matrix = np.ma.masked_array([[1,2,3,4], [5,6,7,8]], [[True]+[False]*3, [False]*4])
+    masked = open_cp.predictors.GridPredictionArray(xsize=10, ysize=20,
+        matrix=matrix, xoffset=2, yoffset=3)
+    np.testing.assert_allclose(inter.risks_most(masked), [0])
+    np.testing.assert_array_equal(inter.covered_edges([[False,True,False,False], [False]*4]), [True])
+    np.testing.assert_array_equal(inter.covered_edges([[False,True,False,False], [False]*4], 0.6), [False])
+
+    other = open_cp.predictors.GridPredictionArray(xsize=10, ysize=20,
+        matrix=matrix, xoffset=3, yoffset=3)
+    with pytest.raises(ValueError):
+        inter.risks_most(other)
+
+def test_grid_risk_to_graph_reuses_intersection(prediction, graph):
+    inter = evaluation.GridNetworkIntersection(prediction, graph)
+    for scale in [1, 2]:
+        pred = open_cp.predictors.GridPredictionArray(xsize=10, ysize=20,
+            matrix=prediction.intensity_matrix * scale, xoffset=2, yoffset=3)
+        g, _, risks = evaluation.grid_risk_to_graph(pred, graph, intersection=inter)
+        assert g is graph
+        np.testing.assert_allclose(risks, [scale, 2 * scale])
+
 def test_network_coverage(graph):
     out = evaluation.network_coverage(graph, [3,5], 0.5)
     np.testing.assert_allclose(out, [False, False])
@@ -627,6 +845,17 @@ def test_network_hit_rates_from_coverage(network_points, graph2):
     assert out[75] == pytest.approx(200/3)
 
 
+def test_network_hit_counts_from_coverage(network_points, graph2):
+    out = evaluation.network_hit_counts_from_coverage(graph2, [1, 2, 3, 4],
+        network_points, range(0, 101, 25))
+    assert out == {0:(0,3), 25:(1,3), 50:(1,3), 75:(2,3), 100:(3,3)}
+
+    times = [np.datetime64("2017-01-01")] * 2
+    points = open_cp.network.TimedNetworkPoints(times, [((0,1), 0.5), ((0,4), 0.2)])
+    with pytest.raises(KeyError):
+        evaluation.network_hit_counts_from_coverage(graph2, [1, 2, 3, 4], points, [50])
+    assert evaluation.network_hit_counts(graph2, points) == (1, 2)
+
 #############################################################################
 # Automate prediction making and evaluating testing
 #############################################################################
@@ -806,4 +1035,78 @@ def test_STScanProvider(mock_provider, timed_pts_10):
     pred1 = prov1.predict(datetime.datetime(2017,2,3))
     assert mock_provider.call_count == 1
     assert pred1 is stresult.grid_prediction.return_value.renormalise.return_value
-    
\ No newline at end of file
+    
+
+class RandomProvider(evaluation.StandardPredictionProvider):
+    def give_prediction(self, grid, points, time):
+        matrix = np.random.random((grid.yextent, grid.xextent)) + points.number_data_points
+        return open_cp.predictors.GridPredictionArray(grid.xsize, grid.ysize,
+            matrix, grid.xoffset, grid.yoffset)
+
+
+class ListProvider(RandomProvider):
+    def predict(self, time):
+        return [super().predict(time), super().predict(time)]
+
+
+@pytest.fixture
+def hit_rate_evaluator_data():
+    rng = np.random.RandomState(7)
+    times = np.datetime64("2017-01-01") + np.sort(rng.randint(0, 30*24*60, size=500)).astype("timedelta64[m]")
+    points = open_cp.data.TimedPoints(times, rng.random_sample((2, 500)) * [[100], [50]])
+    mask = rng.random_sample((5, 10)) < 0.2
+    grid = open_cp.data.MaskedGrid(10, 10, 0, 0, mask)
+    times = list(evaluation.HitRateEvaluator.time_range(np.datetime64("2017-01-10"),
+        np.datetime64("2017-02-05"), np.timedelta64(1, "D")))
+    return points, grid, times
+
+def test_HitRateEvaluator_run_parallel(hit_rate_evaluator_data):
+    points, grid, times = hit_rate_evaluator_data
+    evaluator = evaluation.HitRateEvaluator(evaluation.NaiveProvider(points, grid))
+    evaluator.data = points
+    table = evaluator.run_parallel(times, [1, 10, 50], processes=1)
+    expected = evaluator.run(times, [1, 10, 50]).rates
+    # No events after the end of January
+    assert len(table) == len(expected) == 21
+    assert table.hits.shape == (21, 3)
+    np.testing.assert_array_equal(table.prediction_index, -1)
+    assert np.all(table.cell_counts == np.sum(~grid.mask))
+    got = table.to_dict()
+    for start, rates in expected.items():
+        start = start.astype("datetime64[ms]").astype(datetime.datetime)
+        for level, rate in rates.items():
+            assert got[start][level] == pytest.approx(rate)
+
+    other = evaluator.run_parallel(times, [1, 10, 50], processes=2, chunk_size=5)
+    np.testing.assert_array_equal(table.starts, other.starts)
+    np.testing.assert_array_equal(table.hits, other.hits)
+    np.testing.assert_array_equal(table.totals, other.totals)
+
+def test_HitRateEvaluator_run_parallel_seeded(hit_rate_evaluator_data):
+    points, grid, times = hit_rate_evaluator_data
+    evaluator = evaluation.HitRateEvaluator(RandomProvider(points, grid))
+    evaluator.data = points
+    table = evaluator.run_parallel(times, [5, 20], processes=1, seed=12)
+    other = evaluator.run_parallel(times, [5, 20], processes=2, seed=12, chunk_size=3)
+    np.testing.assert_array_equal(table.hits, other.hits)
+    np.testing.assert_allclose(table.rates, table.hits / table.totals[:,None])
+
+    evaluator = evaluation.HitRateEvaluator(ListProvider(points, grid))
+    evaluator.data = points
+    table = evaluator.run_parallel(times[:3], [5, 20], processes=1, seed=12)
+    np.testing.assert_array_equal(table.prediction_index, [0, 1] * 3)
+    got = table.to_dict()
+    assert len(got) == 3
+    for rates in got.values():
+        assert len(rates) == 2
+        assert set(rates[0]) == {5, 20}
+
+def test_HitRateEvaluator_run_parallel_keeps_global_random_state(hit_rate_evaluator_data):
+    points, grid, times = hit_rate_evaluator_data
+    evaluator = evaluation.HitRateEvaluator(RandomProvider(points, grid))
+    evaluator.data = points
+    np.random.seed(3)
+    expected = np.random.random(5)
+    np.random.seed(3)
+    evaluator.run_parallel(times, [5, 20], processes=1, seed=12)
+    np.testing.assert_array_equal(np.random.random(5), expected)
@@ -41,6 +41,55 @@ def test_mask_grid_by_intersection():
 
     assert not mg.mask.any()
 
+@pytest.fixture
+def holey_geometry():
+    angles = np.linspace(0, 2 * np.pi, 200, endpoint=False)
+    outer = np.asarray([50 + 40 * np.cos(angles), 50 + 30 * np.sin(angles)]).T
+    hole = [[40,40], [40,60], [60,60], [60,40]]
+    other = [[100,0], [130,10], [110,35]]
+    return shapely.geometry.MultiPolygon([shapely.geometry.Polygon(outer, [hole]),
+        shapely.geometry.Polygon(other)])
+
+def test_rasterise_geometry_overlap(holey_geometry):
+    grid = open_cp.data.Grid(xsize=7, ysize=5, xoffset=2, yoffset=-1)
+    mg = geometry.rasterise_geometry(holey_geometry, grid)
+    expected = geometry.mask_grid_by_intersection(holey_geometry, grid)
+    assert (mg.xoffset, mg.yoffset) == (expected.xoffset, expected.yoffset)
+    assert mg.mask.shape == expected.mask.shape
+    # Only cells which touch the geometry along an edge may differ
+    assert np.sum(mg.mask != expected.mask) <= 2
+    assert np.all(mg.mask >= expected.mask)
+    # Cells in the middle of the hole
+    assert mg.mask[10, 5] and mg.mask[10, 6]
+
+    mg = geometry.mask_grid_by_intersection(holey_geometry, grid, mode="overlap")
+    expected = set(geometry.grid_intersection(holey_geometry, grid))
+    assert (mg.xoffset, mg.yoffset) == (9, -1)
+    got = set((x + 1, y) for y, x in zip(*np.nonzero(~mg.mask)))
+    assert got == expected
+
+def test_rasterise_geometry_centre(holey_geometry):
+    grid = open_cp.data.Grid(xsize=3, ysize=4, xoffset=0, yoffset=0)
+    mg = geometry.rasterise_geometry(holey_geometry, grid, mode="centre")
+    for y in range(mg.yextent):
+        for x in range(mg.xextent):
+            pt = shapely.geometry.Point(mg.xoffset + (x + 0.5) * 3, mg.yoffset + (y + 0.5) * 4)
+            assert mg.is_valid(x, y) == holey_geometry.contains(pt)
+
+    with pytest.raises(ValueError):
+        geometry.rasterise_geometry(holey_geometry, grid, mode="bob")
+
+def test_rasterise_geometry_aligned():
+    geo = shapely.geometry.Polygon([[0,0],[10,0],[10,10],[0,10]])
+    grid = open_cp.data.Grid(xsize=5, ysize=5, xoffset=0, yoffset=0)
+    assert set(geometry.grid_intersection(geo, grid)) == {(0,0), (1,0), (0,1), (1,1)}
+    mg = geometry.rasterise_geometry(geo, grid)
+    assert mg.mask.shape == (3, 3)
+    np.testing.assert_array_equal(mg.mask, [[False, False, True],
+        [False, False, True], [True, True, True]])
+    mg = geometry.mask_grid_by_intersection(geo, grid)
+    assert not mg.mask.any()
+
 @pytest.fixture
 def points1():
     t = [datetime.datetime.now() for _ in range(5)]
@@ -90,6 +139,41 @@ def test_intersect_timed_points(unit_square):
     tt = (tps1.timestamps - np.datetime64("2017-01-01")) / np.timedelta64(1, "D")
     np.testing.assert_allclose(tt, [0,1,4])
     
+def test_intersect_timed_points_duplicates(unit_square):
+    x = [0.5, 2, 0.5, 0.5, 1]
+    y = [0.5, 2, 0.5, 0.2, 0.5]
+    times = [datetime.datetime(2017,1,1) + datetime.timedelta(days=n) for n in range(len(x))]
+    tps = open_cp.data.TimedPoints.from_coords(times,x,y)
+    tps1 = geometry.intersect_timed_points(tps, unit_square)
+    np.testing.assert_allclose(tps1.xcoords, [0.5, 0.5, 0.5, 1])
+    np.testing.assert_allclose(tps1.ycoords, [0.5, 0.5, 0.2, 0.5])
+    tt = (tps1.timestamps - np.datetime64("2017-01-01")) / np.timedelta64(1, "D")
+    np.testing.assert_allclose(tt, [0,2,3,4])
+
+def test_points_in_geometry(holey_geometry):
+    rng = np.random.RandomState(3)
+    x = rng.random_sample(5000) * 150 - 10
+    y = rng.random_sample(5000) * 100 - 10
+    # Vertices and points along edges are on the boundary
+    for poly in holey_geometry.geoms:
+        for ring in [poly.exterior, *poly.interiors]:
+            coords = np.asarray(ring.coords)
+            mid = (coords[:-1] + coords[1:]) / 2
+            x = np.concatenate([x, coords[:,0], mid[:,0]])
+            y = np.concatenate([y, coords[:,1], mid[:,1]])
+    got = geometry.points_in_geometry(holey_geometry, x, y, resolution=20)
+    expected = [holey_geometry.intersects(shapely.geometry.Point(xx, yy)) for xx, yy in zip(x, y)]
+    np.testing.assert_array_equal(got, expected)
+
+def test_mask_grid_by_points_intersection_borders():
+    t = [datetime.datetime.now() for _ in range(3)]
+    # On a vertical border, and on a corner
+    points = open_cp.data.TimedPoints.from_coords(t, [5, 15, 25], [4, 13, 14])
+    grid = open_cp.data.Grid(10, 10, 5, 3)
+    mg = geometry.mask_grid_by_points_intersection(points, grid)
+    assert (mg.xoffset, mg.yoffset, mg.xextent, mg.yextent) == (5, 3, 3, 2)
+    np.testing.assert_array_equal(mg.mask, [[False, False, True], [False, False, False]])
+
 def test_configure_gdal():
     geometry.configure_gdal()
     import os
@@ -285,6 +369,23 @@ def test_full_intersect_line_grid():
     assert ints[0][2] == pytest.approx(0)
     assert ints[0][3] == pytest.approx(1)
     
+def test_intersect_lines_grid():
+    grid = open_cp.data.Grid(xsize=10, ysize=10, xoffset=0, yoffset=0)
+    quads = [(2, 2, 30, 30), (5, 5, 7, 8), (15, 2, 5, 2), (3, 3, 3, 3)]
+    indices, gx, gy, t1, t2 = geometry.intersect_lines_grid(quads, grid)
+    np.testing.assert_array_equal(indices, [0, 0, 0, 1, 2, 2, 3])
+    np.testing.assert_array_equal(gx, [0, 1, 2, 0, 1, 0, 0])
+    np.testing.assert_array_equal(gy, [0, 1, 2, 0, 0, 0, 0])
+    np.testing.assert_allclose(t1, [0, 8/28, 18/28, 0, 0, 0.5, 0])
+    np.testing.assert_allclose(t2, [8/28, 18/28, 1, 1, 0.5, 1, 1])
+
+    for quad in quads:
+        _, intervals = geometry.full_intersect_line_grid((quad[:2], quad[2:]), grid)
+        intervals = [i for i in intervals if i[3] - i[2] > 1e-9]
+        indices, gx, gy, t1, t2 = geometry.intersect_lines_grid([quad], grid)
+        assert [i[:2] for i in intervals] == list(zip(gx, gy))
+        np.testing.assert_allclose([i[2:] for i in intervals], np.asarray([t1, t2]).T)
+
 def test_voroni_perp():
     points = np.asarray([[1,2], [2,3], [3,4]])
     x, y = geometry.Voroni.perp_direction(points, 0, 1, [0,0])
@@ -560,6 +560,12 @@ def test_GaussianEdgeCorrectGrid_correction_factor(gecg1):
         expected.append(gecg1.correction_factor((x,y)))
     np.testing.assert_allclose(expected, gecg1.correction_factor(pt))
 
+def test_GaussianEdgeCorrectGrid_correction_factor_many(gecg1):
+    # Crosses a block boundary, and includes points outside the grid
+    pt = np.random.random((2, 2500)) * [[240], [190]] - [[20], [20]]
+    expected = [gecg1.correction_factor((x,y)) for x, y in pt.T]
+    np.testing.assert_allclose(expected, gecg1.correction_factor(pt))
+
 def _masked_grid_to_poly(mg):
     poly = None
     for x in range(mg.xextent):
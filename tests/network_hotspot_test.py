@@ -166,6 +166,21 @@ def test_Predictor(graph, netpoints):
     assert result.risks[0] == pytest.approx(1)
     assert result.risks[1] == pytest.approx(1)
 
+def test_Predictor_binary_graph(graph, netpoints, tmpdir):
+    filename = str(tmpdir.join("graph.bin"))
+    graph.dump_binary(filename)
+    loaded = open_cp.network.PlanarGraph.from_binary(filename)
+    assert loaded.find_edge(np.int64(0), np.int64(1)) == graph.find_edge(0, 1)
+
+    results = []
+    for g in [graph, loaded]:
+        pred = network_hotspot.Predictor(netpoints, g)
+        pred.kernel = network_hotspot.TriangleKernel(0.2)
+        pred.time_kernel = network_hotspot.ConstantTimeKernel()
+        results.append(pred.predict().risks)
+    np.testing.assert_allclose(results[1], results[0])
+    assert results[1][0] == pytest.approx(1)
+
 def test_Predictor_with_time_kernel(graph, netpoints):
     pred = network_hotspot.Predictor(netpoints, graph)
     pred.kernel = network_hotspot.TriangleKernel(0.2)
@@ -211,6 +226,23 @@ def test_Predictor_add_split(graph2):
     pred.add(risks, 7, -1, 0.5)
     np.testing.assert_allclose(risks, [0.25, 0.25, 0, 0, 0.5, 0.5, 0.5, 1, 0])
 
+def test_Predictor_add_walk_options(graph2):
+    pred = network_hotspot.Predictor(None, graph2)
+    pred.kernel = network_hotspot.TriangleKernel(6)
+    expected = np.zeros(9)
+    pred.add(expected, 7, -1, 0.5)
+
+    pred.walk_tolerance = 0
+    risks = np.zeros(9)
+    pred.add(risks, 7, -1, 0.5)
+    np.testing.assert_allclose(risks, expected)
+
+    pred.walk_min_weight = 0.01
+    risks = np.zeros(9)
+    pred.add(risks, 7, -1, 0.5)
+    assert np.all(risks <= expected)
+    assert 0 < np.sum(expected) - np.sum(risks) < 0.1
+
 def test_FastPredictor_add_split(graph2):
     pred = network_hotspot.Predictor(None, graph2)
     pred.kernel = mock.Mock()
@@ -226,6 +258,85 @@ def test_FastPredictor_add_split(graph2):
     pred.add(risks, 7, -1, 0.5)
     np.testing.assert_allclose(risks, [0.25, 0.25, 0, 0, 0.5, 0.5, 0.5, 1, 0])
 
+@pytest.fixture
+def netpoints2():
+    times = [datetime.datetime(2017,8,7,11,30), datetime.datetime(2017,8,7,12,30),
+             datetime.datetime(2017,8,8,9,0)]
+    locations = [ ((1,2), 0.25), ((6,4), 0.75), ((4,7), 0.25) ]
+    return open_cp.network.TimedNetworkPoints(times, locations)
+
+def test_KernelMatrixPredictor(graph2, netpoints2):
+    pred = network_hotspot.Predictor(netpoints2, graph2)
+    pred.kernel = network_hotspot.TriangleKernel(3)
+    pred.time_kernel = network_hotspot.ExponentialTimeKernel(1)
+    kpred = network_hotspot.KernelMatrixPredictor(pred, 2)
+    assert kpred.matrix.shape == (18, 9)
+
+    for predict_time in [None, datetime.datetime(2017,8,8)]:
+        expected = pred.predict(predict_time).risks
+        got = kpred.predict(predict_time).risks
+        np.testing.assert_allclose(got, expected)
+
+def test_KernelMatrixPredictor_bins_events(graph2, netpoints2):
+    pred = network_hotspot.Predictor(netpoints2, graph2)
+    pred.kernel = network_hotspot.TriangleKernel(3)
+    pred.time_kernel = network_hotspot.ConstantTimeKernel()
+    kpred = network_hotspot.KernelMatrixPredictor(pred, 1)
+    expected = np.zeros(9)
+    for edge in [1, 6, 8]:
+        pred.add_edge(expected, edge, 0.5, 1)
+    np.testing.assert_allclose(kpred.predict().risks, expected / graph2.lengths)
+
+def test_KernelMatrixPredictor_save_load(graph2, netpoints2, tmpdir):
+    pred = network_hotspot.Predictor(netpoints2, graph2)
+    pred.kernel = network_hotspot.TriangleKernel(3)
+    pred.time_kernel = network_hotspot.ConstantTimeKernel()
+    kpred = network_hotspot.KernelMatrixPredictor(pred, 3)
+    filename = str(tmpdir.join("kernel.npz"))
+    kpred.save(filename)
+
+    new_pred = network_hotspot.KernelMatrixPredictor(pred, 3)
+    new_pred.load(filename)
+    assert (new_pred._matrix != kpred.matrix).nnz == 0
+    np.testing.assert_allclose(new_pred.predict().risks, kpred.predict().risks)
+
+    new_pred.kernel = network_hotspot.TriangleKernel(2)
+    with pytest.raises(ValueError):
+        new_pred.load(filename)
+    with pytest.raises(ValueError):
+        network_hotspot.KernelMatrixPredictor(pred, 2).load(filename)
+
+    new_pred = network_hotspot.KernelMatrixPredictor(pred, 3)
+    new_pred.walk_tolerance = 0.1
+    with pytest.raises(ValueError):
+        new_pred.load(filename)
+
+def test_KernelMatrixPredictor_fingerprint(tmpdir):
+    # Same numbers of vertices and edges, and same total length
+    vertices = [(0, 0, 0), (1, 1, 0), (2, 2, 0), (3, 3, 0)]
+    graph1 = open_cp.network.PlanarGraph(vertices, [(0,1), (1,2), (2,3)])
+    graph2 = open_cp.network.PlanarGraph(vertices, [(0,1), (2,3), (1,2)])
+    filename = str(tmpdir.join("kernel.npz"))
+    pred = network_hotspot.Predictor(None, graph1)
+    pred.kernel = network_hotspot.TriangleKernel(1.5)
+    network_hotspot.KernelMatrixPredictor(pred, 2).save(filename)
+    pred = network_hotspot.Predictor(None, graph2)
+    pred.kernel = network_hotspot.TriangleKernel(1.5)
+    with pytest.raises(ValueError):
+        network_hotspot.KernelMatrixPredictor(pred, 2).load(filename)
+
+    class Kernel(network_hotspot.NetworkKernel):
+        def __call__(self, x):
+            return np.maximum(0, 1 - np.asarray(x)) * 2
+        @property
+        def cutoff(self):
+            return 1
+    pred.kernel = Kernel()
+    kpred = network_hotspot.KernelMatrixPredictor(pred, 2)
+    assert kpred.matrix.shape == (6, 3)
+    with pytest.raises(ValueError):
+        kpred.save(filename)
+
 def test_Result_coverage(graph2):
     risks = [0,5,4,3,2,6,7,1,8]
     result = network_hotspot.Result(graph2, risks)
@@ -247,12 +358,23 @@ def test_ApproxPredictor(graph):
     pred = network_hotspot.Predictor(None, graph)
     pred.kernel = mock.Mock()
     pred.kernel.return_value = 1.0
+    pred.kernel.cutoff = 100
     pred = network_hotspot.ApproxPredictor(pred)
 
     risks = np.asarray([0,0,0,0], dtype=np.float)
     pred.add_edge(risks, 0, None, 1)
     np.testing.assert_allclose(risks, [1,1,1,1])
-    assert pred.kernel.call_args_list == [mock.call(0), mock.call(1.0), mock.call(2.0), mock.call(1.0)]
+    # One vectorised call for all edges
+    assert len(pred.kernel.call_args_list) == 1
+    np.testing.assert_allclose(pred.kernel.call_args[0][0], [0, 1, 2, 1])
+
+def test_ApproxPredictor_predict_matches_per_event(graph2, netpoints2):
+    pred = network_hotspot.Predictor(netpoints2, graph2)
+    pred.kernel = network_hotspot.TriangleKernel(3)
+    pred.time_kernel = network_hotspot.ExponentialTimeKernel(1)
+    approx = network_hotspot.ApproxPredictor(pred)
+    expected = super(network_hotspot.ApproxPredictor, approx).predict().risks
+    np.testing.assert_allclose(approx.predict().risks, expected)
 
 def test_ApproxPredictorCaching(graph):
     pred = network_hotspot.Predictor(None, graph)
@@ -269,6 +391,7 @@ def test_ApproxPredictor2(graph2):
     pred = network_hotspot.Predictor(None, graph2)
     pred.kernel = mock.Mock()
     pred.kernel.return_value = 1.0
+    pred.kernel.cutoff = 100
     pred = network_hotspot.ApproxPredictor(pred)
     
     risks = np.asarray([0]*9, dtype=np.float)
@@ -285,3 +408,91 @@ def test_ApproxPredictorCaching2(graph2):
     risks = np.asarray([0]*9, dtype=np.float)
     pred.add_edge(risks, 0, None, 1)
     np.testing.assert_allclose(risks, [1, sq2/2, 1/4, sq2/4, sq2/2, 1/4, sq2/4, 2/4, 1/8])
+
+def test_LRUCache():
+    cache = network_hotspot.LRUCache(2)
+    assert cache.get(1, lambda : "a") == "a"
+    assert cache.get(2, lambda : "b") == "b"
+    assert cache.get(1, lambda : "x") == "a"
+    assert cache.get(3, lambda : "c") == "c"
+    assert 2 not in cache
+    assert 1 in cache and 3 in cache
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (1, 3)
+
+    with pytest.raises(ValueError):
+        network_hotspot.LRUCache(0)
+
+def test_ArrayStore(graph, graph2, tmpdir):
+    store = network_hotspot.ArrayStore(str(tmpdir.join("store")))
+    ns = store.namespace(graph, max_length=5)
+    assert ns != store.namespace(graph, max_length=6)
+    assert ns != store.namespace(graph2, max_length=5)
+    assert store.load(ns, (1, -1)) is None
+
+    store.save(ns, (1, -1), (np.arange(3), np.array([0.5, 1.5])))
+    a, b = store.load(ns, (1, -1))
+    np.testing.assert_array_equal(a, [0, 1, 2])
+    np.testing.assert_allclose(b, [0.5, 1.5])
+
+    compute = mock.Mock()
+    compute.return_value = (np.zeros(2),)
+    assert len(store.get(ns, (1, -1), compute)) == 2
+    assert not compute.called
+    store.get(ns, (2, 1), compute)
+    assert compute.called
+    assert len(tmpdir.join("store", ns).listdir()) == 2
+
+def test_ArrayStore_threads(graph, tmpdir):
+    import concurrent.futures
+    store = network_hotspot.ArrayStore(str(tmpdir))
+    ns = store.namespace(graph)
+    arrays = (np.arange(100000),)
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        list(executor.map(lambda _ : store.save(ns, (1,), arrays), range(20)))
+    np.testing.assert_array_equal(store.load(ns, (1,))[0], arrays[0])
+    assert [p.basename for p in tmpdir.join(ns).listdir()] == ["1.npz"]
+
+def test_FastPredictor_bounded_and_stored(graph2, netpoints2, tmpdir):
+    pred = network_hotspot.Predictor(netpoints2, graph2)
+    pred.kernel = network_hotspot.TriangleKernel(3)
+    pred.time_kernel = network_hotspot.ExponentialTimeKernel(1)
+    expected = network_hotspot.FastPredictor(pred, 5).predict().risks
+
+    store = network_hotspot.ArrayStore(str(tmpdir))
+    fast_pred = network_hotspot.FastPredictor(pred, 5, cache_size=1, store=store)
+    np.testing.assert_allclose(fast_pred.predict().risks, expected)
+    assert len(fast_pred.cache) == 1
+    assert fast_pred.cache.misses == 6
+
+    fast_pred = network_hotspot.FastPredictor(pred, 5, store=store)
+    with mock.patch("open_cp.network.walk_with_degrees_bounded") as walk:
+        np.testing.assert_allclose(fast_pred.predict().risks, expected)
+    assert not walk.called
+
+    # Walks made with another tolerance are not shared; the minimum weight
+    # is not used
+    fast_pred.walk_tolerance = 0.5
+    fast_pred.predict()
+    fast_pred.walk_tolerance = None
+    fast_pred.walk_min_weight = 1e-3
+    with mock.patch("open_cp.network.walk_with_degrees_bounded") as walk:
+        np.testing.assert_allclose(fast_pred.predict().risks, expected)
+    assert not walk.called
+    assert len(tmpdir.listdir()) == 2
+
+def test_ApproxPredictorCaching_stored(graph2, netpoints2, tmpdir):
+    pred = network_hotspot.Predictor(netpoints2, graph2)
+    pred.kernel = network_hotspot.TriangleKernel(3)
+    pred.time_kernel = network_hotspot.ConstantTimeKernel()
+    expected = network_hotspot.ApproxPredictor(pred).predict().risks
+
+    store = network_hotspot.ArrayStore(str(tmpdir))
+    approx = network_hotspot.ApproxPredictorCaching(pred, cache_size=2, store=store)
+    np.testing.assert_allclose(approx.predict().risks, expected)
+    assert len(approx.cache) == 2
+
+    approx = network_hotspot.ApproxPredictorCaching(pred, store=store)
+    with mock.patch("open_cp.network.shortest_edge_paths_with_degrees") as paths:
+        np.testing.assert_allclose(approx.predict().risks, expected)
+    assert not paths.called
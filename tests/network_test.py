@@ -87,6 +87,43 @@ def test_PlanarGraphNodeBuilder_tolerance():
     assert b.coord_nodes == [(0,0), (1,1), (5.1,1.2), (2,2)]
     assert b.edges == [(0,1), (1,2), (0,3)]
 
+def test_PlanarGraphNodeHashBuilder_tolerance():
+    b = network.PlanarGraphNodeHashBuilder()
+    b.add_path([(0,0),(1,1),(5.1,1.2)])
+    b.tolerance = 0.2
+    assert b.tolerance == pytest.approx(0.2)
+    b.add_edge(0.1,0.01,2,2)
+    b.add_edge(5.0,1.25,1.15,0.95)
+
+    assert b.coord_nodes == [(0,0), (1,1), (5.1,1.2), (2,2)]
+    assert b.edges == [(0,1), (1,2), (0,3), (2,1)]
+
+def test_PlanarGraphNodeHashBuilder_matches():
+    rng = np.random.RandomState(7)
+    path_lengths = [1, 3, 2, 0, 5] * 40
+    coords = np.round(rng.random_sample((440, 2)) * 5, 1)
+    slow = network.PlanarGraphNodeBuilder()
+    slow.tolerance = 0.15
+    fast = network.PlanarGraphNodeHashBuilder()
+    fast.tolerance = 0.15
+    bulk = network.PlanarGraphNodeHashBuilder()
+    bulk.tolerance = 0.15
+    start = 0
+    for length in path_lengths:
+        slow.add_path(coords[start:start+length].tolist())
+        fast.add_path(coords[start:start+length].tolist())
+        start += length
+    bulk.add_paths(np.hstack([coords, np.zeros((440,1))]), path_lengths)
+
+    assert len(slow.coord_nodes) < 250
+    assert fast.coord_nodes == slow.coord_nodes
+    assert bulk.coord_nodes == slow.coord_nodes
+    assert fast.edges == slow.edges
+    assert bulk.edges == slow.edges
+
+    with pytest.raises(ValueError):
+        bulk.add_paths(coords, [2, 3])
+
 def test_PlanarGraphNodeOneShot():
     nodes = [(0,0), (1,1), (5.1,1.2), (0.1,0.01), (2,2)]
     b = network.PlanarGraphNodeOneShot(nodes, 0.2)
@@ -235,6 +272,50 @@ def test_io(graph1):
     g = network.PlanarGraph.from_bytes(b)
     assert network.approximately_equal(graph1, g)
 
+def test_binary_io(graph1, tmpdir):
+    filename = str(tmpdir.join("graph.bin"))
+    graph1.dump_binary(filename)
+    for mmap_mode in ["r", None]:
+        g = network.PlanarGraph.from_binary(filename, mmap_mode)
+        assert g.vertices == graph1.vertices
+        assert g.edges == graph1.edges
+        np.testing.assert_allclose(g.lengths, graph1.lengths)
+        for key in graph1.vertices:
+            assert g.neighbours(key) == graph1.neighbours(key)
+        assert g.find_edge(3, 2) == graph1.find_edge(3, 2)
+
+def test_binary_io_keys(tmpdir):
+    filename = str(tmpdir.join("graph.bin"))
+    graph = network.PlanarGraph([(10, 0, 0), (3, 1, 0), (7, 1, 1), (12, 5, 5)],
+        [(10, 3), (7, 3)])
+    graph.dump_binary(filename)
+    g = network.PlanarGraph.from_binary(filename)
+    assert g.vertices == graph.vertices
+    assert g.edges == graph.edges
+    assert g.neighbours(3) == [7, 10]
+    assert g.degree(12) == 0
+    dists, _ = network.shortest_paths(g, 10)
+    assert dists == network.shortest_paths(graph, 10)[0]
+
+    graph = network.PlanarGraph([("a", 0, 0), ("b", 1, 0)], [("a", "b")])
+    with pytest.raises(ValueError):
+        graph.dump_binary(filename)
+
+def test_binary_io_checks_header(graph1, tmpdir):
+    filename = str(tmpdir.join("graph.bin"))
+    with open(filename, "wb") as file:
+        file.write(b"Not a graph")
+    with pytest.raises(ValueError):
+        network.PlanarGraph.from_binary(filename)
+
+    graph1.dump_binary(filename)
+    with open(filename, "rb") as file:
+        data = file.read()
+    with open(filename, "wb") as file:
+        file.write(data.replace(b'"version": 1', b'"version": 9'))
+    with pytest.raises(ValueError):
+        network.PlanarGraph.from_binary(filename)
+
 @pytest.fixture
 def graph2():
     b = network.PlanarGraphGeoBuilder()
@@ -461,6 +542,94 @@ def test_Graph_walk_with_degrees(graph2):
                      (1, 0, pytest.approx(np.sqrt(2)), 2),
                      (0, 0, pytest.approx(1), 2)]
 
+def _walk_rows(graph, start, avoid, max_length, max_degree, **kwargs):
+    out = network.walk_with_degrees_bounded(graph, start, avoid, max_length,
+        max_degree, **kwargs)
+    return list(zip(*[x.tolist() for x in out]))
+
+def test_walk_with_degrees_bounded(graph2):
+    for start, avoid, max_length, max_degree in [(0, 1, 1000, 1000),
+            (0, None, 1000, 1000), (0, None, 1.1, 1000), (0, None, 3, 1000),
+            (1, None, 1000, 2), (4, 3, 5, 1000)]:
+        expected = list(graph2.walk_with_degrees(start, avoid, max_length, max_degree))
+        expected[0] = (-1, 0, 0, 1)
+        for tolerance in [None, 0]:
+            got = _walk_rows(graph2, start, avoid, max_length, max_degree,
+                tolerance=tolerance)
+            assert got == expected
+
+@pytest.fixture
+def grid_graph():
+    b = network.PlanarGraphBuilder()
+    for i in range(6):
+        for j in range(6):
+            b.set_vertex(i * 6 + j, i, j)
+            if i > 0:
+                b.add_edge((i - 1) * 6 + j, i * 6 + j)
+            if j > 0:
+                b.add_edge(i * 6 + j - 1, i * 6 + j)
+    return b.build()
+
+def test_walk_with_degrees_bounded_collapses_exactly(grid_graph):
+    for key1, key2 in grid_graph.edges[::7]:
+        expected = list(grid_graph.walk_with_degrees(key1, key2, 6, 20000))
+        expected[0] = (-1, 0, 0, 1)
+        assert _walk_rows(grid_graph, key1, key2, 6, 20000, tolerance=0) == expected
+
+def test_walk_with_degrees_bounded_truncates(graph2):
+    full = _walk_rows(graph2, 0, None, 1000, 1000)
+    got = _walk_rows(graph2, 0, None, 1000, 1000, tail_mass=lambda s : 1,
+        min_weight=0.3)
+    assert set(got) < set(full)
+    assert max(row[3] for row in got) == 2
+    assert _walk_rows(graph2, 0, None, 1000, 1000, tail_mass=lambda s : 1) == full
+
+def test_PlanarGraph_project_points_to_graph(graph1):
+    xcs = [5, -0.5, -0.1, 5, 9, 9, 2.5]
+    ycs = [1, -0.5, 1, 5.2, .4, .6, 2]
+    indices, t = graph1.project_points_to_graph(xcs, ycs)
+    for x, y, index, tt in zip(xcs, ycs, indices, t):
+        edge, expected_t = graph1.project_point_to_graph(x, y)
+        assert graph1.edges[index] == edge
+        assert tt == pytest.approx(expected_t)
+
+def test_BatchPointProjector():
+    rng = np.random.RandomState(7)
+    starts = rng.uniform(0, 100, size=(200, 2))
+    quads = np.hstack([starts, starts + rng.normal(scale=5, size=(200, 2))])
+    xcs = np.concatenate([rng.uniform(-50, 150, size=500), [1e4]])
+    ycs = np.concatenate([rng.uniform(-50, 150, size=500), [-30]])
+    projector = network.PointProjector(quads)
+    expected = np.asarray([projector._project_point(x, y) for x, y in zip(xcs, ycs)])
+    for cell_size in [None, 0.3, 40]:
+        batch = network.BatchPointProjector(quads, cell_size, chunk_size=123)
+        indices, t = batch.project_points(xcs, ycs)
+        np.testing.assert_array_equal(indices, expected[:,0])
+        np.testing.assert_allclose(t, expected[:,1])
+
+    # Segments of zero length are allowed
+    quads[5] = [50, 50, 50, 50]
+    indices, t = network.BatchPointProjector(quads).project_points([50.1], [50])
+    assert indices[0] == 5 and t[0] == 0
+
+    with pytest.raises(ValueError):
+        network.BatchPointProjector([])
+
+def test_BatchPointProjector_distant_clusters():
+    rng = np.random.RandomState(8)
+    starts = rng.uniform(0, 10, size=(100, 2))
+    starts[50:] += 1e7
+    quads = np.hstack([starts, starts + rng.normal(scale=0.1, size=(100, 2))])
+    batch = network.BatchPointProjector(quads)
+    assert batch.cell_size > 1e4
+    xcs = np.concatenate([rng.uniform(0, 10, size=50), 1e7 + rng.uniform(0, 10, size=50)])
+    ycs = np.concatenate([rng.uniform(0, 10, size=50), 1e7 + rng.uniform(0, 10, size=50)])
+    projector = network.PointProjector(quads)
+    expected = np.asarray([projector._project_point(x, y) for x, y in zip(xcs, ycs)])
+    indices, t = batch.project_points(xcs, ycs)
+    np.testing.assert_array_equal(indices, expected[:,0])
+    np.testing.assert_allclose(t, expected[:,1])
+
 def test_TimedNetworkPoints():
     times = [datetime.datetime(2017,8,7,12,30), datetime.datetime(2017,8,7,13,45)]
     locations = [((1,2), 0.4), ((3,4), 0.1)]
@@ -483,14 +652,67 @@ def test_TimedNetworkPoints():
     assert tnpp.end_keys == [4]
     np.testing.assert_allclose(tnpp.distances, [0.1])
 
-    graph = mock.Mock()
-    graph.edge_to_coords.return_value = (1.3, 2.4)
+    b = network.PlanarGraphBuilder()
+    for key, x, y in [(1,0,0), (2,10,0), (3,5,5), (4,5,15)]:
+        b.set_vertex(key, x, y)
+    b.add_edge(1,2)
+    b.add_edge(3,4)
+    graph = b.build()
     tp = tnp.to_timed_points(graph)
     np.testing.assert_allclose(expected_times,
         (np.datetime64("2017-01-01") - tp.timestamps) / np.timedelta64(1, "s"))
-    np.testing.assert_allclose(tp.xcoords, [1.3, 1.3])
-    np.testing.assert_allclose(tp.ycoords, [2.4, 2.4])
-    assert graph.edge_to_coords.call_args_list == [mock.call(1, 2, 0.4), mock.call(3, 4, 0.1)]
+    np.testing.assert_allclose(tp.xcoords, [4, 5])
+    np.testing.assert_allclose(tp.ycoords, [0, 6])
+
+def test_TimedNetworkPoints_from_arrays():
+    times = np.datetime64("2017-01-01") + np.timedelta64(1, "D") * np.asarray([3, 1, 2, 1])
+    with pytest.raises(ValueError):
+        network.TimedNetworkPoints.from_arrays(times, [1,2,3,4], [5,6,7,8], [0.1,0.2,0.3,0.4])
+    with pytest.raises(ValueError):
+        network.TimedNetworkPoints.from_arrays(times, [1,2,3], [5,6,7,8], [0.1,0.2,0.3,0.4])
+
+    tnp = network.TimedNetworkPoints.from_arrays(times, [1,2,3,4], [5,6,7,8],
+        [0.1,0.2,0.3,0.4], sort=True)
+    assert len(tnp) == 4
+    np.testing.assert_array_equal(tnp.start_keys, [2,4,3,1])
+    np.testing.assert_array_equal(tnp.end_keys, [6,8,7,5])
+    np.testing.assert_allclose(tnp.distances, [0.2,0.4,0.3,0.1])
+    np.testing.assert_array_equal(tnp.timestamps, np.sort(times))
+
+def test_TimedNetworkPoints_slicing():
+    times = np.datetime64("2017-01-01") + np.timedelta64(1, "D") * np.arange(5)
+    tnp = network.TimedNetworkPoints.from_arrays(times, [1,2,3,4,5],
+        [6,7,8,9,10], [0.1,0.2,0.3,0.4,0.5])
+
+    view = tnp[1:3]
+    assert np.shares_memory(view.timestamps, tnp.timestamps)
+    assert np.shares_memory(view.distances, tnp.distances)
+    np.testing.assert_array_equal(view.start_keys, [2,3])
+
+    reverse = tnp[::-1]
+    np.testing.assert_array_equal(reverse.start_keys, [1,2,3,4,5])
+
+    fancy = tnp[[4,0,2]]
+    np.testing.assert_array_equal(fancy.start_keys, [1,3,5])
+    np.testing.assert_allclose(fancy.distances, [0.1,0.3,0.5])
+
+    masked = tnp[np.asarray([True, False, True, True, False])]
+    np.testing.assert_array_equal(masked.end_keys, [6,8,9])
+
+    assert tnp[np.int64(2)] == [times[2], 3, 8, 0.3]
+
+def test_TimedNetworkPoints_time_window():
+    times = np.datetime64("2017-01-01") + np.timedelta64(1, "D") * np.asarray([0,1,1,2,3])
+    tnp = network.TimedNetworkPoints.from_arrays(times, [1,2,3,4,5],
+        [6,7,8,9,10], [0.1,0.2,0.3,0.4,0.5])
+
+    window = tnp.time_window("2017-01-02", "2017-01-04")
+    np.testing.assert_array_equal(window.start_keys, [2,3,4])
+    assert np.shares_memory(window.start_keys, tnp.start_keys)
+
+    np.testing.assert_array_equal(tnp.time_window(None, "2017-01-02").start_keys, [1])
+    np.testing.assert_array_equal(tnp.time_window("2017-01-03").start_keys, [4,5])
+    assert len(tnp.time_window("2017-01-04", "2017-01-02")) == 0
 
 def test_TimedNetworkPoints_from_projection():
     times = [datetime.datetime(2017,8,7,12,30), datetime.datetime(2017,8,7,13,45)]
@@ -498,7 +720,8 @@ def test_TimedNetworkPoints_from_projection():
     ycs = [4.5, 6.7]
     tp = open_cp.data.TimedPoints.from_coords(times, xcs, ycs)
     graph = mock.Mock()
-    graph.project_point_to_graph.return_value = ((1,2), 0.3)
+    graph.edges = [(0,1), (1,2)]
+    graph.project_points_to_graph.return_value = (np.array([1, 1]), np.array([0.3, 0.3]))
 
     tnp = network.TimedNetworkPoints.project_timed_points(tp, graph)
 
@@ -508,7 +731,9 @@ def test_TimedNetworkPoints_from_projection():
     np.testing.assert_allclose(tnp.start_keys, [1, 1])
     np.testing.assert_allclose(tnp.end_keys, [2, 2])
     np.testing.assert_allclose(tnp.distances, [0.3, 0.3])
-    graph.project_point_to_graph.call_args_list == [mock.call(1.2, 4.5), mock.call(2.3, 6.7)]
+    xcs, ycs = graph.project_points_to_graph.call_args[0]
+    np.testing.assert_allclose(xcs, [1.2, 2.3])
+    np.testing.assert_allclose(ycs, [4.5, 6.7])
 
 def test_GraphBuilder():
     b = network.GraphBuilder()
@@ -613,6 +838,118 @@ def test_shortest_edge_paths_with_degrees1(graph2):
         0.5+sq2+sq2/2, 3, 0.5+sq2+sq2/2, 1.5, 1+sq2])
     np.testing.assert_allclose(degrees, [4, 2, 1, 1, 4, 4, 2, 2, 2])
 
+def test_shortest_edge_paths_with_degrees_max_length(graph2):
+    dists, degrees = network.shortest_edge_paths_with_degrees(graph2, 0, max_length=2)
+    sq2 = np.sqrt(2)
+    np.testing.assert_allclose(dists, [0, (1+sq2)/2, 1+sq2, -1, (1+sq2)/2,
+            1+sq2, -1, 1.5 + sq2, -1])
+    np.testing.assert_allclose(degrees, [1, 2, 4, 1, 2, 4, 1, 4, 1])
+
+def test_shortest_edge_paths_with_degrees_batch(graph2):
+    dists, degrees = network.shortest_edge_paths_with_degrees_batch(graph2, [2, 0])
+    assert dists.shape == (2, 9)
+    for row, edge in enumerate([2, 0]):
+        d, deg = network.shortest_edge_paths_with_degrees(graph2, edge)
+        np.testing.assert_allclose(dists[row], d)
+        np.testing.assert_allclose(degrees[row], deg)
+
+def test_shortest_paths_max_length(graph2):
+    dists, prevs = network.shortest_paths(graph2, 0, max_length=2.5)
+    assert dists == {0:0, 1:1, 2:pytest.approx(1+np.sqrt(2)), 3:-1, 4:-1,
+        5:pytest.approx(1+np.sqrt(2)), 6:-1, 7:-1}
+    assert prevs == {0:0, 1:0, 2:1, 5:1}
+
+    dists, prevs = network.shortest_edge_paths(graph2, 0, max_length=1)
+    assert dists == {0:0.5, 1:0.5}
+    assert prevs == {0:0, 1:1}
+
+def test_shortest_paths_ties():
+    # Vertex 2 is at distance 2 from 0 via both 1 and 3; the lower index wins
+    graph = network.Graph([0,1,2,3,4,5,6], [(0,1), (1,2), (0,3), (3,2), (3,5),
+        (2,6), (4,0)])
+    dists, prevs = network.shortest_paths(graph, 0)
+    assert dists == {0:0, 1:1, 2:2, 3:1, 4:1, 5:2, 6:3}
+    assert prevs == {0:0, 1:0, 2:1, 3:0, 4:0, 5:3, 6:2}
+
+    dists, prevs = network.shortest_edge_paths(graph, 6)
+    assert prevs[2] == 1
+
+    dists, degrees = network.shortest_edge_paths_with_degrees(graph, 6)
+    np.testing.assert_allclose(dists, [1, 2, 1, 2, 2, 3, 0])
+    np.testing.assert_allclose(degrees, [2, 2, 2, 4, 4, 4, 1])
+
+def test_shortest_paths_batch(graph2):
+    keys, dists, prevs = network.shortest_paths_batch(graph2, [0, 2], max_length=2.5)
+    assert keys == list(range(8))
+    np.testing.assert_allclose(dists[0], [0, 1, 1+np.sqrt(2), -1, -1, 1+np.sqrt(2), -1, -1])
+    np.testing.assert_allclose(prevs[0], [0, 0, 1, -1, -1, 1, -1, -1])
+    np.testing.assert_allclose(dists[1], [1+np.sqrt(2), np.sqrt(2), 0, 1, 1+np.sqrt(2), 2, -1, -1])
+    np.testing.assert_allclose(prevs[1], [1, 2, 2, 2, 3, 2, -1, -1])
+
+def test_CSRAdjacency(graph2):
+    adj = network.CSRAdjacency(graph2)
+    assert adj.number_vertices == 8
+    np.testing.assert_allclose(adj.degrees(), [1, 3, 3, 2, 3, 3, 2, 1])
+    assert list(adj.neighbours[adj.indptr[1]:adj.indptr[2]]) == [0, 2, 5]
+    assert list(adj.edge_indices[adj.indptr[1]:adj.indptr[2]]) == [0, 1, 4]
+    np.testing.assert_allclose(adj.weights[adj.indptr[1]:adj.indptr[2]],
+        [1, np.sqrt(2), np.sqrt(2)])
+
+def test_Graph_csr_cached(graph2):
+    adj = graph2.csr
+    assert adj is graph2.csr
+    with pytest.raises(ValueError):
+        adj.weights[0] = 5
+    np.testing.assert_allclose(adj.degrees([1, 7]), [3, 1])
+    assert list(adj.incident_edges_of(1)) == [0, 1, 4]
+    assert list(adj.other_ends([0, 1, 4], [1, 1, 1])) == [0, 2, 5]
+    assert adj.find_edge(1, 0) == graph2.find_edge(1, 0)
+    with pytest.raises(KeyError):
+        graph2.find_edge(0, 7)
+
+def test_CSRAdjacency_planar_round_trip(graph2):
+    adj = graph2.csr
+    g = adj.to_planar_graph()
+    assert g.edges == graph2.edges
+    for k in graph2.vertices:
+        np.testing.assert_allclose(g.vertices[k], graph2.vertices[k])
+    np.testing.assert_allclose(g.lengths, graph2.lengths)
+    assert adj.to_graph().edges == graph2.edges
+
+    xcoords, ycoords = adj.coords
+    new = network.CSRAdjacency.from_arrays(xcoords, ycoords, graph2.edges)
+    for name in ["indptr", "neighbours", "edge_indices", "incident_edges"]:
+        np.testing.assert_array_equal(getattr(new, name), getattr(adj, name))
+    np.testing.assert_allclose(new.weights, adj.weights)
+    with pytest.raises(KeyError):
+        new.index_of(8)
+
+def test_CSRAdjacency_find_edges():
+    g = network.Graph([0,1,2,5,7], [(0,1), (2,1), (5,7), (7,0)])
+    csr = g.csr
+    labels1 = csr.indices_of([0, 1, 7, 2, 9, 5], missing=-1)
+    labels2 = csr.indices_of([1, 2, 0, 5, 0, 2], missing=-1)
+    np.testing.assert_array_equal(labels1, [0, 1, 4, 2, -1, 3])
+    indices, orders = csr.find_edges(labels1, labels2)
+    np.testing.assert_array_equal(indices, [0, 1, 3, -1, -1, -1])
+    np.testing.assert_array_equal(orders, [1, -1, 1, 0, 0, 0])
+    with pytest.raises(KeyError):
+        csr.indices_of([0, 9])
+
+    csr = network.Graph(range(4), [(0,1), (3,2)]).csr
+    np.testing.assert_array_equal(csr.indices_of([3, 4, -1, 0], missing=-1), [3, -1, -1, 0])
+    indices, orders = csr.find_edges([0, 2, 1], [1, 3, 2])
+    np.testing.assert_array_equal(indices, [0, 1, -1])
+    np.testing.assert_array_equal(orders, [1, -1, 0])
+
+def test_Graph_isolated_vertex_lookups():
+    g = network.Graph([0, 1, 2], [(0, 1)])
+    assert g.neighbours(2) == []
+    assert g.degree(2) == 0
+    assert g.neighbourhood_edges(0) == [0]
+    with pytest.raises(ValueError):
+        g.csr.to_planar_graph()
+
 def test_segment_graph1(graph1):
     got = set(frozenset(k) for k in network.segment_graph(graph1))
     assert got == {frozenset({0}), frozenset({1,2})}
@@ -222,6 +222,102 @@ def test_Trainer_optimise2(trainer):
     call = trainer._opt_class_mock.call_args_list[1]
     assert call[0][0] is model
 
+def test_Trainer_warm_start(trainer):
+    warm = mock.Mock()
+    model = trainer.train(model=warm)
+
+    assert model == trainer._opt_class_mock.return_value.iterate.return_value
+    call = trainer._opt_class_mock.call_args_list[0]
+    assert call[0][0] is warm
+
+
+class ConvergingModel():
+    def __init__(self, value):
+        self.value = value
+
+
+class ConvergingOptimiser():
+    def __init__(self, model, points):
+        self.model = model
+        self.p = np.zeros((points.shape[1], points.shape[1])) + model.value
+
+    def iterate(self):
+        return ConvergingModel(self.model.value / 2)
+
+
+class ConvergingTrainer(OurTrainer):
+    def initial_model(self, fixed, data):
+        return ConvergingModel(1)
+
+    @property
+    def _optimiser(self):
+        return ConvergingOptimiser
+
+
+@pytest.fixture
+def ctrainer(trainer):
+    sepp = ConvergingTrainer()
+    sepp.data = trainer.data
+    return sepp
+
+def test_Trainer_tolerance(ctrainer):
+    model = ctrainer.train(iterations=100, tolerance=0.01)
+    # p changes by 1/2, 1/4, ..., 1/128 < 0.01
+    assert model.value == pytest.approx(1 / 2**7)
+
+    model = ctrainer.train(iterations=3, tolerance=0.01)
+    assert model.value == pytest.approx(1 / 2**3)
+
+    model = ctrainer.train(iterations=100, tolerance=0.01, model=ConvergingModel(0.05))
+    assert model.value == pytest.approx(0.05 / 2**3)
+
+def test_Trainer_checkpoint(ctrainer, tmpdir):
+    filename = str(tmpdir.join("check.pic"))
+    checkpoint = sepp_base.Checkpoint(filename, every=2)
+    model = ctrainer.train(iterations=5, checkpoint=checkpoint)
+    assert model.value == pytest.approx(1 / 2**5)
+
+    # Resumes from the final iteration
+    model = ctrainer.train(iterations=5, checkpoint=checkpoint)
+    assert model.value == pytest.approx(1 / 2**5)
+    model = ctrainer.train(iterations=7, checkpoint=checkpoint)
+    assert model.value == pytest.approx(1 / 2**7)
+
+    checkpoint.remove()
+    model = ctrainer.train(iterations=3, checkpoint=checkpoint)
+    key = checkpoint.key(ctrainer.make_data()[1], sepp_base._class_name(ctrainer),
+        ConvergingModel(1))
+    assert checkpoint.load(key)[0] == 3
+    # Different data, so ignored
+    assert checkpoint.load(checkpoint.key(np.zeros((3,2)))) is None
+
+def test_Trainer_checkpoint_other_settings(ctrainer, tmpdir):
+    filename = str(tmpdir.join("check.pic"))
+    checkpoint = sepp_base.Checkpoint(filename)
+    ctrainer.train(iterations=3, checkpoint=checkpoint)
+
+    # A different warm start is not resumed from the old checkpoint
+    model = ctrainer.train(iterations=3, checkpoint=checkpoint, model=ConvergingModel(0.5))
+    assert model.value == pytest.approx(0.5 / 2**3)
+    # Nor is a different tag
+    checkpoint = sepp_base.Checkpoint(filename, tag="other")
+    model = ctrainer.train(iterations=4, checkpoint=checkpoint, model=ConvergingModel(0.5))
+    assert model.value == pytest.approx(0.5 / 2**4)
+
+def test_Trainer_checkpoint_converged(ctrainer, tmpdir):
+    filename = str(tmpdir.join("check.pic"))
+    checkpoint = sepp_base.Checkpoint(filename, every=100)
+    model = ctrainer.train(iterations=100, tolerance=0.01, checkpoint=checkpoint)
+    assert model.value == pytest.approx(1 / 2**7)
+    key = checkpoint.key(ctrainer.make_data()[1], sepp_base._class_name(ctrainer),
+        ConvergingModel(1))
+    assert checkpoint.load(key)[0] == 7
+
+    # Resuming does not repeat any iterations
+    with mock.patch.object(ConvergingOptimiser, "iterate", side_effect=AssertionError):
+        model = ctrainer.train(iterations=100, tolerance=0.01, checkpoint=checkpoint)
+    assert model.value == pytest.approx(1 / 2**7)
+
 
 def test_PredictorBase():
     class Model():
@@ -5,6 +5,7 @@ import io, pickle, datetime
 
 import open_cp.sepp as testmod
 import open_cp.data
+import open_cp.sepp_base
 
 def uniform_data(length=10):
     times = np.arange(length) * 0.1
@@ -174,6 +175,45 @@ def test_pickle_result(tp1):
     result.data = tp1
     result.predict(np.datetime64("2017-05-11"))
     
+@pytest.fixture
+def clustered_points():
+    import open_cp.sources.sepp as sources
+    background = sources.InhomogeneousPoissonFactors(sources.HomogeneousPoisson(2),
+        sources.UniformRegionSampler(open_cp.data.RectangularRegion(0,1000,0,1000)))
+    offspring = sources.ExponentialDecayGaussianOffspring(0.5, 1, [100, 100])
+    sampler = sources.BranchingProcessSampler(background, offspring, seed=1)
+    points = sampler.sample(0, 100)
+    return sources.scale_to_real_time(points, np.datetime64("2017-01-01"),
+        sources.make_time_unit(np.timedelta64(1, "D")))
+
+def test_warm_start_and_checkpoint(clustered_points, tmpdir):
+    trainer = testmod.SEPPTrainer(k_time=20, k_space=10)
+    trainer.data = clustered_points
+    result = trainer.train(iterations=2)
+
+    decluster = trainer.make_stocastic_decluster()
+    p = decluster.p_matrix_from_kernels(result.adjusted_background_kernel, result.trigger_kernel)
+    assert p.shape == (clustered_points.number_data_points,) * 2
+    np.testing.assert_allclose(np.sum(p, axis=0), 1)
+
+    checkpoint = open_cp.sepp_base.Checkpoint(str(tmpdir.join("check.pic")))
+    warm = trainer.train(iterations=2, warm_start=result, checkpoint=checkpoint)
+    assert len(warm.result.ell2_error) == 2
+    warm = trainer.train(iterations=3, warm_start=result, checkpoint=checkpoint)
+    assert len(warm.result.ell2_error) == 3
+
+    warm = trainer.train(iterations=10, warm_start=result, tolerance=1e10)
+    assert len(warm.result.ell2_error) == 1
+
+    # Saved on convergence, and not resumed from without the same warm start
+    checkpoint = open_cp.sepp_base.Checkpoint(str(tmpdir.join("check2.pic")), every=100)
+    warm = trainer.train(iterations=10, warm_start=result, tolerance=1e10, checkpoint=checkpoint)
+    with mock.patch.object(testmod.StocasticDecluster, "next_iteration", side_effect=AssertionError):
+        warm = trainer.train(iterations=10, warm_start=result, tolerance=1e10, checkpoint=checkpoint)
+    assert len(warm.result.ell2_error) == 1
+    cold = trainer.train(iterations=2, tolerance=1e10, checkpoint=checkpoint)
+    assert cold.result.ell2_error[0] != warm.result.ell2_error[0]
+
 def test_initial_bandwidths(tp1):
     trainer = testmod.SEPPTrainer()
     assert trainer.initial_time_bandwidth ==  24 * 6
@@ -1,7 +1,9 @@
+import pytest
 from pytest import approx
 import open_cp.sources.random as testmod
 
 import open_cp
+import open_cp.predictors
 from datetime import datetime
 import numpy as np
 import unittest.mock as mock
@@ -124,3 +126,75 @@ def test_random_spatial(poisson_mock):
 
     np.testing.assert_allclose(points.coords[0], [1,2,3])
     np.testing.assert_allclose(points.coords[1], [4,5,6])
+
+
+def test_AliasTable_exact():
+    for weights in [[1,2,3,4], [0,0,5,0], [10,1,1,1,1,1], [1,1,1,1], np.random.random(50),
+            np.random.random(100)**10]:
+        weights = np.asarray(weights, dtype=float)
+        table = testmod.AliasTable(weights)
+        n = len(weights)
+        mass = table.probabilities / n
+        np.add.at(mass, table.aliases, (1 - table.probabilities) / n)
+        np.testing.assert_allclose(mass, weights / np.sum(weights), atol=1e-12)
+
+def test_AliasTable_integer_weights():
+    # Integer weights give ties between cumulative sums
+    rng = np.random.RandomState(7)
+    weights = [[0,1,3,3,0,2,0,0,2,2,1,0]]
+    weights += [rng.randint(0, 4, size=rng.randint(1, 20)) for _ in range(2000)]
+    for w in weights:
+        w = np.asarray(w, dtype=float)
+        if np.sum(w) == 0:
+            continue
+        table = testmod.AliasTable(w)
+        n = len(w)
+        mass = table.probabilities / n
+        np.add.at(mass, table.aliases, (1 - table.probabilities) / n)
+        np.testing.assert_allclose(mass, w / np.sum(w), atol=1e-12)
+
+def test_AliasTable_sample():
+    table = testmod.AliasTable([1, 0, 3])
+    samples = table.sample(10000, np.random.RandomState(3))
+    assert np.sum(samples == 1) == 0
+    assert np.sum(samples == 2) / 10000 == approx(0.75, abs=0.02)
+
+def test_AliasTable_bad_weights():
+    with pytest.raises(ValueError):
+        testmod.AliasTable([0, 0])
+    with pytest.raises(ValueError):
+        testmod.AliasTable([1, -1])
+
+def test_GridSampler():
+    matrix = np.ma.array([[1, 0, 0], [0, 2, 5]], mask=[[False]*3, [False, False, True]])
+    pred = open_cp.predictors.GridPredictionArray(10, 20, matrix, 5, 15)
+    sampler = testmod.GridSampler.from_prediction(pred, seed=5)
+    pts = sampler(3000)
+    assert pts.shape == (2, 3000)
+    in_first = (pts[0] >= 5) & (pts[0] < 15) & (pts[1] >= 15) & (pts[1] < 35)
+    in_second = (pts[0] >= 15) & (pts[0] < 25) & (pts[1] >= 35) & (pts[1] < 55)
+    assert np.all(in_first | in_second)
+    assert np.sum(in_first) / 3000 == approx(1/3, abs=0.03)
+
+    np.testing.assert_allclose(pts, testmod.GridSampler.from_prediction(pred, seed=5)(3000))
+
+def test_GridSampler_from_kernel():
+    region = open_cp.RectangularRegion(xmin=0, xmax=10, ymin=0, ymax=5)
+    kernel = lambda pts : (pts[0] > 5).astype(float)
+    sampler = testmod.GridSampler.from_kernel(kernel, region, 1, seed=2)
+    pts = sampler(1000)
+    assert np.all((pts[0] >= 5) & (pts[0] < 10) & (pts[1] >= 0) & (pts[1] < 5))
+
+def test_EnvelopeRejectionSampler():
+    region = open_cp.RectangularRegion(xmin=-5, xmax=5, ymin=-5, ymax=5)
+    kernel = lambda pts : np.exp(-(pts[0]**2 + pts[1]**2) / (2 * 0.1**2))
+    sampler = testmod.EnvelopeRejectionSampler(region, kernel, seed=1)
+    pts = sampler(5000)
+    assert pts.shape == (2, 5000)
+    assert np.std(pts[0]) == approx(0.1, rel=0.1)
+    assert np.std(pts[1]) == approx(0.1, rel=0.1)
+    assert np.mean(pts[0]) == approx(0, abs=0.01)
+    # A single global bound would accept fewer than 0.1% of candidates
+    assert sampler.acceptance_rate > 0.05
+
+    np.testing.assert_allclose(pts, testmod.EnvelopeRejectionSampler(region, kernel, seed=1)(5000))
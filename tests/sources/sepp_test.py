@@ -124,4 +124,60 @@ def test_SelfExcitingPointProcess():
     pts = sampler.sample(0, 10)
     np.testing.assert_allclose(pts[0], [10/3, 16/3, 20/3, 22/3, 26/3, 28/3])
     np.testing.assert_allclose(pts[1], [0, 1, 1, 2, 2, 3])
-    np.testing.assert_allclose(pts[2], [1, 1, 2, 1, 2, 1])
\ No newline at end of file
+    np.testing.assert_allclose(pts[2], [1, 1, 2, 1, 2, 1])
+
+def test_BranchingProcessSampler_no_offspring():
+    sampler = testmod.BranchingProcessSampler(TestSamplerMiddle2(),
+        testmod.ExponentialDecayOffspring(0, 1), seed=5)
+    sample = sampler.sample_with_details(0, 10)
+    np.testing.assert_allclose(sample.points, [[10/3, 20/3], [0,1], [1,2]])
+    assert sample.trigger_deltas.shape == (3,0)
+    assert sample.trigger_points.shape == (3,0)
+
+def test_BranchingProcessSampler_reproducible():
+    background = testmod.HomogeneousPoissonSampler(rate=10)
+    offspring = testmod.ExponentialDecayOffspring(0.5, 0.1)
+    pts1 = testmod.BranchingProcessSampler(background, offspring, seed=7).sample(0, 100)
+    pts2 = testmod.BranchingProcessSampler(background, offspring, seed=7).sample(0, 100)
+    np.testing.assert_allclose(pts1, pts2)
+    assert np.all(pts1[1:] >= pts1[:-1])
+    assert np.all((pts1 >= 0) & (pts1 < 100))
+    # Stationary rate is 10 / (1 - 0.5) but misses some offspring near the end
+    assert 1500 < len(pts1) < 2100
+
+def test_BranchingProcessSampler_space():
+    background = testmod.InhomogeneousPoissonFactors(testmod.HomogeneousPoisson(5),
+        testmod.UniformRegionSampler(open_cp.data.RectangularRegion(0,10,0,10)))
+    offspring = testmod.ExponentialDecayGaussianOffspring(0.5, 1, [1, 4])
+    sample = testmod.BranchingProcessSampler(background, offspring, seed=1).sample_with_details(0, 100)
+    assert sample.points.shape[0] == 3
+    assert np.all(sample.points[0][1:] >= sample.points[0][:-1])
+    n = sample.trigger_deltas.shape[1]
+    assert sample.points.shape[1] == sample.backgrounds.shape[1] + n
+    assert np.all(sample.trigger_deltas[0] >= 0)
+    assert np.var(sample.trigger_deltas[2]) == pytest.approx(4, rel=0.3)
+
+def test_BranchingGridHawkesProcess():
+    mus = np.array([[0.1, 0.2, 0], [0.5, 0.05, 1]])
+    sampler = testmod.BranchingGridHawkesProcess(mus, 0.5, 1, seed=10, chunk_size=2)
+    cells = sampler.sample(0, 1000)
+    assert cells.shape == (2,3)
+    assert len(cells[0,2]) == 0
+    for t in cells.ravel():
+        assert np.all(t[1:] >= t[:-1])
+    # Expect 3700 events with standard deviation about 120
+    assert sum(len(t) for t in cells.ravel()) == pytest.approx(3700, abs=500)
+
+    sampler = testmod.BranchingGridHawkesProcess(mus, 0.5, 1, seed=10, chunk_size=2,
+        processes=2)
+    for t1, t2 in zip(cells.ravel(), sampler.sample(0, 1000).ravel()):
+        np.testing.assert_allclose(t1, t2)
+
+def test_BranchingGridHawkesProcess_randomised_grid():
+    mus = np.array([[0.1, 0.2, 0], [0.5, 0.05, 1]])
+    sampler = testmod.BranchingGridHawkesProcess(mus, 0.5, 1, seed=10)
+    pts = sampler.sample_to_randomised_grid(0, 100, 20)
+    assert pts.shape[0] == 3
+    assert np.all(pts[0][1:] >= pts[0][:-1])
+    assert np.all((pts[1] >= 0) & (pts[1] < 60) & (pts[2] >= 0) & (pts[2] < 40))
+    assert not np.any((pts[1] >= 40) & (pts[2] < 20))